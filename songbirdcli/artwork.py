@@ -0,0 +1,257 @@
+"""
+artwork.py module for caching the album artwork songs are tagged with, so that the
+tracks of an album share a single download of their cover
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+from songbirdcore.models import itunes_api
+
+from songbirdcli import settings
+
+logger = logging.getLogger(__name__)
+
+# the sizes itunes resizes artwork to, from smallest to largest
+ARTWORK_SIZES = [
+    "100x100",
+    "500x500",
+    "1000x1000",
+    "1500x1500",
+    "2000x2000",
+    "2500x2500",
+    "3000x3000",
+]
+
+
+def get_mime_type(image: bytes) -> str:
+    """Get the mime type of an image from its leading bytes, defaulting to jpeg as
+    itunes artwork is served as jpeg"""
+    if image.startswith(b"\x89PNG"):
+        return "image/png"
+    return "image/jpeg"
+
+
+class ArtworkCache:
+    """A content addressed cache of album artwork, stored on disk. Each image is saved
+    once, under the hash of its bytes, and indexed in sqlite by the itunes collection
+    (or artwork url) and size it was fetched for, so every resized variant of a cover
+    is kept. The least recently used images are evicted once max_bytes is exceeded.
+    """
+
+    def __init__(
+        self,
+        folder: str,
+        max_bytes: int,
+        sizes: Optional[List[str]] = None,
+        timeout: float = 10,
+    ):
+        """
+        Args:
+            folder (str): the folder to store images in, created if missing
+            max_bytes (int): the maximum total size of the images kept in the cache
+            sizes (Optional[List[str]], optional): the sizes to try, from smallest to largest. Defaults to ARTWORK_SIZES.
+            timeout (float, optional): seconds before abandoning an artwork request. Defaults to 10.
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.sizes = sizes if sizes is not None else ARTWORK_SIZES
+        self.timeout = timeout
+        os.makedirs(folder, exist_ok=True)
+        self.lock = threading.Lock()
+        # one lock per variant, so the tracks of an album wait for the first
+        # to fetch their cover rather than each fetching it
+        self.key_locks: Dict[str, threading.Lock] = {}
+        self.session = requests.Session()
+        self.conn = sqlite3.connect(
+            os.path.join(folder, "artwork.sqlite"), check_same_thread=False
+        )
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS variants (
+                key TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL
+            )""")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS variants_accessed ON variants (accessed)"
+        )
+        self.conn.commit()
+
+    @classmethod
+    def from_config(cls, config: settings.SongbirdCliConfig) -> "ArtworkCache":
+        """Create a cache inside of the data path of the songbirdcli config
+
+        Args:
+            config (settings.SongbirdCliConfig): the songbirdcli config
+
+        Returns:
+            ArtworkCache: the cache
+        """
+        return cls(
+            os.path.join(config.get_data_path(), "artwork"),
+            max_bytes=config.artwork_cache_max_bytes,
+        )
+
+    @staticmethod
+    def make_key(url: str, collection_id: Optional[int], size: str) -> str:
+        """Build the key of a variant, preferring the collection id as the
+        artwork url of a collection may differ between its tracks
+
+        Returns:
+            str: the key
+        """
+        source = f"collection:{collection_id}" if collection_id else f"url:{url}"
+        return f"{source}@{size}"
+
+    def get_path(self, digest: str) -> str:
+        return os.path.join(self.folder, digest)
+
+    def read(self, key: str) -> Optional[bytes]:
+        """Read a cached variant, marking it as recently used
+
+        Args:
+            key (str): the key of the variant
+
+        Returns:
+            Optional[bytes]: the image, None if it is not cached
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT digest FROM variants WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            try:
+                with open(self.get_path(row[0]), "rb") as f:
+                    image = f.read()
+            except OSError:
+                # the image was removed from disk behind our back
+                self.conn.execute("DELETE FROM variants WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            self.conn.execute(
+                "UPDATE variants SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+            self.conn.commit()
+        return image
+
+    def write(self, key: str, image: bytes):
+        """Store a variant, evicting the least recently used images if the cache is full.
+        Images larger than the whole cache are not stored.
+
+        Args:
+            key (str): the key of the variant
+            image (bytes): the image
+        """
+        if len(image) > self.max_bytes:
+            # it would be evicted as soon as it was stored
+            logger.debug(
+                f"Not caching artwork {key}, as its {len(image)} bytes exceed the cache."
+            )
+            return
+        digest = hashlib.sha256(image).hexdigest()
+        with self.lock:
+            path = self.get_path(digest)
+            if not os.path.exists(path):
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(image)
+                os.replace(tmp_path, path)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO variants (key, digest, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, digest, len(image), time.time()),
+            )
+            self.evict()
+            self.conn.commit()
+
+    def evict(self):
+        """Remove the least recently used images until the cache fits in max_bytes.
+        Expects self.lock to be held."""
+        # images shared by several variants count once, at their latest use
+        rows = self.conn.execute(
+            "SELECT digest, MAX(size), MAX(accessed) AS used FROM variants GROUP BY digest ORDER BY used DESC"
+        ).fetchall()
+        total = 0
+        for digest, size, _ in rows:
+            total += size
+            if total <= self.max_bytes:
+                continue
+            logger.debug(f"Evicting cached artwork {digest}")
+            self.conn.execute("DELETE FROM variants WHERE digest = ?", (digest,))
+            try:
+                os.remove(self.get_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def fetch(self, url: str, size: str) -> Optional[bytes]:
+        """Fetch artwork from itunes at the given size, falling back to smaller
+        sizes if it is unavailable. Mirrors `songbirdcore.itunes.artwork_searcher`.
+
+        Args:
+            url (str): the artwork url, as given in artworkUrl100
+            size (str): the preferred size
+
+        Returns:
+            Optional[bytes]: the image, None if no size could be fetched
+        """
+        idx = self.sizes.index(size) if size in self.sizes else len(self.sizes) - 1
+        for candidate in reversed(self.sizes[: idx + 1]):
+            try:
+                response = self.session.get(
+                    url.replace("100x100", candidate), timeout=self.timeout
+                )
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Failed to fetch album art: {e}")
+                return None
+            if response.status_code == 200 and len(response.content) > 0:
+                logger.info(f"Found art at size: {candidate}")
+                return response.content
+            logger.info(f"- Size not found -- Trying size: {candidate}")
+        logger.info("Couldnt find album art. Your file wont have the art.")
+        return None
+
+    def get(
+        self, url: str, collection_id: Optional[int] = None, size: Optional[str] = None
+    ) -> Optional[bytes]:
+        """Get the artwork of a collection, fetching it only if it is not cached
+
+        Args:
+            url (str): the artwork url, as given in artworkUrl100
+            collection_id (Optional[int], optional): the itunes collection id. Defaults to None, keying by url.
+            size (Optional[str], optional): the size of the variant. Defaults to the largest size.
+
+        Returns:
+            Optional[bytes]: the image, None if it could not be fetched
+        """
+        if not url:
+            return None
+        size = size or self.sizes[-1]
+        key = self.make_key(url, collection_id, size)
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            image = self.read(key)
+            if image is not None:
+                logger.debug(f"Using cached album art for {key}")
+                return image
+            image = self.fetch(url, size)
+            if image is not None:
+                self.write(key, image)
+            return image
+
+    def get_for_song(
+        self, song: itunes_api.ItunesApiSongModel, size: Optional[str] = None
+    ) -> Optional[bytes]:
+        """Get the artwork of a song's collection, see `get`"""
+        return self.get(song.artworkUrl100, song.collectionId, size)
+
+    def close(self):
+        self.session.close()
+        with self.lock:
+            self.conn.close()
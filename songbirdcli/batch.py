@@ -0,0 +1,653 @@
+"""
+batch.py module for running songbird without prompts, driven by a manifest
+of songs and albums
+"""
+
+import csv
+import datetime
+import json
+import logging
+import os
+import uuid
+from enum import Enum
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from pydantic import BaseModel, ValidationError, field_validator
+
+from songbirdcli import artwork
+from songbirdcli import cli
+from songbirdcli import helpers
+from songbirdcli import itunes_search
+from songbirdcli import journal
+from songbirdcli import lazy
+from songbirdcli import library
+from songbirdcli import matching
+from songbirdcli import pipeline
+from songbirdcli import search
+from songbirdcli import settings
+from songbirdcli import throttle
+from songbirdcli import timing
+from songbirdcli import transcode
+from songbirdcli import uploads
+from songbirdcore import common
+from songbirdcore.models import itunes_api, modes
+
+logger = logging.getLogger(__name__)
+
+youtube = lazy.load("songbirdcore.youtube")
+
+
+class PickPolicy(Enum):
+    """enum class containing the policies for picking from search results"""
+
+    FIRST = "first"
+    """Specifies picking the first result"""
+    NONE = "none"
+    """Specifies picking no result"""
+    BEST = "best"
+    """Specifies picking the youtube video best matching the itunes properties, if it scores above the match threshold"""
+
+
+class ManifestEntry(BaseModel):
+    """A song or album to process, as read from a row of a manifest"""
+
+    mode: modes.Modes = modes.Modes.SONG
+    """specifies whether the entry is a song or an album"""
+    query: str = ""
+    """specifies the search term for the itunes api, and the song name when saving"""
+    itunes_id: Optional[int] = None
+    """specifies the itunes track id of a song, or the collection id of an album. Skips the itunes search."""
+    itunes_pick: PickPolicy = PickPolicy.FIRST
+    """specifies how to pick the itunes properties from the search. none downloads the song without tags."""
+    youtube_url: Optional[str] = None
+    """specifies the youtube url to download a song from. Skips the youtube search."""
+    youtube_pick: PickPolicy = PickPolicy.FIRST
+    """specifies how to pick the video from the youtube search"""
+    destination: str = "l"
+    """specifies where to save to. One or more of gdrive (g), itunes (i) or locally (l), e.g. ig"""
+    allow_duplicates: bool = False
+    """specifies whether to download songs that have similar files locally"""
+
+    @field_validator("itunes_id", "youtube_url", mode="before")
+    def empty_to_none(cls, value):
+        # csv manifests have empty cells rather than missing values
+        if value == "":
+            return None
+        return value
+
+    @field_validator("itunes_pick")
+    def validate_itunes_pick(cls, value: PickPolicy):
+        if value == PickPolicy.BEST:
+            raise ValueError("itunes_pick must be one of first or none")
+        return value
+
+    @field_validator("destination", mode="before")
+    def validate_destination(cls, value: str):
+        destinations = {"gdrive": "g", "itunes": "i", "local": "l"}
+        value = destinations.get(value, value)
+        # several destinations are given together, e.g. ig, and share a single download
+        if (
+            value == ""
+            or any(d not in ["g", "i", "l"] for d in value)
+            or len(set(value)) != len(value)
+        ):
+            raise ValueError(
+                f"destination must be one or more of g, i or l, e.g. ig, not {value}"
+            )
+        return value
+
+
+class BatchResult(BaseModel):
+    """The outcome of processing a song from a manifest"""
+
+    entry: int
+    """specifies the index of the manifest entry the song came from"""
+    song_name: str
+    """specifies the name of the song"""
+    status: str
+    """specifies the outcome. One of success, failed or skipped"""
+    message: str = ""
+    """specifies details about the outcome"""
+
+
+def load_manifest(manifest_path: str) -> List[ManifestEntry]:
+    """Load a manifest of songs and albums from a .csv file with a header row,
+    or from a .jsonl file with a json object per line.
+
+    Args:
+        manifest_path (str): the path to the manifest
+
+    Raises:
+        ValueError: if the manifest format is unsupported, or an entry is invalid
+
+    Returns:
+        List[ManifestEntry]: the entries of the manifest
+    """
+    ext = os.path.splitext(manifest_path)[1].lower()
+    with open(manifest_path, "r", encoding="utf-8", newline="") as f:
+        if ext == ".csv":
+            rows = list(csv.DictReader(f))
+        elif ext in [".jsonl", ".json"]:
+            rows = [json.loads(line) for line in f if line.strip() != ""]
+        else:
+            raise ValueError(
+                f"Unsupported manifest format '{ext}'. Use a .csv or .jsonl file."
+            )
+
+    entries = []
+    for idx, row in enumerate(rows):
+        try:
+            entries.append(ManifestEntry.model_validate(row))
+        except ValidationError as e:
+            raise ValueError(f"Invalid manifest entry [{idx}]: {row}\n{e}")
+    return entries
+
+
+def get_itunes_query(entry: ManifestEntry) -> Optional[itunes_search.ItunesQuery]:
+    """Get the first itunes query made to resolve the properties of an entry
+
+    Args:
+        entry (ManifestEntry): the manifest entry
+
+    Returns:
+        Optional[itunes_search.ItunesQuery]: the query, None if the entry is downloaded without tags
+    """
+    if entry.mode == modes.Modes.SONG:
+        if entry.itunes_id is not None:
+            return itunes_search.ItunesQuery(
+                search_variable=entry.itunes_id,
+                limit=1,
+                mode=modes.Modes.SONG,
+                lookup=True,
+            )
+        if entry.itunes_pick == PickPolicy.NONE:
+            return None
+        return itunes_search.ItunesQuery(
+            search_variable=entry.query, limit=1, mode=modes.Modes.SONG
+        )
+    if entry.itunes_id is not None:
+        return itunes_search.ItunesQuery(
+            search_variable=entry.itunes_id,
+            limit=200,
+            mode=modes.Modes.SONG,
+            lookup=True,
+        )
+    return itunes_search.ItunesQuery(
+        search_variable=entry.query, limit=1, mode=modes.Modes.ALBUM
+    )
+
+
+def prefetch_song_properties(
+    entries: List[ManifestEntry], itunes_client: itunes_search.ItunesClient
+):
+    """Query itunes for the properties of every entry concurrently, so that resolving the
+    entries one by one is served from the client rather than waiting on each request in turn.
+    The track lists of albums searched for by name are queried once their albums are known.
+
+    Args:
+        entries (List[ManifestEntry]): the manifest entries
+        itunes_client (itunes_search.ItunesClient): the client used to query the itunes api
+    """
+    queries = [query for query in map(get_itunes_query, entries) if query is not None]
+    if len(queries) == 0:
+        return
+    logger.info(f"Querying itunes for {len(queries)} entries.")
+    with timing.span("itunes_prefetch"):
+        results = itunes_client.query_many(queries)
+    lookups = [
+        itunes_search.ItunesQuery(
+            search_variable=albums[0].collectionId,
+            limit=albums[0].trackCount,
+            mode=modes.Modes.SONG,
+            lookup=True,
+        )
+        for query, albums in zip(queries, results)
+        if query.mode == modes.Modes.ALBUM and albums
+    ]
+    if len(lookups) > 0:
+        with timing.span("itunes_prefetch"):
+            itunes_client.query_many(lookups)
+
+
+def resolve_song_properties(
+    entry: ManifestEntry, itunes_client: Optional[itunes_search.ItunesClient] = None
+) -> Optional[List[Union[itunes_api.ItunesApiSongModel, bool]]]:
+    """Resolve the itunes properties of the songs in an entry, without prompting.
+
+    Args:
+        entry (ManifestEntry): the manifest entry
+        itunes_client (Optional[itunes_search.ItunesClient], optional): the client used to query the itunes api. Defaults to None.
+
+    Returns:
+        Optional[List[Union[itunes_api.ItunesApiSongModel, bool]]]: the properties of each song. False for a song downloaded without tags.
+            None if the entry could not be resolved.
+    """
+    query = get_itunes_query(entry)
+    if query is None:
+        return [False]
+    results = helpers.query_api(
+        query.search_variable,
+        query.limit,
+        query.mode,
+        lookup=query.lookup,
+        itunes_client=itunes_client,
+    )
+    if not results:
+        return None
+    if entry.mode == modes.Modes.SONG:
+        return [results[0]]
+    if query.mode == modes.Modes.SONG:
+        # the album was looked up by its collection id
+        return results
+
+    songs = helpers.query_api(
+        results[0].collectionId,
+        results[0].trackCount,
+        modes.Modes.SONG,
+        lookup=True,
+        itunes_client=itunes_client,
+    )
+    if not songs:
+        return None
+    return songs
+
+
+def pick_video_url(
+    config: settings.SongbirdCliConfig,
+    entry: ManifestEntry,
+    song_name: str,
+    song_properties: Union[itunes_api.ItunesApiSongModel, bool],
+    search_engine: Optional[search.SearchEngine] = None,
+) -> Optional[str]:
+    """Pick the youtube video to download for a song, without prompting.
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        entry (ManifestEntry): the manifest entry the song came from
+        song_name (str): the name of the song
+        song_properties (Union[itunes_api.ItunesApiSongModel, bool]): the song properties, False if none were selected
+        search_engine (Optional[search.SearchEngine], optional): the engine to search youtube with. Defaults to None.
+
+    Returns:
+        Optional[str]: the url of the video, None if no video could be picked
+    """
+    if entry.youtube_url is not None and entry.mode == modes.Modes.SONG:
+        return cli.get_url_with_specific_params(entry.youtube_url, ["v"])
+    if entry.youtube_pick == PickPolicy.NONE:
+        return None
+    payload = cli.get_youtube_payload(config, song_name, song_properties)
+    if search_engine is not None:
+        videos = search_engine.search_videos(payload)
+    else:
+        _, links = youtube.get_video_links(
+            config.youtube_home_url,
+            config.youtube_search_url,
+            payload,
+            config.youtube_render_timeout,
+            config.youtube_render_wait,
+            config.youtube_render_retries,
+            config.youtube_render_sleep,
+        )
+        videos = search.get_videos(links)
+    if not videos:
+        return None
+    video = videos[0]
+    if entry.youtube_pick == PickPolicy.BEST and song_properties != False:
+        video, score = matching.best_match(song_properties, videos)
+        if score < config.youtube_match_threshold:
+            logger.error(
+                f"The best youtube match for {song_name}, '{video.title}', scored {score:.2f}, below the match threshold."
+            )
+            return None
+    return cli.get_url_with_specific_params(config.youtube_home_url + video.href, ["v"])
+
+
+def prepare_entry(
+    config: settings.SongbirdCliConfig,
+    entry_idx: int,
+    entry: ManifestEntry,
+    itunes_client: Optional[itunes_search.ItunesClient] = None,
+    library_index: Optional[library.LibraryIndex] = None,
+    queued_names: Optional[Set[str]] = None,
+    search_engine: Optional[search.SearchEngine] = None,
+) -> Tuple[List[pipeline.SongJob], List[BatchResult]]:
+    """Resolve a manifest entry into jobs, mirroring `cli.prepare_song` without prompting.
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        entry_idx (int): the index of the entry in the manifest
+        entry (ManifestEntry): the manifest entry
+        itunes_client (Optional[itunes_search.ItunesClient], optional): the client used to query the itunes api. Defaults to None.
+        library_index (Optional[library.LibraryIndex], optional): the index used to find similar local files. Defaults to None.
+        queued_names (Optional[Set[str]], optional): the normalized names of the songs already queued by the batch,
+            updated with the songs of this entry. Defaults to None.
+        search_engine (Optional[search.SearchEngine], optional): the engine to search youtube with. Defaults to None.
+
+    Returns:
+        Tuple[List[pipeline.SongJob], List[BatchResult]]: the jobs to process, and the results of any songs that will not be processed
+    """
+    jobs = []
+    skipped = []
+    if queued_names is None:
+        queued_names = set()
+    name = entry.query or str(entry.itunes_id)
+    if ("i" in entry.destination and not config.itunes_enabled) or (
+        "g" in entry.destination and not config.gdrive_enabled
+    ):
+        message = f"destination '{entry.destination}' is not enabled"
+        return jobs, [
+            BatchResult(
+                entry=entry_idx, song_name=name, status="failed", message=message
+            )
+        ]
+
+    all_properties = resolve_song_properties(entry, itunes_client)
+    if all_properties is None:
+        message = "could not find the entry in the itunes api"
+        return jobs, [
+            BatchResult(
+                entry=entry_idx, song_name=name, status="failed", message=message
+            )
+        ]
+
+    file_format = cli.get_file_format(config, entry.destination)
+    for song_properties in all_properties:
+        if entry.mode == modes.Modes.SONG and entry.query != "":
+            song_name = entry.query
+        elif song_properties != False:
+            song_name = song_properties.trackName
+        else:
+            song_name = name
+        song_name = common.remove_illegal_characters(song_name)
+        result = BatchResult(entry=entry_idx, song_name=song_name, status="failed")
+
+        # songs queued earlier in the batch are not on disk yet
+        if library.normalize(song_name) in queued_names:
+            result.status = "skipped"
+            result.message = "already queued by an earlier entry"
+            skipped.append(result)
+            continue
+        if not entry.allow_duplicates:
+            files = cli.find_local_files(
+                config, song_name, library_index, song_properties
+            )
+            if len(files) > 0:
+                result.status = "skipped"
+                result.message = f"similar files exist: {files}"
+                skipped.append(result)
+                continue
+        if not config.youtube_dl_enabled:
+            result.message = "youtube downloads are disabled"
+            skipped.append(result)
+            continue
+        file_path_no_format = cli.get_download_path(config, song_name)
+        video_url = pick_video_url(
+            config, entry, song_name, song_properties, search_engine
+        )
+        if video_url is None:
+            result.message = "could not pick a youtube video"
+            skipped.append(result)
+            continue
+        queued_names.add(library.normalize(song_name))
+        jobs.append(
+            pipeline.SongJob(
+                song_name=song_name,
+                song_properties=song_properties,
+                file_path_no_format=file_path_no_format,
+                file_format=file_format,
+                video_url=video_url,
+                destination=entry.destination,
+            )
+        )
+    return jobs, skipped
+
+
+def record_entry(
+    song_journal: journal.Journal,
+    entry_idx: int,
+    jobs: List[pipeline.SongJob],
+    skipped: List[BatchResult],
+):
+    """Record the outcome of resolving a manifest entry, so that a resumed run need not resolve it again
+
+    Args:
+        song_journal (journal.Journal): the journal of the batch
+        entry_idx (int): the index of the entry in the manifest
+        jobs (List[pipeline.SongJob]): the jobs queued for the entry
+        skipped (List[BatchResult]): the results of the songs that will not be processed
+    """
+    for job in jobs:
+        song_journal.record_job(job, journal.Stage.SEARCHED, entry=entry_idx)
+    for result in skipped:
+        stage = journal.Stage.SKIPPED
+        if result.status == "failed":
+            stage = journal.Stage.FAILED
+        song_journal.record(
+            uuid.uuid4().hex,
+            stage,
+            song_name=result.song_name,
+            entry=entry_idx,
+            message=result.message,
+        )
+
+
+def get_resumed_entries(
+    song_journal: Optional[journal.Journal],
+) -> Dict[int, List[journal.JournalRecord]]:
+    """Get the manifest entries resolved by a previous run
+
+    Args:
+        song_journal (Optional[journal.Journal]): the journal of the batch, None if disabled
+
+    Returns:
+        Dict[int, List[journal.JournalRecord]]: the entry indexes, mapped to the latest state of each of their songs
+    """
+    resumed = {}
+    if song_journal is None:
+        return resumed
+    for record in song_journal.records.values():
+        if record.entry is not None:
+            resumed.setdefault(record.entry, []).append(record)
+    return resumed
+
+
+def resume_entry(
+    entry_idx: int, records: List[journal.JournalRecord]
+) -> Tuple[List[pipeline.SongJob], List[BatchResult]]:
+    """Pick up a manifest entry resolved by a previous run
+
+    Args:
+        entry_idx (int): the index of the entry in the manifest
+        records (List[journal.JournalRecord]): the latest state of each of the entry's songs
+
+    Returns:
+        Tuple[List[pipeline.SongJob], List[BatchResult]]: the unfinished jobs, and the results of the finished songs
+    """
+    jobs = []
+    finished = []
+    for record in records:
+        if record.stage in [journal.Stage.SKIPPED, journal.Stage.FAILED]:
+            status = record.stage.value
+            message = record.message
+        elif record.stage == journal.Stage.DONE:
+            status = "success"
+            message = "finished by a previous run"
+        else:
+            jobs.append(record.job)
+            continue
+        finished.append(
+            BatchResult(
+                entry=entry_idx,
+                song_name=record.song_name,
+                status=status,
+                message=message,
+            )
+        )
+    return jobs, finished
+
+
+def write_report(report_path: str, results: List[BatchResult]):
+    """Write the results of a batch run as json lines
+
+    Args:
+        report_path (str): the path to write to
+        results (List[BatchResult]): the results
+    """
+    with open(report_path, "w", encoding="utf-8") as f:
+        for result in results:
+            f.write(result.model_dump_json() + "\n")
+
+
+def run(
+    manifest_path: str,
+    report_path: Optional[str] = None,
+    config: Optional[settings.SongbirdCliConfig] = None,
+    resume: bool = False,
+) -> Optional[List[BatchResult]]:
+    """entrypoint for songbirdcli's batch mode. Processes every song and album in the manifest
+    without prompting, then writes a report of the results.
+
+    Progress is recorded in a journal named after the manifest, inside of the data path. When resuming,
+    entries resolved by the previous run are not searched again, finished songs are reported
+    as they were, and unfinished songs pick up from the last stage they completed.
+
+    Args:
+        manifest_path (str): path to a .csv or .jsonl manifest
+        report_path (Optional[str], optional): path to write the json lines report to. Defaults to a timestamped file in the data path.
+        config (Optional[settings.SongbirdCliConfig], optional): songbirdcli settings pydantic model
+        resume (bool, optional): whether to resume the previous run of the manifest. Defaults to False.
+
+    Returns:
+        Optional[List[BatchResult]]: the results, None if the batch could not be run
+    """
+    if not config:
+        config = settings.SongbirdCliConfig(version=cli.version.version)
+    common.set_logger_config_globally(log_level=config.log_level)
+    if config.run_local:
+        cli.initialize_dirs(
+            [
+                config.get_data_path(),
+                config.get_itunes_folder_path(),
+                config.get_itunes_lib_path(),
+                config.get_gdrive_folder_path(),
+                config.get_local_folder_path(),
+            ]
+        )
+    if not cli.validate_essentials(config):
+        return None
+    try:
+        entries = load_manifest(manifest_path)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not load manifest {manifest_path}: {e}")
+        return None
+
+    manifest_name = os.path.splitext(os.path.basename(manifest_path))[0]
+    if report_path is None:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        report_path = os.path.join(
+            config.get_data_path(), f"{manifest_name}-report-{timestamp}.jsonl"
+        )
+
+    timing.set_recorder(timing.Recorder.from_config(config))
+    transcode.set_transcoder(transcode.Transcoder.from_config(config))
+    itunes_client = itunes_search.ItunesClient.from_config(config)
+    library_index = None
+    if config.library_index_enabled:
+        library_index = library.LibraryIndex.from_config(config)
+    search_engine = None
+    if config.youtube_dl_enabled:
+        search_engine = search.from_config(config)
+    artwork_cache = None
+    if config.artwork_cache_enabled and os.path.exists(config.get_data_path()):
+        artwork_cache = artwork.ArtworkCache.from_config(config)
+    uploader = None
+    if config.gdrive_enabled:
+        uploader = uploads.DriveUploader.from_config(config)
+    song_journal = None
+    if config.journal_enabled:
+        song_journal = journal.Journal.from_config(config, f"{manifest_name}-journal")
+        if not resume:
+            song_journal.clear()
+    elif resume:
+        logger.warning("Cannot resume, as the journal is disabled.")
+    try:
+        jobs = []
+        job_entries = []
+        results = []
+        queued_names = set()
+        resumed = get_resumed_entries(song_journal) if resume else {}
+        prefetch_song_properties(
+            [entry for idx, entry in enumerate(entries) if idx not in resumed],
+            itunes_client,
+        )
+        for entry_idx, entry in enumerate(entries):
+            if entry_idx in resumed:
+                entry_jobs, finished = resume_entry(entry_idx, resumed[entry_idx])
+                jobs += entry_jobs
+                job_entries += [entry_idx] * len(entry_jobs)
+                results += finished
+                queued_names.update(
+                    library.normalize(record.song_name) for record in resumed[entry_idx]
+                )
+                continue
+            logger.info(f"[{entry_idx + 1}/{len(entries)}] Resolving: {entry.query}")
+            entry_jobs, skipped = prepare_entry(
+                config,
+                entry_idx,
+                entry,
+                itunes_client,
+                library_index,
+                queued_names,
+                search_engine,
+            )
+            if song_journal is not None:
+                record_entry(song_journal, entry_idx, entry_jobs, skipped)
+            jobs += entry_jobs
+            job_entries += [entry_idx] * len(entry_jobs)
+            results += skipped
+
+        job_results = pipeline.run_jobs(
+            jobs,
+            process_job=lambda job: cli.process_song(
+                config, job, song_journal, uploader, artwork_cache, library_index
+            ),
+            workers=config.pipeline_workers,
+            interactive=False,
+        )
+        uploaded = uploader.wait() if uploader is not None else {}
+        for job, entry_idx, success in zip(jobs, job_entries, job_results):
+            result = BatchResult(
+                entry=entry_idx,
+                song_name=job.song_name,
+                status="success" if success is True else "failed",
+            )
+            if job.job_id in uploaded and uploaded[job.job_id] is None:
+                result.status = "failed"
+                result.message = "could not upload to google drive"
+            results.append(result)
+    finally:
+        if search_engine is not None:
+            search_engine.close()
+        if uploader is not None:
+            uploader.close()
+        itunes_client.close()
+        if artwork_cache is not None:
+            artwork_cache.close()
+        if library_index is not None:
+            library_index.close()
+        if song_journal is not None:
+            song_journal.close()
+        transcode.get_transcoder().close()
+        cli.remove_staging_folders(config)
+
+    results.sort(key=lambda result: result.entry)
+    write_report(report_path, results)
+    n_success = len([r for r in results if r.status == "success"])
+    logger.info(
+        f"Processed {len(results)} songs from {len(entries)} entries: {n_success} succeeded. Report written to {report_path}"
+    )
+    throttle.get_throttle().log_stats()
+    timing.get_recorder().close()
+    if config.timings_enabled:
+        timing.get_recorder().log_summary()
+    return results
@@ -1,27 +1,54 @@
+import argparse
+import functools
+import glob
+import itertools
 import logging
 import datetime
 from enum import Enum
-from typing import Optional, List, Union
-import requests
-import os, sys, shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Optional, List, Union
+import os, sys
 from urllib.parse import urlparse, parse_qsl, urlunparse, urlencode
 
 from songbirdcli import settings
+from songbirdcli import artwork
 from songbirdcli import helpers
+from songbirdcli import itunes_search
+from songbirdcli import journal
+from songbirdcli import lazy
+from songbirdcli import library
+from songbirdcli import matching
+from songbirdcli import names
+from songbirdcli import pipeline
+from songbirdcli import prefetch
+from songbirdcli import probe
+from songbirdcli import search
+from songbirdcli import tagging
+from songbirdcli import throttle
+from songbirdcli import timing
+from songbirdcli import transcode
+from songbirdcli import uploads
 from songbirdcli import version
+from songbirdcli import watcher
 
+from pydantic import ValidationError
 from songbirdcore.models import modes, itunes_api
-from songbirdcore import itunes
-from songbirdcore import youtube
-from songbirdcore import gdrive
 from songbirdcore import common
 
+# imported when first used, as they pull in yt-dlp, mutagen and the google api client
+itunes = lazy.load("songbirdcore.itunes")
+youtube = lazy.load("songbirdcore.youtube")
+gdrive = lazy.load("songbirdcore.gdrive")
+
 """Entrypoint for songbirdcli. Run cli.py as a script to run songbirdcli.
 See the README.md for configuration details.
 """
 
 logger = logging.getLogger(__name__)
 
+# the hidden folder, within each destination folder, that songs are downloaded and tagged in
+STAGING_FOLDER = ".songbird-staging"
+
 
 def validate_essentials(config: settings.SongbirdCliConfig) -> bool:
     """perform startup validation of the configuration,
@@ -133,33 +160,66 @@ def get_url_with_specific_params(url: str, allowed_params: list) -> str:
     return urlunparse(new_url_parts)
 
 
-def run_download_process(
-    file_path_no_format: str,
+def probe_video_url(
+    video_url: str, prober: Optional[probe.UrlProber] = None
+) -> Optional[str]:
+    """Check that a pasted url can be downloaded from. The url is normalized first,
+    so that urls differing only in extra parameters share one cached probe.
+
+    Args:
+        video_url (str): the url
+        prober (Optional[probe.UrlProber], optional): the prober to check the url with. Defaults to None, using the shared prober.
+
+    Returns:
+        Optional[str]: the normalized url, following any redirect to a video. None if the url cannot be downloaded from
+    """
+    if prober is None:
+        prober = probe.get_prober()
+    video_url = get_url_with_specific_params(video_url, ["v"])
+    result = prober.probe(video_url)
+    if not result.ok:
+        logger.error(f"Could not use your url {video_url}: {result.message}")
+        return None
+    resolved_url = get_url_with_specific_params(result.resolved_url, ["v"])
+    # short links redirect to the video, keep the url as pasted for anything else
+    if "v=" in urlparse(resolved_url).query:
+        return resolved_url
+    return video_url
+
+
+def select_video_url(
     youtube_home_url: str,
     youtube_search_url: str,
     youtube_query_payload: dict,
-    file_format: str,
     render_timeout: int,
     render_wait: float,
     render_retries: int,
     render_sleep: int,
     quit_str: str = "q",
-) -> str:
-    """Download a song from youtube.
+    prefetcher: Optional[prefetch.SearchPrefetcher] = None,
+    fallback_payload: Optional[dict] = None,
+    search_result: Optional[search.SearchResult] = None,
+) -> Optional[str]:
+    """Gather the youtube video to download from the user, either as a pasted url
+    or as a selection from a youtube search.
 
     Args:
-        file_path_no_format (str): the absolute path of where to save the file (excluding file format)
         youtube_home_url (str): the url to youtube's home page
         youtube_search_url (str): the search url for youtube
         youtube_query_payload (str): the query payload for youtube's search api
-        file_format (str): desired file format
         render_timeout (int): amount of time before abandoning a render
         render_wait (float): the amount of time before attempting a render
         render_retries (int): the number of retries for a render
         render_sleep (int): the amount of time to wait after rendering
+        prefetcher (Optional[prefetch.SearchPrefetcher], optional): the prefetcher to take the search results from,
+            which may already be running them. Defaults to None, searching in place.
+        fallback_payload (Optional[dict], optional): a broader payload whose prefetched results may be used
+            if the search for youtube_query_payload is still running. Defaults to None.
+        search_result (Optional[search.SearchResult], optional): the results of a search already run,
+            shown instead of searching again. Defaults to None.
 
     Returns:
-        str: the path on disk that the file was saved to, None if failure occured, quit_str if user quit
+        str: the url of the selected video, None if failure occured, quit_str if user quit
     """
     is_valid_url = False
     while not is_valid_url:
@@ -178,31 +238,31 @@ def run_download_process(
 
         if video_url is None:
             return None
-        try:
-            response = requests.get(video_url)
-        except Exception as e:
-            logger.error(f"exception occured testing your url: {e}")
-            continue
-
+        video_url = probe_video_url(video_url)
         # only continue if url was valid
-        if response.status_code == 200:
-            is_valid_url = True
-        else:
-            logger.error(
-                f"URL is valid, but could not receive 200 status from {video_url}, is internet down?"
-            )
+        is_valid_url = video_url is not None
 
         # empty str (enter) query youtube
     if video_url == "":
-        link_list, links = youtube.get_video_links(
-            youtube_home_url,
-            youtube_search_url,
-            youtube_query_payload,
-            render_timeout,
-            render_wait,
-            render_retries,
-            render_sleep,
-        )
+        with timing.span("youtube_search"):
+            if search_result is not None:
+                link_list, links = search_result
+            elif prefetcher is not None:
+                link_list, links = search.to_search_result(
+                    youtube_home_url,
+                    prefetcher.get(youtube_query_payload, fallback_payload),
+                )
+            else:
+                link_list, links = youtube.get_video_links(
+                    youtube_home_url,
+                    youtube_search_url,
+                    youtube_query_payload,
+                    render_timeout,
+                    render_wait,
+                    render_retries,
+                    render_sleep,
+                )
+                links = search.get_hrefs(links)
 
         if link_list is None:
             return
@@ -222,48 +282,120 @@ def run_download_process(
         if video_selection_idx is None or len(video_selection_idx) == 0:
             return None
 
-        video_url = youtube_home_url + links[video_selection_idx[0]].attrs["href"]
+        video_url = youtube_home_url + links[video_selection_idx[0]]
 
-    parsed_video_url = get_url_with_specific_params(video_url, ["v"])
-    # Process the download, and save locally
-    return youtube.run_download(
-        parsed_video_url, file_path_no_format, file_format, embed_thumbnail=True
-    )
+    return get_url_with_specific_params(video_url, ["v"])
 
 
-def run_for_song(
+def find_local_files(
     config: settings.SongbirdCliConfig,
     song_name: str,
-    song_properties: Optional[itunes_api.ItunesApiSongModel],
-    quit_str: str = "q",
-) -> Union[bool, None, str]:
-    """Run a cycle of the application given a song.
+    library_index: Optional[library.LibraryIndex] = None,
+    song_properties: Union[itunes_api.ItunesApiSongModel, bool, None] = None,
+) -> List[str]:
+    """Search the local folders for files similar to the song. With an index and the song's
+    itunes properties, files holding the same recording under another name are found too.
 
     Args:
-        config (settings.SongbirdConfig): the songbird config
-        song_name (str): the name of the song to run the app for
-        song_properties (Optional[itunes_api.ItunesApiSongModel]): optionally include song properties. Including these skips the itunes api parser.
+        config (settings.SongbirdCliConfig): the songbird config
+        song_name (str): the name of the song to search for
+        library_index (Optional[library.LibraryIndex], optional): the index to search. Defaults to None, searching the folders directly.
+        song_properties (Union[itunes_api.ItunesApiSongModel, bool, None], optional): the itunes properties of the song,
+            False or None if unknown. Defaults to None.
 
     Returns:
-        Union[bool, None, str]: returns boolean indicating success/failure. None indicated error occurred, quit_str indicates user quit
+        List[str]: the paths of the similar files found
     """
-    logger.info(f"Searching for: {song_name}")
-    file_itunes = []
-    file_gdrive = []
-    # itunes craves m4a formatted files. Otherwise we use mp3s, as were civilized people.
-    file_format = config.file_format if not config.itunes_enabled else "m4a"
-    # check if song exists locally in dump folder
-    file_local = common.find_file(config.get_local_folder_path(), f"*{song_name}*")
-    # check if song exists locally in itunes
+    with timing.span("local_search"):
+        file_itunes = []
+        file_gdrive = []
+        if library_index is not None:
+            # search the index, which is far cheaper than walking each folder
+            library_index.refresh()
+            file_local = library_index.search(config.get_local_folder_path(), song_name)
+            if config.itunes_enabled:
+                file_itunes = library_index.search(
+                    config.get_itunes_lib_path(), song_name
+                )
+            if config.gdrive_enabled:
+                file_gdrive = library_index.search(
+                    config.get_gdrive_folder_path(), song_name
+                )
+            if isinstance(song_properties, itunes_api.ItunesApiSongModel):
+                for root in get_library_roots(config):
+                    file_local += library_index.find_recording(
+                        root, song_properties.trackName, song_properties.artistName
+                    )
+        else:
+            # check if song exists locally in dump folder
+            file_local = common.find_file(
+                config.get_local_folder_path(), f"*{song_name}*"
+            )
+            # check if song exists locally in itunes
+            if config.itunes_enabled:
+                file_itunes = itunes.itunes_lib_search(
+                    config.get_itunes_lib_path(), song_name
+                )
+            # check if song exists locally in google drive folder
+            if config.gdrive_enabled:
+                file_gdrive = common.find_file(
+                    config.get_gdrive_folder_path(), f"*{song_name}*"
+                )
+    # a file may match by both name and recording
+    return list(dict.fromkeys(file_local + file_itunes + file_gdrive))
+
+
+def get_library_roots(
+    config: settings.SongbirdCliConfig, destination: Optional[str] = None
+) -> List[str]:
+    """Get the folders songs are kept in once saved
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        destination (Optional[str], optional): only get the folders of a save destination, one or more of
+            gdrive (g), itunes (i) or locally (l), e.g. ig. Defaults to None, getting every enabled folder.
+
+    Returns:
+        List[str]: the folders
+    """
+    roots = {"l": config.get_local_folder_path()}
     if config.itunes_enabled:
-        file_itunes = itunes.itunes_lib_search(config.get_itunes_lib_path(), song_name)
-    # check if song exists locally in google drive folder
+        # itunes moves songs from its auto add folder into its library
+        roots["i"] = config.get_itunes_lib_path()
     if config.gdrive_enabled:
-        file_gdrive = common.find_file(
-            config.get_gdrive_folder_path(), f"*{song_name}*"
-        )
+        roots["g"] = config.get_gdrive_folder_path()
+    if destination is not None:
+        return [roots[d] for d in destination if d in roots]
+    return list(roots.values())
+
+
+def check_local_files(
+    config: settings.SongbirdCliConfig,
+    song_name: str,
+    quit_str: str = "q",
+    library_index: Optional[library.LibraryIndex] = None,
+    song_properties: Union[itunes_api.ItunesApiSongModel, bool, None] = None,
+    exclude: Optional[List[str]] = None,
+) -> Union[bool, None, str]:
+    """Search the local folders for files similar to the song, and if any are found
+    ask the user whether to proceed with the download anyway.
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        song_name (str): the name of the song to search for
+        quit_str (str, optional): allows the user to quit out of this selection. Defaults to "q".
+        library_index (Optional[library.LibraryIndex], optional): the index to search. Defaults to None, searching the folders directly.
+        song_properties (Union[itunes_api.ItunesApiSongModel, bool, None], optional): the itunes properties of the song,
+            used to find the same recording under another name. Defaults to None.
+        exclude (Optional[List[str]], optional): files the user was already asked about. Defaults to None.
+
+    Returns:
+        Union[bool, None, str]: True if the download should proceed, None if error occurred, quit_str if user quit or declined
+    """
+    files = find_local_files(config, song_name, library_index, song_properties)
+    if exclude is not None:
+        files = [f for f in files if f not in exclude]
     # if any of the above, ask user if they want to download anyways
-    files = file_local + file_itunes + file_gdrive
     if len(files) > 0:
         logger.info("Found the following similar files:")
         common.pretty_lst_printer(files)
@@ -276,156 +408,1022 @@ def run_for_song(
 
         if inp is None:
             return
+    return True
+
+
+def get_file_format(
+    config: settings.SongbirdCliConfig, destination: Optional[str] = None
+) -> str:
+    """Get the file format songs are downloaded in
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        destination (Optional[str], optional): the save destination, whose format profile is used if it has one.
+            With several destinations, that of the first. Defaults to None.
+
+    Returns:
+        str: the file format
+    """
+    if destination and destination[0] in config.format_profiles:
+        return config.format_profiles[destination[0]].file_format
+    # itunes craves m4a formatted files. Otherwise we use mp3s, as were civilized people.
+    return config.file_format if not config.itunes_enabled else "m4a"
+
+
+def get_format_profiles(
+    config: settings.SongbirdCliConfig, job: pipeline.SongJob
+) -> Dict[str, settings.FormatProfile]:
+    """Get the format a song is saved in at each of its destinations. Destinations
+    without a profile in the config are saved in the format the song was queued in.
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        job (pipeline.SongJob): the song
+
+    Returns:
+        Dict[str, settings.FormatProfile]: each destination, and its format
+    """
+    return {
+        destination: config.format_profiles.get(destination)
+        or settings.FormatProfile(file_format=job.file_format)
+        for destination in job.destination
+    }
+
+
+def needs_transcoding(profiles: Dict[str, settings.FormatProfile]) -> bool:
+    """Whether a song is encoded after its download, rather than converted by yt-dlp as
+    it downloads. Songs saved to several destinations are downloaded once, then encoded
+    in the format of each, as are songs saved at a set bitrate.
 
+    Args:
+        profiles (Dict[str, settings.FormatProfile]): the format of each of the song's destinations
+
+    Returns:
+        bool: True if the song is transcoded
+    """
+    return len(profiles) > 1 or any(
+        profile.bitrate is not None for profile in profiles.values()
+    )
+
+
+def get_download_path(config: settings.SongbirdCliConfig, song_name: str) -> str:
+    """Get the path to download a song to. Its file name is made unique within
+    the song's destination folder once it is saved, in `publish_song`.
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        song_name (str): the name of the song
+
+    Returns:
+        str: the path to download to, excluding file format
+    """
+    return os.path.join(config.get_local_folder_path(), song_name)
+
+
+def get_youtube_payload(
+    config: settings.SongbirdCliConfig,
+    song_name: str,
+    song_properties: Union[itunes_api.ItunesApiSongModel, bool],
+) -> dict:
+    """Build the youtube search payload for a song
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        song_name (str): the name of the song
+        song_properties (Union[itunes_api.ItunesApiSongModel, bool]): the song properties, False if none were selected
+
+    Returns:
+        dict: the query payload for youtube's search api
+    """
+    payload = dict(config.youtube_searchform_payload)
+    # if song_properties is False, user selected no properties
+    if song_properties != False:
+        payload[config.youtube_search_tag] = (
+            f"{song_properties.artistName} {song_properties.trackName}"
+        )
+    else:
+        payload[config.youtube_search_tag] = song_name
+    return payload
+
+
+def prefetch_youtube_search(
+    config: settings.SongbirdCliConfig,
+    prefetcher: Optional[prefetch.SearchPrefetcher],
+    song_name: str,
+    song_properties: Union[itunes_api.ItunesApiSongModel, bool, None] = None,
+) -> Optional[dict]:
+    """Start the youtube search for a song in the background
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        prefetcher (Optional[prefetch.SearchPrefetcher]): the prefetcher, None if youtube is searched in place
+        song_name (str): the name of the song
+        song_properties (Union[itunes_api.ItunesApiSongModel, bool, None], optional): the song properties if known. Defaults to None.
+
+    Returns:
+        Optional[dict]: the payload searched for, None if nothing was prefetched
+    """
+    if prefetcher is None or not config.youtube_dl_enabled:
+        return None
     if song_properties is None:
-        song_properties = helpers.parse_itunes_search_api(song_name, modes.Modes.SONG)
+        song_properties = False
+    payload = get_youtube_payload(config, song_name, song_properties)
+    prefetcher.prefetch(payload)
+    return payload
 
-    if song_properties == quit_str:
-        return quit_str
 
-    file_path_no_format = os.path.join(config.get_local_folder_path(), song_name)
-    file_path = file_path_no_format + "." + file_format
-    downloaded_file_path = None
-    # make sure file doesnt already exist
-    duped_filepath = common.fname_duper(file_path, config.fname_dup_limit, 1, "_dup")
-    if duped_filepath is None:
-        return
-    if duped_filepath != file_path:
-        logger.warning(
-            f"Duplicate file(s) already exist for base file {file_path}, so I generated a new filename {duped_filepath}!"
+def get_save_destination(
+    config: settings.SongbirdCliConfig, quit_str: str = "q"
+) -> Optional[str]:
+    """provide user with choices for where to save their file to, based on
+    the enabled features.
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        quit_str (str, optional): allows the user to quit out of this selection. Defaults to "q".
+
+    Returns:
+        Optional[str]: one of gdrive (g), itunes (i) or locally (l), or several e.g. ig if format profiles are configured.
+            None if error occurred, quit_str if user quit
+    """
+    options = []
+    if config.gdrive_enabled:
+        options.append(("gdrive", "g"))
+    if config.itunes_enabled:
+        options.append(("itunes", "i"))
+    options.append(("locally", "l"))
+    if len(options) == 1:
+        return "l"
+
+    choices = [choice for _, choice in options]
+    prompt = "Would you like to save your file to " + ", ".join(
+        f"{name} ({choice})" for name, choice in options[:-1]
+    )
+    prompt += f", or {options[-1][0]} ({options[-1][1]})"
+    if len(config.format_profiles) > 0:
+        # one download is encoded in the format of each destination chosen
+        prompt += (
+            f". Combine them, e.g. {''.join(choices[:2])}, to save to several at once"
         )
-        file_path_no_format = os.path.splitext(duped_filepath)[0]
-        file_path = duped_filepath
-    # run the youtube downloader
-    if config.youtube_dl_enabled:
-        payload = config.youtube_searchform_payload
-        # if song_properties is False, user selected no properties
-        if song_properties != False:
-            payload[config.youtube_search_tag] = (
-                f"{song_properties.artistName} {song_properties.trackName}"
+        choices += [
+            "".join(combination)
+            for n in range(2, len(options) + 1)
+            for combination in itertools.combinations(choices, n)
+        ]
+    return helpers.get_input(prompt, out_type=str, choices=choices)
+
+
+def auto_select_video_url(
+    config: settings.SongbirdCliConfig,
+    prefetcher: Optional[prefetch.SearchPrefetcher],
+    payload: dict,
+    song_properties: Union[itunes_api.ItunesApiSongModel, bool],
+) -> Optional[str]:
+    """Pick the youtube video for a song without asking, if auto selection is enabled
+    and the best match for the song's itunes properties scores above the match threshold.
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        prefetcher (Optional[prefetch.SearchPrefetcher]): the prefetcher to take the search results from
+        payload (dict): the query payload for youtube's search api
+        song_properties (Union[itunes_api.ItunesApiSongModel, bool]): the song properties, False if none were selected
+
+    Returns:
+        Optional[str]: the url of the video, None if the user should pick the video
+    """
+    if (
+        not config.youtube_auto_select_enabled
+        or prefetcher is None
+        or song_properties == False
+    ):
+        return None
+    with timing.span("youtube_search"):
+        videos = prefetcher.get(payload)
+    video, score = matching.best_match(song_properties, videos)
+    if video is None or score < config.youtube_match_threshold:
+        logger.info("Found no confident youtube match, please pick the video.")
+        return None
+    logger.info(f"Auto-selected '{video.title}' ({score:.2f})")
+    return get_url_with_specific_params(config.youtube_home_url + video.href, ["v"])
+
+
+def prepare_song(
+    config: settings.SongbirdCliConfig,
+    song_name: str,
+    song_properties: Optional[itunes_api.ItunesApiSongModel],
+    quit_str: str = "q",
+    itunes_client: Optional[itunes_search.ItunesClient] = None,
+    library_index: Optional[library.LibraryIndex] = None,
+    prefetcher: Optional[prefetch.SearchPrefetcher] = None,
+) -> Union[pipeline.SongJob, None, str]:
+    """Gather every selection required to process a song from the user: whether to proceed
+    despite similar local files, the itunes properties, the youtube video and the save destination.
+
+    Args:
+        config (settings.SongbirdConfig): the songbird config
+        song_name (str): the name of the song to run the app for
+        song_properties (Optional[itunes_api.ItunesApiSongModel]): optionally include song properties. Including these skips the itunes api parser.
+        quit_str (str, optional): allows the user to quit out of the selections. Defaults to "q".
+        itunes_client (Optional[itunes_search.ItunesClient], optional): the client used to query the itunes api. Defaults to None.
+        library_index (Optional[library.LibraryIndex], optional): the index used to find similar local files. Defaults to None.
+        prefetcher (Optional[prefetch.SearchPrefetcher], optional): the prefetcher used to search youtube
+            while the user makes their other selections. Defaults to None.
+
+    Returns:
+        Union[pipeline.SongJob, None, str]: the job ready to be processed. None indicates an error occurred, quit_str indicates user quit
+    """
+    logger.info(f"Searching for: {song_name}")
+    # start searching youtube before the user is prompted for anything else
+    prefetched_payload = prefetch_youtube_search(
+        config, prefetcher, song_name, song_properties
+    )
+    proceed = check_local_files(
+        config, song_name, quit_str, library_index, song_properties
+    )
+    if proceed != True:
+        return proceed
+
+    if song_properties is None:
+        song_properties = helpers.parse_itunes_search_api(
+            song_name, modes.Modes.SONG, itunes_client=itunes_client
+        )
+        if song_properties == quit_str:
+            return quit_str
+        if library_index is not None and song_properties:
+            # the selected properties may match a recording saved under another name
+            proceed = check_local_files(
+                config,
+                song_name,
+                quit_str,
+                library_index,
+                song_properties,
+                exclude=find_local_files(config, song_name, library_index),
             )
-        else:
-            payload[config.youtube_search_tag] = song_name
+            if proceed != True:
+                return proceed
+
+    if song_properties == quit_str:
+        return quit_str
 
-        downloaded_file_path = run_download_process(
-            file_path_no_format=file_path_no_format,
+    # gather the youtube video to download
+    if not config.youtube_dl_enabled:
+        return
+    payload = get_youtube_payload(config, song_name, song_properties)
+    if prefetcher is not None:
+        # refine the search with the selected properties, no-op if unchanged
+        prefetcher.prefetch(payload)
+    video_url = auto_select_video_url(config, prefetcher, payload, song_properties)
+    if video_url is None:
+        video_url = select_video_url(
             youtube_home_url=config.youtube_home_url,
             youtube_search_url=config.youtube_search_url,
             youtube_query_payload=payload,
-            file_format=file_format,
             render_timeout=config.youtube_render_timeout,
             render_wait=config.youtube_render_wait,
             render_retries=config.youtube_render_retries,
             render_sleep=config.youtube_render_sleep,
             quit_str=quit_str,
+            prefetcher=prefetcher,
+            fallback_payload=prefetched_payload,
         )
-    if downloaded_file_path == quit_str:
+    if video_url == quit_str:
         return quit_str
 
-    if downloaded_file_path is None:
+    if video_url is None:
         return
 
-    # perform sanity check in case no file exists and yt-dlp didnt throw an error
-    if not os.path.exists(downloaded_file_path):
-        logger.error(
-            f"yt-dlp reported no error downloading file, but file does not exist. Cannot proceed with tagging as no file exists."
-        )
+    destination = get_save_destination(config, quit_str)
+    if destination == quit_str:
+        return quit_str
+    if destination is None:
         return
 
-    if song_properties != False:
-        # tag file if user specified song properties
-        tag_successful = False
-        if file_format == "mp3":
-            tag_successful = itunes.mp3ID3Tagger(downloaded_file_path, song_properties)
-        elif file_format == "m4a":
-            tag_successful = itunes.m4a_tagger(downloaded_file_path, song_properties)
-        else:
-            logger.warning(
-                "You've specified a file format that is has no tagger supported yet. Saving file without tags."
+    file_format = get_file_format(config, destination)
+    file_path_no_format = get_download_path(config, song_name)
+    return pipeline.SongJob(
+        song_name=song_name,
+        song_properties=song_properties,
+        file_path_no_format=file_path_no_format,
+        file_format=file_format,
+        video_url=video_url,
+        destination=destination,
+    )
+
+
+def process_song(
+    config: settings.SongbirdCliConfig,
+    job: pipeline.SongJob,
+    song_journal: Optional[journal.Journal] = None,
+    uploader: Optional[uploads.DriveUploader] = None,
+    artwork_cache: Optional[artwork.ArtworkCache] = None,
+    library_index: Optional[library.LibraryIndex] = None,
+) -> Optional[bool]:
+    """Download, tag and save a song without prompting the user. If a journal is given,
+    each stage is recorded as it completes, and the stages a previous run completed are skipped.
+    If an uploader is given, songs saved to gdrive are queued for upload rather than uploaded in place.
+    If an artwork cache is given, songs are tagged with artwork from the cache rather than the network.
+    If a library index is given, downloads holding the same audio as a song saved to the
+    same destination are discarded rather than saved again.
+    Songs saved to several destinations, or at a set bitrate, are downloaded once as is, then
+    encoded in the format profile of each destination by the shared transcoder.
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        job (pipeline.SongJob): the song and the selections gathered for it
+        song_journal (Optional[journal.Journal], optional): the journal to record progress in. Defaults to None.
+        uploader (Optional[uploads.DriveUploader], optional): the uploader to queue gdrive uploads with. Defaults to None.
+        artwork_cache (Optional[artwork.ArtworkCache], optional): the cache to read album artwork from. Defaults to None.
+        library_index (Optional[library.LibraryIndex], optional): the index used to find local copies of the recording. Defaults to None.
+
+    Returns:
+        Optional[bool]: True if success, None if an error occurred
+    """
+    record = None
+    if song_journal is not None:
+        record = song_journal.get(job.job_id)
+    stages = journal.remaining_stages(record)
+    downloaded_file_path = None
+    if journal.Stage.DOWNLOADED not in stages:
+        downloaded_file_path = record.path
+
+    def complete(stage: journal.Stage, path: Optional[str] = None, message: str = ""):
+        if song_journal is not None:
+            song_journal.record_job(job, stage, path=path, message=message)
+
+    profiles = get_format_profiles(config, job)
+    transcoding = needs_transcoding(profiles)
+    staging_path_no_format = get_staging_path(config, job)
+    if journal.Stage.DOWNLOADED in stages:
+        if record is not None:
+            # restart the download of a song interrupted by a previous run
+            remove_partial_downloads(staging_path_no_format)
+        # download straight to the destination's filesystem, so publishing is a rename
+        with timing.span("download", job.song_name):
+            if transcoding:
+                # fetch the audio once, for every destination to be encoded from
+                download = functools.partial(
+                    transcode.download_source, job.video_url, staging_path_no_format
+                )
+            else:
+                download = functools.partial(
+                    youtube.run_download,
+                    job.video_url,
+                    staging_path_no_format,
+                    job.file_format,
+                    # the youtube thumbnail is replaced by the itunes artwork when tagging from the cache
+                    embed_thumbnail=artwork_cache is None or not job.song_properties,
+                )
+            downloaded_file_path = throttle.get_throttle().call(
+                job.video_url, download, retries=config.youtube_dl_retries
             )
+        if downloaded_file_path is None:
+            return
 
-    # provide user with choices for where to save their file to.
-    save_prompt_base = "Would you like to save your file to"
-    if config.itunes_enabled and config.gdrive_enabled:
-        inp = helpers.get_input(
-            save_prompt_base + " gdrive (g), itunes (i), or locally (l)",
-            out_type=str,
-            choices=["g", "i", "l"],
+        # perform sanity check in case no file exists and yt-dlp didnt throw an error
+        if not os.path.exists(downloaded_file_path):
+            logger.error(
+                f"yt-dlp reported no error downloading file, but file does not exist. Cannot proceed with tagging as no file exists."
+            )
+            return
+        timing.add_bytes(os.path.getsize(downloaded_file_path), job.song_name)
+        complete(journal.Stage.DOWNLOADED, path=downloaded_file_path)
+
+        # fingerprints match across formats, so a download yet to be transcoded is checked too
+        if library_index is not None:
+            for root in get_library_roots(config, job.destination):
+                duplicates = library_index.find_audio(root, downloaded_file_path)
+                if len(duplicates) > 0:
+                    logger.warning(
+                        f"Not saving {job.song_name}, as it is the same recording as: {duplicates}"
+                    )
+                    os.remove(downloaded_file_path)
+                    remove_staged_files(config, job)
+                    complete(
+                        journal.Stage.DONE, message=f"same recording as {duplicates[0]}"
+                    )
+                    timing.finish(job.song_name)
+                    return True
+
+    # the path each destination's song is staged at
+    staged_paths = {job.destination: downloaded_file_path}
+    if transcoding:
+        staged_paths = {
+            destination: f"{get_staging_path(config, job, destination)}.{destination}.{profile.file_format}"
+            for destination, profile in profiles.items()
+        }
+    if journal.Stage.TAGGED in stages:
+        if transcoding:
+            with timing.span("transcode", job.song_name):
+                transcoded = transcode.get_transcoder().transcode_all(
+                    downloaded_file_path,
+                    {
+                        destination: (staged_paths[destination], profile)
+                        for destination, profile in profiles.items()
+                    },
+                )
+            if transcoded is None:
+                return None
+        if job.song_properties != False:
+            # tag file if user specified song properties
+            with timing.span("tag", job.song_name):
+                for destination, staged_path in staged_paths.items():
+                    tag_song(
+                        job,
+                        staged_path,
+                        profiles[destination].file_format,
+                        artwork_cache,
+                    )
+        complete(journal.Stage.TAGGED, path=downloaded_file_path)
+
+    song_path = downloaded_file_path
+    if journal.Stage.MOVED in stages:
+        published = {}
+        with timing.span("move", job.song_name):
+            for destination, staged_path in staged_paths.items():
+                published[destination] = publish_song(
+                    config,
+                    job,
+                    staged_path,
+                    destination,
+                    profiles[destination].file_format,
+                )
+                if published[destination] is None:
+                    return None
+        if transcoding:
+            # every destination has its own encoding, so the download is not kept
+            os.remove(downloaded_file_path)
+        remove_staged_files(config, job)
+        # the song uploaded to gdrive, if saved there
+        song_path = published.get("g", published[job.destination[0]])
+        complete(journal.Stage.MOVED, path=song_path)
+
+    msg = "Saved " + " and ".join(
+        {"g": "to gdrive", "i": "to itunes", "l": "locally"}[destination]
+        for destination in job.destination
+    )
+    if "g" in job.destination:
+        gdrive_song_name = f"{job.song_name}.{profiles['g'].file_format}"
+        if journal.Stage.UPLOADED in stages and uploader is not None:
+
+            def on_uploaded(file_id: str):
+                complete(journal.Stage.UPLOADED, message=file_id)
+                complete(journal.Stage.DONE)
+                timing.finish(job.song_name)
+                logger.info(f"{msg}: {job.song_name}")
+
+            # upload in the background, so the next song can start downloading
+            uploader.submit(
+                job.job_id,
+                song_name=gdrive_song_name,
+                song_path=str(song_path),
+                on_complete=on_uploaded,
+            )
+            logger.info(f"Queued for upload to gdrive: {job.song_name}")
+            return True
+        if journal.Stage.UPLOADED in stages:
+            # If running in a container, we need to provide a bind address
+            # Users are expected to run the container with hostname songbird (--hostname songbird)
+            bind_addr = None
+            if not config.run_local:
+                bind_addr = "songbird"
+            with timing.span("upload", job.song_name):
+                file_id = gdrive.save_song(
+                    config.gdrive_folder_id,
+                    credentials_path=os.path.join(
+                        config.get_gdrive_folder_path(), "credentials.json"
+                    ),
+                    token_path=os.path.join(
+                        config.get_gdrive_folder_path(), "token.json"
+                    ),
+                    song_name=gdrive_song_name,
+                    song_path=str(song_path),
+                    auth_port=config.gdrive_auth_port,
+                    bind_addr=bind_addr,
+                )
+            complete(journal.Stage.UPLOADED, message=str(file_id))
+
+    complete(journal.Stage.DONE)
+    timing.finish(job.song_name)
+    logger.info(f"{msg}: {job.song_name}")
+    return True
+
+
+def tag_song(
+    job: pipeline.SongJob,
+    file_path: str,
+    file_format: str,
+    artwork_cache: Optional[artwork.ArtworkCache] = None,
+) -> bool:
+    """Tag a staged song with the itunes properties selected for it
+
+    Args:
+        job (pipeline.SongJob): the song
+        file_path (str): the path of the song
+        file_format (str): the format of the song
+        artwork_cache (Optional[artwork.ArtworkCache], optional): the cache to read album artwork from. Defaults to None.
+
+    Returns:
+        bool: True if the song was tagged
+    """
+    if artwork_cache is None and file_format == "mp3":
+        return itunes.mp3ID3Tagger(file_path, job.song_properties)
+    if artwork_cache is None and file_format == "m4a":
+        return itunes.m4a_tagger(file_path, job.song_properties)
+    return tagging.tag_song(file_path, file_format, job.song_properties, artwork_cache)
+
+
+def get_destination_folder(
+    config: settings.SongbirdCliConfig,
+    job: pipeline.SongJob,
+    destination: Optional[str] = None,
+) -> str:
+    """Get the folder a song is saved to
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        job (pipeline.SongJob): the song
+        destination (Optional[str], optional): one of the song's destinations. Defaults to its first.
+
+    Returns:
+        str: the folder
+    """
+    destination = destination or job.destination[0]
+    if destination == "i":
+        return config.get_itunes_folder_path()
+    if destination == "g":
+        return config.get_gdrive_folder_path()
+    return os.path.dirname(job.file_path_no_format)
+
+
+def get_staging_folder(
+    config: settings.SongbirdCliConfig,
+    job: pipeline.SongJob,
+    destination: Optional[str] = None,
+) -> str:
+    """Get the folder a song is staged in before it is published. Songs are staged in a
+    hidden folder within their destination folder, so that they are never visible half
+    written, and publishing them is a rename on the same filesystem, even across docker
+    bind mounts. Itunes imports whatever lands in its automatically add folder, so songs
+    destined for itunes are staged beside that folder instead.
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        job (pipeline.SongJob): the song
+        destination (Optional[str], optional): one of the song's destinations. Defaults to its first.
+
+    Returns:
+        str: the staging folder
+    """
+    folder = get_destination_folder(config, job, destination)
+    if (destination or job.destination[0]) == "i":
+        folder = os.path.dirname(os.path.normpath(folder))
+    return os.path.join(folder, STAGING_FOLDER)
+
+
+def get_staging_path(
+    config: settings.SongbirdCliConfig,
+    job: pipeline.SongJob,
+    destination: Optional[str] = None,
+) -> str:
+    """Get the path to download a song to before it is tagged, see `get_staging_folder`
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        job (pipeline.SongJob): the song
+        destination (Optional[str], optional): one of the song's destinations. Defaults to its first.
+
+    Returns:
+        str: the path to download to, excluding file format
+    """
+    staging_folder = get_staging_folder(config, job, destination)
+    os.makedirs(staging_folder, exist_ok=True)
+    return os.path.join(staging_folder, job.job_id)
+
+
+def remove_staged_files(config: settings.SongbirdCliConfig, job: pipeline.SongJob):
+    """Remove the files a song left in its staging folders once it is published,
+    such as the thumbnails yt-dlp writes beside a download.
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        job (pipeline.SongJob): the song
+    """
+    for destination in job.destination:
+        staging_path_no_format = os.path.join(
+            get_staging_folder(config, job, destination), job.job_id
         )
+        for path in glob.glob(glob.escape(staging_path_no_format) + ".*"):
+            logger.debug(f"Removing staged file: {path}")
+            os.remove(path)
 
-    if config.itunes_enabled and not config.gdrive_enabled:
-        inp = helpers.get_input(
-            save_prompt_base + " itunes (i), or locally (l)",
-            out_type=str,
-            choices=["i", "l"],
+
+def remove_staging_folders(config: settings.SongbirdCliConfig):
+    """Remove the staging folders of every destination that are left empty, at shutdown
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+    """
+    folders = [
+        os.path.dirname(os.path.normpath(config.get_itunes_folder_path())),
+        config.get_gdrive_folder_path(),
+        config.get_local_folder_path(),
+    ]
+    for folder in folders:
+        try:
+            os.rmdir(os.path.join(folder, STAGING_FOLDER))
+        except OSError:
+            # missing, or still holding the songs of an interrupted run to resume
+            pass
+
+
+def publish_song(
+    config: settings.SongbirdCliConfig,
+    job: pipeline.SongJob,
+    staged_path: str,
+    destination: Optional[str] = None,
+    file_format: Optional[str] = None,
+) -> Optional[str]:
+    """Move a staged song to its destination folder, named after the song. If the name
+    is taken, the song is saved as a duplicate, e.g. song_dup.mp3, rather than replace it.
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        job (pipeline.SongJob): the song
+        staged_path (str): the path of the downloaded and tagged song
+        destination (Optional[str], optional): one of the song's destinations. Defaults to its first.
+        file_format (Optional[str], optional): the format of the staged song. Defaults to the format the song was queued in.
+
+    Returns:
+        Optional[str]: the path the song was published to, None if it could not be moved
+    """
+    folder = get_destination_folder(config, job, destination)
+    try:
+        # the folder is not created by staging, when songs are staged beside it
+        os.makedirs(folder, exist_ok=True)
+        return names.get_allocator().publish(
+            staged_path,
+            folder,
+            f"{os.path.basename(job.file_path_no_format)}.{file_format or job.file_format}",
+            config.fname_dup_key,
         )
+    except OSError as e:
+        logger.error(f"Could not move {staged_path} to its destination: {e}")
+        return None
 
-    if not config.itunes_enabled and config.gdrive_enabled:
-        inp = helpers.get_input(
-            save_prompt_base + " gdrive (g), or locally (l)",
-            out_type=str,
-            choices=["g", "l"],
+
+def remove_partial_downloads(file_path_no_format: str):
+    """Remove the files left behind by an interrupted download, such as
+    yt-dlp's .part files, so that the download restarts cleanly.
+
+    Args:
+        file_path_no_format (str): the path the song was being downloaded to, excluding file format
+    """
+    for path in glob.glob(glob.escape(file_path_no_format) + ".*"):
+        logger.info(f"Removing partial download: {path}")
+        os.remove(path)
+
+
+def run_for_song(
+    config: settings.SongbirdCliConfig,
+    song_name: str,
+    song_properties: Optional[itunes_api.ItunesApiSongModel],
+    quit_str: str = "q",
+    itunes_client: Optional[itunes_search.ItunesClient] = None,
+    library_index: Optional[library.LibraryIndex] = None,
+    song_journal: Optional[journal.Journal] = None,
+    uploader: Optional[uploads.DriveUploader] = None,
+    prefetcher: Optional[prefetch.SearchPrefetcher] = None,
+    artwork_cache: Optional[artwork.ArtworkCache] = None,
+) -> Union[bool, None, str]:
+    """Run a cycle of the application given a song.
+
+    Args:
+        config (settings.SongbirdConfig): the songbird config
+        song_name (str): the name of the song to run the app for
+        song_properties (Optional[itunes_api.ItunesApiSongModel]): optionally include song properties. Including these skips the itunes api parser.
+        itunes_client (Optional[itunes_search.ItunesClient], optional): the client used to query the itunes api. Defaults to None.
+        library_index (Optional[library.LibraryIndex], optional): the index used to find similar local files. Defaults to None.
+        song_journal (Optional[journal.Journal], optional): the journal to record progress in. Defaults to None.
+        uploader (Optional[uploads.DriveUploader], optional): the uploader to queue gdrive uploads with. Defaults to None.
+        prefetcher (Optional[prefetch.SearchPrefetcher], optional): the prefetcher used to search youtube. Defaults to None.
+        artwork_cache (Optional[artwork.ArtworkCache], optional): the cache to read album artwork from. Defaults to None.
+
+    Returns:
+        Union[bool, None, str]: returns boolean indicating success/failure. None indicated error occurred, quit_str indicates user quit
+    """
+    with timing.song(song_name):
+        job = prepare_song(
+            config,
+            song_name,
+            song_properties,
+            quit_str,
+            itunes_client,
+            library_index,
+            prefetcher,
         )
+    if not isinstance(job, pipeline.SongJob):
+        timing.finish(song_name)
+        return job
+    if song_journal is not None:
+        song_journal.record_job(job, journal.Stage.SEARCHED)
+    return process_song(
+        config, job, song_journal, uploader, artwork_cache, library_index
+    )
+
 
-    if not config.itunes_enabled and not config.gdrive_enabled:
-        inp = "l"
+def run_queue(
+    config: settings.SongbirdCliConfig,
+    songs: List[str],
+    album_song_properties: Optional[List[itunes_api.ItunesApiSongModel]] = None,
+    quit_str: str = "q",
+    itunes_client: Optional[itunes_search.ItunesClient] = None,
+    library_index: Optional[library.LibraryIndex] = None,
+    song_journal: Optional[journal.Journal] = None,
+    uploader: Optional[uploads.DriveUploader] = None,
+    prefetcher: Optional[prefetch.SearchPrefetcher] = None,
+    artwork_cache: Optional[artwork.ArtworkCache] = None,
+):
+    """Gather the selections for every queued song up front, then download, tag
+    and save them concurrently using config.pipeline_workers workers.
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        songs (List[str]): the queued song names
+        album_song_properties (Optional[List[itunes_api.ItunesApiSongModel]], optional): pre-selected properties for each song, as in album mode. Defaults to None.
+        quit_str (str, optional): allows the user to quit out of the selections. Defaults to "q".
+        itunes_client (Optional[itunes_search.ItunesClient], optional): the client used to query the itunes api. Defaults to None.
+        library_index (Optional[library.LibraryIndex], optional): the index used to find similar local files. Defaults to None.
+        song_journal (Optional[journal.Journal], optional): the journal to record progress in. Defaults to None.
+        uploader (Optional[uploads.DriveUploader], optional): the uploader to queue gdrive uploads with. Defaults to None.
+        prefetcher (Optional[prefetch.SearchPrefetcher], optional): the prefetcher used to search youtube. Defaults to None.
+        artwork_cache (Optional[artwork.ArtworkCache], optional): the cache to read album artwork from. Defaults to None.
+    """
+    jobs = []
+    for i, song in enumerate(songs):
+        song_properties = None
+        if album_song_properties is not None:
+            song_properties = album_song_properties[i]
+        prefetch_next_song(config, prefetcher, songs, album_song_properties, i)
+        with timing.song(song):
+            job = prepare_song(
+                config,
+                song,
+                song_properties,
+                quit_str,
+                itunes_client,
+                library_index,
+                prefetcher,
+            )
+        if isinstance(job, pipeline.SongJob):
+            if song_journal is not None:
+                song_journal.record_job(job, journal.Stage.SEARCHED)
+            jobs.append(job)
+            continue
 
-    if inp == quit_str:
+        # detect if more songs are queued, and asks if user wants to continue with other songs
+        if i + 1 < len(songs):
+            songs_remaining = songs[i + 1 :]
+            common.pretty_lst_printer(songs_remaining)
+            return_to_menu = helpers.get_input(
+                prompt=f"You have {len(songs_remaining)} songs (above) in queue. Would you like to continue?",
+                choices=["y", "n"],
+                out_type=str,
+                quit_str=quit_str,
+            )
+            if return_to_menu == "n" or return_to_menu == quit_str:
+                break
+
+    pipeline.run_jobs(
+        jobs,
+        process_job=lambda job: process_song(
+            config, job, song_journal, uploader, artwork_cache, library_index
+        ),
+        workers=config.pipeline_workers,
+        quit_str=quit_str,
+    )
+
+
+def run_album(
+    config: settings.SongbirdCliConfig,
+    album_song_properties: List[itunes_api.ItunesApiSongModel],
+    search_engine: search.SearchEngine,
+    quit_str: str = "q",
+    library_index: Optional[library.LibraryIndex] = None,
+    song_journal: Optional[journal.Journal] = None,
+    uploader: Optional[uploads.DriveUploader] = None,
+    artwork_cache: Optional[artwork.ArtworkCache] = None,
+) -> Union[List[Optional[bool]], None, str]:
+    """Download an album without picking a video for every track. Each track is matched to the
+    youtube video closest to its itunes title, artist and length, then downloaded and tagged straight
+    away, with up to config.album_workers tracks in flight at once. Only the tracks whose best match
+    scores below config.youtube_match_threshold are shown to the user, once the others are saved.
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        album_song_properties (List[itunes_api.ItunesApiSongModel]): the properties of each track in the album
+        search_engine (search.SearchEngine): the engine to search youtube with
+        quit_str (str, optional): allows the user to quit out of the selections. Defaults to "q".
+        library_index (Optional[library.LibraryIndex], optional): the index used to find similar local files. Defaults to None.
+        song_journal (Optional[journal.Journal], optional): the journal to record progress in. Defaults to None.
+        uploader (Optional[uploads.DriveUploader], optional): the uploader to queue gdrive uploads with. Defaults to None.
+        artwork_cache (Optional[artwork.ArtworkCache], optional): the cache to read album artwork from. Defaults to None.
+
+    Returns:
+        Union[List[Optional[bool]], None, str]: the result for each track downloaded, None if error occurred, quit_str if user quit
+    """
+    songs = album_song_properties
+    similar = [
+        i
+        for i, song in enumerate(songs)
+        if len(find_local_files(config, song.trackName, library_index, song)) > 0
+    ]
+    if len(similar) > 0:
+        logger.info("Found similar files for the following tracks:")
+        common.pretty_lst_printer([songs[i].trackName for i in similar])
+        inp = helpers.get_input(
+            "Do you want to download these tracks anyway?", choices=["y", "n"]
+        )
+        if inp == quit_str:
+            return quit_str
+        if inp is None:
+            return
+        if inp == "n":
+            songs = [song for i, song in enumerate(songs) if i not in similar]
+
+    destination = get_save_destination(config, quit_str)
+    if destination == quit_str:
         return quit_str
-    if inp is None:
+    if destination is None:
         return
 
-    if inp == "i":
-        msg = "Saved to itunes"
-        itunes_dest_path = common.fname_duper(
-            os.path.join(
-                config.get_itunes_folder_path(), os.path.basename(downloaded_file_path)
-            ),
-            config.fname_dup_limit,
-            1,
-            config.fname_dup_key,
+    file_format = get_file_format(config, destination)
+    jobs = []
+    for song in songs:
+        file_path_no_format = get_download_path(config, song.trackName)
+        jobs.append(
+            pipeline.SongJob(
+                song_name=song.trackName,
+                song_properties=song,
+                file_path_no_format=file_path_no_format,
+                file_format=file_format,
+                destination=destination,
+            )
         )
-        if itunes_dest_path is None:
+
+    # job id -> the videos found for tracks without a confident match
+    to_review: Dict[str, Optional[List[search.Video]]] = {}
+    results: Dict[str, Optional[bool]] = {}
+
+    def match_and_process(job: pipeline.SongJob) -> Optional[bool]:
+        payload = get_youtube_payload(config, job.song_name, job.song_properties)
+        with timing.span("youtube_search", job.song_name):
+            videos = search_engine.search_videos(payload)
+        video, score = matching.best_match(job.song_properties, videos)
+        if video is None or score < config.youtube_match_threshold:
+            to_review[job.job_id] = videos
             return None
-        shutil.move(downloaded_file_path, itunes_dest_path)
-    elif inp == "g":
-        msg = "Saved to gdrive"
-        gdrive_dest_path = common.fname_duper(
-            os.path.join(
-                config.get_gdrive_folder_path(), os.path.basename(downloaded_file_path)
-            ),
-            config.fname_dup_limit,
-            1,
-            config.fname_dup_key,
+        logger.info(f"Matched {job.song_name} to '{video.title}' ({score:.2f})")
+        job.video_url = get_url_with_specific_params(
+            config.youtube_home_url + video.href, ["v"]
         )
-        if gdrive_dest_path is None:
-            return None
-        shutil.move(downloaded_file_path, gdrive_dest_path)
-        # If running in a container, we need to provide a bind address
-        # Users are expected to run the container with hostname songbird (--hostname songbird)
-        bind_addr = None
-        if not config.run_local:
-            bind_addr = "songbird"
-        gdrive.save_song(
-            config.gdrive_folder_id,
-            credentials_path=os.path.join(
-                config.get_gdrive_folder_path(), "credentials.json"
+        if song_journal is not None:
+            song_journal.record_job(job, journal.Stage.SEARCHED)
+        return process_song(
+            config, job, song_journal, uploader, artwork_cache, library_index
+        )
+
+    n_workers = max(1, min(config.album_workers, len(jobs)))
+    logger.info(
+        f"Matching and downloading {len(jobs)} tracks with {n_workers} workers."
+    )
+    with ThreadPoolExecutor(
+        max_workers=n_workers, thread_name_prefix="album"
+    ) as executor:
+        futures = {executor.submit(match_and_process, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                results[job.job_id] = future.result()
+            except Exception:
+                logger.exception(
+                    f"Unexpected error occurred processing {job.song_name}."
+                )
+                results[job.job_id] = None
+
+    reviewed = []
+    for job in jobs:
+        if job.job_id not in to_review:
+            continue
+        logger.info(
+            f"Could not confidently match {job.song_name}, please pick its video."
+        )
+        videos = to_review[job.job_id]
+        video_url = select_video_url(
+            youtube_home_url=config.youtube_home_url,
+            youtube_search_url=config.youtube_search_url,
+            youtube_query_payload=get_youtube_payload(
+                config, job.song_name, job.song_properties
+            ),
+            render_timeout=config.youtube_render_timeout,
+            render_wait=config.youtube_render_wait,
+            render_retries=config.youtube_render_retries,
+            render_sleep=config.youtube_render_sleep,
+            quit_str=quit_str,
+            search_result=(
+                search.to_search_result(config.youtube_home_url, videos)
+                if videos
+                else None
             ),
-            token_path=os.path.join(config.get_gdrive_folder_path(), "token.json"),
-            song_name=f"{song_name}.{file_format}",
-            song_path=str(gdrive_dest_path),
-            auth_port=config.gdrive_auth_port,
-            bind_addr=bind_addr,
         )
-    else:
-        msg = "Saved locally."
+        if video_url == quit_str:
+            break
+        if video_url is None:
+            continue
+        job.video_url = video_url
+        if song_journal is not None:
+            song_journal.record_job(job, journal.Stage.SEARCHED)
+        reviewed.append(job)
+
+    reviewed_results = pipeline.run_jobs(
+        reviewed,
+        process_job=lambda job: process_song(
+            config, job, song_journal, uploader, artwork_cache, library_index
+        ),
+        workers=config.album_workers,
+        quit_str=quit_str,
+    )
+    for job, result in zip(reviewed, reviewed_results):
+        results[job.job_id] = result
+    return [results[job.job_id] for job in jobs]
 
-    logger.info(msg)
-    return True
+
+def prefetch_next_song(
+    config: settings.SongbirdCliConfig,
+    prefetcher: Optional[prefetch.SearchPrefetcher],
+    songs: List[str],
+    album_song_properties: Optional[List[itunes_api.ItunesApiSongModel]],
+    i: int,
+):
+    """Start the youtube search for the song queued after songs[i], so that
+    it runs while the user makes their selections for songs[i].
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        prefetcher (Optional[prefetch.SearchPrefetcher]): the prefetcher, None if youtube is searched in place
+        songs (List[str]): the queued song names
+        album_song_properties (Optional[List[itunes_api.ItunesApiSongModel]]): pre-selected properties for each song, as in album mode
+        i (int): the index of the song being processed
+    """
+    if i + 1 >= len(songs):
+        return
+    song_properties = None
+    if album_song_properties is not None:
+        song_properties = album_song_properties[i + 1]
+    prefetch_youtube_search(config, prefetcher, songs[i + 1], song_properties)
+
+
+def resume_jobs(
+    config: settings.SongbirdCliConfig,
+    song_journal: journal.Journal,
+    quit_str: str = "q",
+    uploader: Optional[uploads.DriveUploader] = None,
+    artwork_cache: Optional[artwork.ArtworkCache] = None,
+    library_index: Optional[library.LibraryIndex] = None,
+) -> List[Optional[bool]]:
+    """Finish the songs a previous run searched for but never saved, skipping the
+    stages it completed. Partially downloaded songs are downloaded again.
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbird config
+        song_journal (journal.Journal): the journal of the previous run
+        quit_str (str, optional): allows the user to quit out of the queue. Defaults to "q".
+        uploader (Optional[uploads.DriveUploader], optional): the uploader to queue gdrive uploads with. Defaults to None.
+        artwork_cache (Optional[artwork.ArtworkCache], optional): the cache to read album artwork from. Defaults to None.
+        library_index (Optional[library.LibraryIndex], optional): the index used to find local copies of the recording. Defaults to None.
+
+    Returns:
+        List[Optional[bool]]: the result for each unfinished song
+    """
+    jobs = [record.job for record in song_journal.pending()]
+    if len(jobs) == 0:
+        logger.info("No unfinished songs to resume.")
+        return []
+    logger.info(f"Resuming {len(jobs)} unfinished songs:")
+    common.pretty_lst_printer([job.song_name for job in jobs])
+    return pipeline.run_jobs(
+        jobs,
+        process_job=lambda job: process_song(
+            config, job, song_journal, uploader, artwork_cache, library_index
+        ),
+        workers=config.pipeline_workers,
+        quit_str=quit_str,
+    )
 
 
 def get_songs_for_album(
-    current_mode: modes.Modes, quit_str: str = "q"
+    current_mode: modes.Modes,
+    quit_str: str = "q",
+    itunes_client: Optional[itunes_search.ItunesClient] = None,
 ) -> Optional[Union[List[itunes_api.ItunesApiSongModel], modes.Modes]]:
     """allow user to search for an album, returning the selected song properties for that album to
     use by default simplifying the download process
@@ -433,6 +1431,7 @@ def get_songs_for_album(
     Args:
         current_mode (modes.Modes): the mode enum signifying the current mode
         quit_str (str, optional): _description_. Defaults to "q".
+        itunes_client (Optional[itunes_search.ItunesClient], optional): the client used to query the itunes api. Defaults to None.
 
     Returns:
         Optional[Union[List[itunes_api.ItunesApiSongModel],modes.Modes]]: return None if error, quit_str if user quits, the mode if user selects mode, or the list of album properties
@@ -451,7 +1450,9 @@ def get_songs_for_album(
     if mode is not None:
         return mode
 
-    album_song_properties = helpers.launch_album_mode(album_name)
+    album_song_properties = helpers.launch_album_mode(
+        album_name, itunes_client=itunes_client
+    )
     # quit iteration to main menu
     if album_song_properties == quit_str:
         return quit_str
@@ -491,17 +1492,26 @@ def get_songs_from_user(
     return songs
 
 
-def run(config: Optional[settings.SongbirdCliConfig] = None):
+def run(config: Optional[settings.SongbirdCliConfig] = None, resume: bool = False):
     """main entrypoint for songbirdcli. Expects the songbirdcli config object.
 
     Args:
         config (settings.SongbirdCliConfig): songbirdcli settings pydantic model
+        resume (bool, optional): whether to finish the songs left unfinished by a previous run before starting. Defaults to False.
 
     """
     if not config:
         config = settings.SongbirdCliConfig(version=version.version)
     # setup quit str for user
     quit_str = "q"
+    itunes_client = None
+    library_index = None
+    library_watcher = None
+    song_journal = None
+    uploader = None
+    prefetcher = None
+    search_engine = None
+    artwork_cache = None
     try:
         common.set_logger_config_globally(log_level=config.log_level)
         common.name_plate(entries=[f"--cli {config.version}"])
@@ -519,6 +1529,41 @@ def run(config: Optional[settings.SongbirdCliConfig] = None):
             )
         if not validate_essentials(config):
             return None
+        timing.set_recorder(timing.Recorder.from_config(config))
+        transcode.set_transcoder(transcode.Transcoder.from_config(config))
+        itunes_client = itunes_search.ItunesClient.from_config(config)
+        if config.artwork_cache_enabled and os.path.exists(config.get_data_path()):
+            artwork_cache = artwork.ArtworkCache.from_config(config)
+        if config.library_index_enabled:
+            library_index = library.LibraryIndex.from_config(config)
+            # keep the index live, rather than checking every folder for each song
+            library_watcher = watcher.from_config(config, library_index)
+            if library_watcher is not None:
+                library_watcher.start()
+        if config.gdrive_enabled:
+            uploader = uploads.DriveUploader.from_config(config)
+        if config.youtube_dl_enabled:
+            search_engine = search.from_config(config)
+            prefetcher = prefetch.SearchPrefetcher.from_config(config, search_engine)
+        if config.journal_enabled:
+            song_journal = journal.Journal.from_config(config)
+            # keep only the unfinished songs, so the journal does not grow between runs
+            song_journal.compact()
+            if resume:
+                resume_jobs(
+                    config,
+                    song_journal,
+                    quit_str,
+                    uploader,
+                    artwork_cache,
+                    library_index,
+                )
+            elif len(song_journal.pending()) > 0:
+                logger.warning(
+                    f"{len(song_journal.pending())} songs were left unfinished by a previous run. Run with --resume to finish them."
+                )
+        elif resume:
+            logger.warning("Cannot resume, as the journal is disabled.")
         current_mode = modes.Modes.SONG
         while True:
             logger.info(f"---Songbird Main Menu v{config.version}🐦---")
@@ -528,7 +1573,9 @@ def run(config: Optional[settings.SongbirdCliConfig] = None):
             result = None
             if current_mode == modes.Modes.ALBUM:
                 result = get_songs_for_album(
-                    current_mode=current_mode, quit_str=quit_str
+                    current_mode=current_mode,
+                    quit_str=quit_str,
+                    itunes_client=itunes_client,
                 )
             elif current_mode == modes.Modes.SONG:
                 result = get_songs_from_user(
@@ -568,11 +1615,54 @@ def run(config: Optional[settings.SongbirdCliConfig] = None):
                 songs = result
 
             logger.info(f"Searching for songs: {songs}")
+            if (
+                current_mode == modes.Modes.ALBUM
+                and config.album_fast_path_enabled
+                and search_engine is not None
+            ):
+                run_album(
+                    config,
+                    album_song_properties,
+                    search_engine,
+                    quit_str,
+                    library_index,
+                    song_journal,
+                    uploader,
+                    artwork_cache,
+                )
+                continue
+            if config.pipeline_workers > 1 and len(songs) > 1:
+                run_queue(
+                    config,
+                    songs,
+                    album_song_properties,
+                    quit_str,
+                    itunes_client,
+                    library_index,
+                    song_journal,
+                    uploader,
+                    prefetcher,
+                    artwork_cache,
+                )
+                continue
+
             for i, song in enumerate(songs):
                 # pre-select song properties from album mode if specified
                 if album_song_properties is not None:
                     song_properties = album_song_properties[i]
-                success = run_for_song(config, song, song_properties, quit_str)
+                prefetch_next_song(config, prefetcher, songs, album_song_properties, i)
+                success = run_for_song(
+                    config,
+                    song,
+                    song_properties,
+                    quit_str,
+                    itunes_client,
+                    library_index,
+                    song_journal,
+                    uploader,
+                    prefetcher,
+                    artwork_cache,
+                )
 
                 # detect if more songs are queued, and asks if user wants to continue with other songs
                 if (success == quit_str or success == None) and i + 1 < len(songs):
@@ -593,10 +1683,158 @@ def run(config: Optional[settings.SongbirdCliConfig] = None):
 
     except KeyboardInterrupt as e:
         logger.info("\nReceived keyboard interrupt :o")
+    finally:
+        if prefetcher is not None:
+            prefetcher.close()
+        if search_engine is not None:
+            search_engine.close()
+        if uploader is not None:
+            # finish the queued uploads before shutting down
+            uploader.close()
+        if itunes_client is not None:
+            itunes_client.close()
+        if artwork_cache is not None:
+            artwork_cache.close()
+        if library_watcher is not None:
+            library_watcher.close()
+        if library_index is not None:
+            library_index.close()
+        if song_journal is not None:
+            song_journal.close()
+        transcode.get_transcoder().close()
+        remove_staging_folders(config)
+        throttle.get_throttle().log_stats()
+        timing.get_recorder().close()
+        if config.timings_enabled:
+            timing.get_recorder().log_summary()
 
     logger.info("Shutting down!")
 
 
-if __name__ == "__main__":
+def main(argv: Optional[List[str]] = None):
+    """command line entrypoint for songbirdcli. Runs the interactive app by default,
+    batch mode via `songbirdcli batch <manifest>`, or server mode via `songbirdcli serve`,
+    which `songbirdcli submit <query>` sends jobs to. `songbirdcli retag <folder>` retags
+    saved songs with their latest itunes properties.
+
+    Args:
+        argv (Optional[List[str]], optional): the command line arguments. Defaults to sys.argv.
+    """
+    parser = argparse.ArgumentParser(
+        prog="songbirdcli",
+        description="Music downloading client featuring mp3 or m4a tagging.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="finish the songs left unfinished by a previous run before starting",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    batch_parser = subparsers.add_parser(
+        "batch", help="process a manifest of songs and albums without prompting"
+    )
+    batch_parser.add_argument("manifest", help="path to a .csv or .jsonl manifest")
+    batch_parser.add_argument(
+        "--report",
+        default=None,
+        help="path to write the json lines results report to. Defaults to a file in the data path.",
+    )
+    batch_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip the songs finished by a previous run of the manifest, and finish the rest",
+    )
+    subparsers.add_parser(
+        "serve",
+        help="keep songbird running, accepting jobs on SERVER_HOST:SERVER_PORT",
+    )
+    submit_parser = subparsers.add_parser(
+        "submit", help="send a song or album to a running server"
+    )
+    submit_parser.add_argument("query", help="the itunes search term")
+    submit_parser.add_argument(
+        "--album", action="store_true", help="download the album, not the song"
+    )
+    submit_parser.add_argument(
+        "--youtube-url",
+        default=None,
+        help="the youtube url to download the song from. Skips the youtube search.",
+    )
+    submit_parser.add_argument(
+        "--destination",
+        default="l",
+        help="where to save to. One or more of gdrive (g), itunes (i) or locally (l), e.g. ig",
+    )
+    retag_parser = subparsers.add_parser(
+        "retag", help="retag the songs in a folder with their latest itunes properties"
+    )
+    retag_parser.add_argument("folder", help="the folder, searched recursively")
+    retag_parser.add_argument(
+        "--itunes-id",
+        type=int,
+        default=None,
+        help="the itunes collection id of the album the folder holds. Defaults to searching itunes for each album.",
+    )
+    retag_parser.add_argument(
+        "--keep-artwork",
+        action="store_true",
+        help="keep the artwork songs have rather than embed the latest",
+    )
+    args = parser.parse_args(argv)
+
     config = settings.SongbirdCliConfig(version=version.version)
-    run(config=config)
+    if args.command == "batch":
+        # imported here, as batch mode is built on the stages within this module
+        from songbirdcli import batch
+
+        results = batch.run(
+            args.manifest, report_path=args.report, config=config, resume=args.resume
+        )
+        if results is None or any(result.status == "failed" for result in results):
+            sys.exit(1)
+        return
+    if args.command in ["serve", "submit"]:
+        from songbirdcli import batch, server
+
+        if args.command == "serve":
+            server.run(config=config)
+            return
+        common.set_logger_config_globally(log_level=config.log_level)
+        try:
+            entry = batch.ManifestEntry(
+                mode=modes.Modes.ALBUM if args.album else modes.Modes.SONG,
+                query=args.query,
+                youtube_url=args.youtube_url,
+                destination=args.destination,
+            )
+        except ValidationError as e:
+            submit_parser.error(str(e))
+        status = None
+        for event in server.submit(
+            f"http://{config.server_host}:{config.server_port}", entry
+        ):
+            if event.event == "stage":
+                logger.info(f"{event.song_name}: {event.stage.value} {event.message}")
+            elif event.event == "result":
+                logger.info(f"{event.song_name}: {event.status} {event.message}")
+            else:
+                logger.info(event.message)
+                status = event.status
+        if status != "success":
+            sys.exit(1)
+        return
+    if args.command == "retag":
+        results = tagging.retag(
+            args.folder,
+            config=config,
+            itunes_id=args.itunes_id,
+            keep_artwork=args.keep_artwork,
+        )
+        if results is None or any(result.status != "tagged" for result in results):
+            sys.exit(1)
+        return
+    run(config=config, resume=args.resume)
+
+
+if __name__ == "__main__":
+    main()
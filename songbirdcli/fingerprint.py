@@ -0,0 +1,213 @@
+"""
+fingerprint.py module for computing compact acoustic fingerprints of songs, which
+match re-encodes of the same recording whatever their format or bitrate
+"""
+
+import array
+import logging
+import operator
+import subprocess
+import sys
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# songs are decoded to mono pcm at this rate, which keeps the audible structure
+# of a recording while discarding the detail lossy encoders change
+SAMPLE_RATE = 5512
+# seconds decoded from the start of a song, and seconds fingerprinted after any leading silence
+DECODE_SECONDS = 30
+WINDOW_SECONDS = 10
+# samples quieter than this are treated as silence, out of 32768
+SILENCE = 328
+# the audio is split into 2 ** BAND_LEVELS frequency bands
+BAND_LEVELS = 4
+# band samples per hop, with each frame spanning two hops, about 93ms and 186ms
+HOP = 32
+# bits per frame, one per pair of neighbouring bands
+FRAME_BITS = 2**BAND_LEVELS - 1
+# the fewest frames compared, about 2 seconds
+MIN_FRAMES = 20
+# frames either way the fingerprints are shifted by when comparing them,
+# absorbing differences in where the audio starts
+MAX_OFFSET = 3
+# the fraction of bits two fingerprints must share to hold the same recording.
+# unrelated songs share about half.
+THRESHOLD = 0.7
+
+Fingerprint = Tuple[int, int]
+"""a fingerprint, as its bits and its number of frames"""
+
+
+def decode(file_path: str) -> Optional[Sequence[int]]:
+    """Decode the start of a song to mono pcm with ffmpeg
+
+    Args:
+        file_path (str): path to the song
+
+    Returns:
+        Optional[Sequence[int]]: the 16 bit samples, None if the song could not be decoded
+    """
+    command = ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error"]
+    command += ["-i", file_path, "-t", str(DECODE_SECONDS), "-vn", "-ac", "1"]
+    command += ["-ar", str(SAMPLE_RATE), "-f", "s16le", "-"]
+    try:
+        process = subprocess.run(command, capture_output=True)
+    except OSError as e:
+        logger.debug(f"Could not run ffmpeg to fingerprint {file_path}: {e}")
+        return None
+    if process.returncode != 0:
+        logger.debug(
+            f"ffmpeg could not decode {file_path}: {process.stderr.decode(errors='replace').strip()}"
+        )
+        return None
+    samples = array.array("h")
+    samples.frombytes(process.stdout[: len(process.stdout) // 2 * 2])
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples
+
+
+def compute(samples: Sequence[int]) -> str:
+    """Compute the fingerprint of a song from its samples, in the manner of chromaprint.
+    The window after any leading silence is split into frequency bands by a haar filter
+    bank, and each frame gets a bit per pair of neighbouring bands, set when the
+    difference in their energy grew since the previous frame. Comparing energies
+    rather than samples makes the bits robust to the volume and encoding of the song.
+
+    Args:
+        samples (Sequence[int]): mono 16 bit samples at SAMPLE_RATE
+
+    Returns:
+        str: the fingerprint as hex, empty if the song is too short or silent
+    """
+    start = next((i for i, s in enumerate(samples) if abs(s) > SILENCE), None)
+    if start is None:
+        return ""
+    window = list(samples[start : start + WINDOW_SECONDS * SAMPLE_RATE])
+    block = 2**BAND_LEVELS * HOP
+    window = window[: len(window) // block * block]
+    if len(window) // block <= MIN_FRAMES + 1:
+        return ""
+
+    # each level halves the bands, the order of the high half flipping with the
+    # parity of its parent so that the bands stay in order of frequency
+    bands = [window]
+    for _ in range(BAND_LEVELS):
+        split = []
+        for idx, band in enumerate(bands):
+            even, odd = band[0::2], band[1::2]
+            low = list(map(operator.add, even, odd))
+            high = list(map(operator.sub, even, odd))
+            split += [low, high] if idx % 2 == 0 else [high, low]
+        bands = split
+
+    # energy of each band in each hop, then in each frame of two hops
+    hops = []
+    for band in bands:
+        power = list(map(operator.mul, band, band))
+        hops.append([sum(power[i : i + HOP]) for i in range(0, len(power), HOP)])
+    energies = [
+        [band[i] + band[i + 1] for band in hops] for i in range(len(hops[0]) - 1)
+    ]
+
+    value = 0
+    for frame in range(1, len(energies)):
+        current, previous = energies[frame], energies[frame - 1]
+        for band in range(FRAME_BITS):
+            grew = (current[band] - current[band + 1]) - (
+                previous[band] - previous[band + 1]
+            )
+            if grew > 0:
+                value |= 1 << ((frame - 1) * FRAME_BITS + band)
+    return to_hex((value, len(energies) - 1))
+
+
+def fingerprint(file_path: str) -> str:
+    """Compute the fingerprint of a song file, see `compute`
+
+    Args:
+        file_path (str): path to the song
+
+    Returns:
+        str: the fingerprint as hex, empty if the song could not be decoded
+    """
+    samples = decode(file_path)
+    if samples is None:
+        return ""
+    return compute(samples)
+
+
+def to_hex(fp: Fingerprint) -> str:
+    """Format a fingerprint as hex, padded so that its number of frames can be recovered"""
+    value, frames = fp
+    return format(value, f"0{-(-frames * FRAME_BITS // 4)}x")
+
+
+def from_hex(value: str) -> Optional[Fingerprint]:
+    """Parse a fingerprint formatted by `to_hex`
+
+    Returns:
+        Optional[Fingerprint]: the fingerprint, None if the value is empty
+    """
+    if value == "":
+        return None
+    return int(value, 16), len(value) * 4 // FRAME_BITS
+
+
+def similarity(a: Fingerprint, b: Fingerprint) -> float:
+    """Compare two fingerprints, see `find_similar`
+
+    Returns:
+        float: the fraction of bits shared at the best offset, 0 if too short to compare
+    """
+    return find_similar(a, {"": b}, threshold=0.0).get("", 0.0)
+
+
+def find_similar(
+    fp: Fingerprint, candidates: Dict[str, Fingerprint], threshold: float = THRESHOLD
+) -> Dict[str, float]:
+    """Find the fingerprints similar to a fingerprint. Each is compared bit by bit at every
+    offset up to MAX_OFFSET frames, with the offsets and masks prepared once, so that
+    comparing a candidate is a few operations on integers regardless of its length.
+
+    Args:
+        fp (Fingerprint): the fingerprint to match
+        candidates (Dict[str, Fingerprint]): the fingerprints to search, by key
+        threshold (float, optional): the fraction of bits that must match. Defaults to THRESHOLD.
+
+    Returns:
+        Dict[str, float]: the key and similarity of each candidate matched
+    """
+    value, frames = fp
+    # the comparisons for each number of frames a candidate has, as the fingerprint
+    # shifted by an offset, the mask of the frames overlapping, and their number of bits
+    comparisons: Dict[int, List[Tuple[int, int, int]]] = {}
+    matches = {}
+    for key, (other, other_frames) in candidates.items():
+        shifts = comparisons.get(other_frames)
+        if shifts is None:
+            shifts = []
+            for offset in range(-MAX_OFFSET, MAX_OFFSET + 1):
+                # a positive offset drops frames from the start of the fingerprint,
+                # a negative one from the start of the candidate
+                skip = max(offset, 0)
+                other_skip = max(-offset, 0)
+                overlap = min(frames - skip, other_frames - other_skip)
+                if overlap < MIN_FRAMES:
+                    continue
+                bits = overlap * FRAME_BITS
+                shifted = (value >> (skip * FRAME_BITS)) << (other_skip * FRAME_BITS)
+                mask = ((1 << bits) - 1) << (other_skip * FRAME_BITS)
+                shifts.append((shifted, mask, bits))
+            comparisons[other_frames] = shifts
+        best = max(
+            [
+                1 - ((shifted ^ other) & mask).bit_count() / bits
+                for shifted, mask, bits in shifts
+            ],
+            default=0.0,
+        )
+        if best >= threshold:
+            matches[key] = best
+    return matches
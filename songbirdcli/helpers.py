@@ -3,21 +3,29 @@ helpers.py module for helping with parsing inputs
 """
 
 from typing import Optional, List, Union, Any
-from songbirdcore import common, itunes
+from songbirdcore import common
 from songbirdcore.models import modes, itunes_api
+from songbirdcli import itunes_search
+from songbirdcli import lazy
+from songbirdcli import timing
 import logging
 
 logger = logging.getLogger(__name__)
 
+itunes = lazy.load("songbirdcore.itunes")
+
 
 def launch_album_mode(
-    artist_album_string="", quit_str="q"
+    artist_album_string="",
+    quit_str="q",
+    itunes_client: Optional[itunes_search.ItunesClient] = None,
 ) -> Optional[Union[List[itunes_api.ItunesApiSongModel], str]]:
     """launch album mode: collect album and songs to download
 
     Args:
         artist_album_string (str, optional): the string used when querying itunes api. Defaults to ''.
         quit_str (str, optional): the str to signify user quitting the process. Defaults to "q".
+        itunes_client (Optional[itunes_search.ItunesClient], optional): the client used to query the itunes api. Defaults to None, querying the api directly.
 
     Returns:
         Optional[Union[List[itunes_api.ItunesApiSongModel],str]]: the list of song properties gathered from the search, None if error occured, quit_str if user quit
@@ -30,6 +38,7 @@ def launch_album_mode(
             lookup=False,
             # disable no selection here, user must select album properties.
             no_selection_value=None,
+            itunes_client=itunes_client,
         )
         # check if user quit
         if album_props == quit_str:
@@ -39,11 +48,12 @@ def launch_album_mode(
             return None
 
         # get the song matching the album metadata
-        songs_in_album_props = itunes.query_api(
+        songs_in_album_props = query_api(
             search_variable=album_props.collectionId,  # get list of songs for chosen album
             limit=album_props.trackCount,
             mode=modes.Modes.SONG,
             lookup=True,
+            itunes_client=itunes_client,
         )
         # api error occurred
         if songs_in_album_props == None:
@@ -74,6 +84,7 @@ def parse_itunes_search_api(
     lookup: bool = False,
     no_selection_value: Optional[int] = -1,
     quit_str: str = "q",
+    itunes_client: Optional[itunes_search.ItunesClient] = None,
 ) -> Optional[
     Union[bool, itunes_api.ItunesApiSongModel, itunes_api.ItunesApiAlbumKeys]
 ]:
@@ -87,11 +98,14 @@ def parse_itunes_search_api(
         lookup (bool, optional): whether to enable 'lookup' mode in itunes api. Defaults to False.
         no_selection_value (int, optional): whether to set an option for 'no selection' from stdin
         quit_str (str, optional): str value used to determine whether to quit the song selection process
+        itunes_client (Optional[itunes_search.ItunesClient], optional): the client used to query the itunes api. Defaults to None, querying the api directly.
 
     Returns:
         Optional[Union[itunes_api.ItunesApiSongModel]]: returns the selected song properties, a bool=False if use continues without selection, None if error occurred, or quit_str if user quit.
     """
-    parsed_results_list = itunes.query_api(search_variable, limit, mode, lookup=lookup)
+    parsed_results_list = query_api(
+        search_variable, limit, mode, lookup=lookup, itunes_client=itunes_client
+    )
 
     # Present results to user
     common.pretty_list_of_basemodel_printer(parsed_results_list)
@@ -120,6 +134,34 @@ def parse_itunes_search_api(
     return user_selection[0]
 
 
+def query_api(
+    search_variable: str,
+    limit: int,
+    mode: modes.Modes,
+    lookup: bool = False,
+    itunes_client: Optional[itunes_search.ItunesClient] = None,
+) -> Optional[
+    List[Union[itunes_api.ItunesApiSongModel, itunes_api.ItunesApiAlbumKeys]]
+]:
+    """query the itunes api through the given client, falling back to
+    songbirdcore when no client is given
+
+    Args:
+        search_variable (str): the value for the query
+        limit (int): number of results
+        mode (modes.Modes): the mode to run
+        lookup (bool, optional): whether to enable 'lookup' mode in itunes api. Defaults to False.
+        itunes_client (Optional[itunes_search.ItunesClient], optional): the client used to query the itunes api. Defaults to None.
+
+    Returns:
+        Optional[List[Union[itunes_api.ItunesApiSongModel, itunes_api.ItunesApiAlbumKeys]]]: the results, None if error occurred
+    """
+    with timing.span("itunes"):
+        if itunes_client is None:
+            return itunes.query_api(search_variable, limit, mode, lookup=lookup)
+        return itunes_client.query_api(search_variable, limit, mode, lookup=lookup)
+
+
 def remove_songs_selected(song_properties_list, quit_str: str = "q") -> Optional[List]:
     """Given a list of songs properties, allow the user to remove
     via stdio
@@ -172,7 +214,8 @@ def get_input(
         if choices is not None:
             built_prompt += f" , choices=({choices})"
         built_prompt += " ['q' quits]: "
-        inp = input(built_prompt)
+        with timing.prompt():
+            inp = input(built_prompt)
         if inp == quit_str:
             return quit_str
 
@@ -213,7 +256,8 @@ def get_input_list(prompt: str, sep: str, out_type=int, quit_str="q") -> List[in
         Optional[List[int]]: the typed list, or the quit_str value if user quits
     """
     while True:
-        inp = input(prompt + f" ['{quit_str}' quits]: ")
+        with timing.prompt():
+            inp = input(prompt + f" ['{quit_str}' quits]: ")
         if inp == quit_str:
             return quit_str
 
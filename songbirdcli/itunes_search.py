@@ -0,0 +1,448 @@
+"""
+itunes_search.py module for querying the itunes search api concurrently under
+a rate limit, with responses cached on disk
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Coroutine, Dict, List, Optional, TypeVar, Union
+
+import requests
+from pydantic import BaseModel, ValidationError
+
+from songbirdcli import settings, throttle
+from songbirdcore.models import itunes_api, modes
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ItunesSongModel(itunes_api.ItunesApiSongModel):
+    """The itunes song properties, extended with the fields used to match youtube videos"""
+
+    trackTimeMillis: Optional[int] = None
+    """specifies the length of the song in milliseconds"""
+
+
+class ResponseCache:
+    """An sqlite backed cache of itunes api responses, with a time to live
+    and least recently used eviction once max_entries is exceeded."""
+
+    def __init__(self, db_path: str, max_entries: int):
+        """
+        Args:
+            db_path (str): path to the sqlite database file, created if missing
+            max_entries (int): the maximum number of responses kept in the cache
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )""")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(
+        search_variable: Union[str, int], mode: modes.Modes, limit: int, lookup: bool
+    ) -> str:
+        """Build the cache key for a query
+
+        Returns:
+            str: the key for the query
+        """
+        return json.dumps([str(search_variable), mode.value, limit, lookup])
+
+    def get(self, key: str, ttl: int) -> Optional[str]:
+        """Get a cached response body, marking it as recently used
+
+        Args:
+            key (str): the cache key
+            ttl (int): the age in seconds after which a response is considered stale
+
+        Returns:
+            Optional[str]: the response body, or None if missing or stale
+        """
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT body, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            body, created = row
+            if now - created > ttl:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            self.conn.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self.conn.commit()
+        return body
+
+    def put(self, key: str, body: str):
+        """Store a response body, evicting the least recently used responses
+        if the cache is full.
+
+        Args:
+            key (str): the cache key
+            body (str): the response body
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, body, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, body, now, now),
+            )
+            self.conn.execute(
+                """DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class ItunesQuery(BaseModel):
+    """A query of the itunes search or lookup api"""
+
+    search_variable: Union[str, int]
+    """specifies the term to search for, or the id to lookup"""
+    limit: int
+    """specifies the maximum number of results"""
+    mode: modes.Modes
+    """specifies whether to search for songs or albums"""
+    lookup: bool = False
+    """specifies whether to lookup by itunes id rather than search"""
+
+
+class AsyncItunesClient:
+    """asyncio client for the itunes search and lookup apis. Requests share one pooled session,
+    and run concurrently in a thread pool sized to the pool, paced by the shared throttle. Identical queries
+    made while one is in flight wait for its response rather than requesting the api again, and
+    the latest responses are kept in memory, on top of the optional cache on disk.
+    """
+
+    def __init__(
+        self,
+        search_url: str,
+        lookup_url: str,
+        cache: Optional[ResponseCache] = None,
+        search_ttl: int = 86400,
+        lookup_ttl: int = 2592000,
+        requests_per_minute: int = 20,
+        max_connections: int = 4,
+        max_recent: int = 256,
+        timeout: float = 10,
+        request_throttle: Optional[throttle.Throttle] = None,
+    ):
+        """
+        Args:
+            search_url (str): the itunes search api url
+            lookup_url (str): the itunes lookup api url
+            cache (Optional[ResponseCache], optional): the response cache. Defaults to None, disabling caching.
+            search_ttl (int, optional): seconds before a cached search is refreshed. Defaults to a day.
+            lookup_ttl (int, optional): seconds before a cached lookup is refreshed. Defaults to 30 days.
+            requests_per_minute (int, optional): requests sent to the api per minute at most. Defaults to 20, as apple advises.
+            max_connections (int, optional): requests sent to the api at once. Defaults to 4.
+            max_recent (int, optional): responses kept in memory. Defaults to 256.
+            timeout (float, optional): seconds before abandoning a request. Defaults to 10.
+            request_throttle (Optional[throttle.Throttle], optional): paces and retries requests. Defaults to the shared throttle.
+        """
+        self.search_url = search_url
+        self.lookup_url = lookup_url
+        self.cache = cache
+        self.search_ttl = search_ttl
+        self.lookup_ttl = lookup_ttl
+        self.max_recent = max_recent
+        self.timeout = timeout
+        self.throttle = request_throttle or throttle.get_throttle()
+        rate = requests_per_minute / 60
+        for url in {search_url, lookup_url}:
+            self.throttle.configure(url, rate=rate, max_rate=rate, burst=1)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=max_connections
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_connections, thread_name_prefix="itunes"
+        )
+        self.in_flight: Dict[str, "asyncio.Future[Optional[str]]"] = {}
+        self.recent: "OrderedDict[str, str]" = OrderedDict()
+
+    async def query_api(
+        self,
+        search_variable: Union[str, int],
+        limit: int,
+        mode: modes.Modes,
+        lookup: bool = False,
+    ) -> Optional[
+        List[Union[itunes_api.ItunesApiSongModel, itunes_api.ItunesApiAlbumKeys]]
+    ]:
+        """Query the itunes api, serving the response from memory or the cache when possible.
+
+        Args:
+            search_variable (Union[str, int]): the term to search itunes api for, or the id to lookup
+            limit (int): limit of the search in the api
+            mode (modes.Modes): value of album, or song for now
+            lookup (bool): if true, perform a lookup search via itunes api rather than a default search
+
+        Returns:
+            Optional[List[Union[itunes_api.ItunesApiSongModel, itunes_api.ItunesApiAlbumKeys]]]: the parsed results,
+                None if an error occurred
+        """
+        key = ResponseCache.make_key(search_variable, mode, limit, lookup)
+        body = self.recent.get(key)
+        if body is not None:
+            self.recent.move_to_end(key)
+        elif self.cache is not None:
+            body = self.cache.get(key, self.lookup_ttl if lookup else self.search_ttl)
+            if body is not None:
+                logger.debug(f"Loaded itunes response from cache for {key}")
+
+        if body is None:
+            future = self.in_flight.get(key)
+            if future is None:
+                future = asyncio.ensure_future(
+                    self.fetch_and_store(key, search_variable, limit, mode, lookup)
+                )
+                self.in_flight[key] = future
+                future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+            else:
+                logger.debug(f"Waiting on the in flight itunes request for {key}")
+            # shielded, so that a cancelled caller does not cancel the others waiting
+            body = await asyncio.shield(future)
+            if body is None:
+                return None
+
+        return parse_results(json.loads(body), mode)
+
+    async def query_many(
+        self, queries: List[ItunesQuery]
+    ) -> List[
+        Optional[
+            List[Union[itunes_api.ItunesApiSongModel, itunes_api.ItunesApiAlbumKeys]]
+        ]
+    ]:
+        """Run queries concurrently, see `query_api`
+
+        Args:
+            queries (List[ItunesQuery]): the queries
+
+        Returns:
+            List[Optional[List[Union[itunes_api.ItunesApiSongModel, itunes_api.ItunesApiAlbumKeys]]]]: the results of each query
+        """
+        return await asyncio.gather(
+            *[
+                self.query_api(q.search_variable, q.limit, q.mode, lookup=q.lookup)
+                for q in queries
+            ]
+        )
+
+    async def fetch_and_store(
+        self,
+        key: str,
+        search_variable: Union[str, int],
+        limit: int,
+        mode: modes.Modes,
+        lookup: bool,
+    ) -> Optional[str]:
+        """Request the itunes api, and keep the response
+
+        Returns:
+            Optional[str]: the response body, None if an error occurred
+        """
+        loop = asyncio.get_running_loop()
+        body = await loop.run_in_executor(
+            self.executor, self.fetch, search_variable, limit, mode, lookup
+        )
+        if body is None:
+            return None
+        self.recent[key] = body
+        while len(self.recent) > self.max_recent:
+            self.recent.popitem(last=False)
+        if self.cache is not None:
+            self.cache.put(key, body)
+        return body
+
+    def fetch(
+        self,
+        search_variable: Union[str, int],
+        limit: int,
+        mode: modes.Modes,
+        lookup: bool = False,
+    ) -> Optional[str]:
+        """Request the itunes api, blocking until the throttle allows it and it responds
+
+        Returns:
+            Optional[str]: the response body, None if an error occurred
+        """
+        if not lookup:  # perform general search
+            url = self.search_url
+            params = {"term": search_variable, "entity": mode.value, "limit": limit}
+        else:  # perform lookup query by itunes id
+            url = self.lookup_url
+            params = {"id": search_variable, "entity": mode.value, "limit": limit}
+
+        try:
+            itunes_response = self.throttle.request(
+                url,
+                lambda: self.session.get(url, params=params, timeout=self.timeout),
+            )
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Could not connect to the itunes server: {e}")
+            return None
+        logger.info(f"Connected to {itunes_response.url}")
+        if itunes_response.status_code != 200:
+            logger.error(
+                "Oops. Something went wrong trying to connect to the itunes server."
+            )
+            logger.error(
+                f"Code: {itunes_response.status_code}, Body: {itunes_response.content}"
+            )
+            return None
+        return itunes_response.text
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+
+class ItunesClient:
+    """Synchronous facade over `AsyncItunesClient`, which runs on an event loop in a background
+    thread. Mirrors `songbirdcore.itunes.query_api`, so it can be used from the interactive helpers,
+    and is safe to share between threads, which all share the client's rate limit."""
+
+    def __init__(self, *args, **kwargs):
+        """
+        Args:
+            *args: the arguments of `AsyncItunesClient`
+            **kwargs: the keyword arguments of `AsyncItunesClient`
+        """
+        self.async_client = AsyncItunesClient(*args, **kwargs)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name="itunes-loop", daemon=True
+        )
+        self.thread.start()
+
+    @classmethod
+    def from_config(cls, config: settings.SongbirdCliConfig) -> "ItunesClient":
+        """Create a client from the songbirdcli config
+
+        Args:
+            config (settings.SongbirdCliConfig): the songbirdcli config
+
+        Returns:
+            ItunesClient: the client
+        """
+        cache = None
+        if config.itunes_cache_enabled and os.path.exists(config.get_data_path()):
+            cache = ResponseCache(
+                os.path.join(config.get_data_path(), "itunes_cache.sqlite"),
+                max_entries=config.itunes_cache_max_entries,
+            )
+        return cls(
+            search_url=config.itunes_search_api_base_url,
+            lookup_url=config.itunes_lookup_api_base_url,
+            cache=cache,
+            search_ttl=config.itunes_cache_ttl,
+            lookup_ttl=config.itunes_cache_lookup_ttl,
+            requests_per_minute=config.itunes_requests_per_minute,
+            max_connections=config.itunes_max_connections,
+        )
+
+    def run(self, coroutine: Coroutine[Any, Any, T]) -> T:
+        """Run a coroutine on the client's event loop, blocking until it completes
+
+        Args:
+            coroutine (Coroutine[Any, Any, T]): the coroutine
+
+        Returns:
+            T: the result of the coroutine
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def query_api(
+        self,
+        search_variable: Union[str, int],
+        limit: int,
+        mode: modes.Modes,
+        lookup: bool = False,
+    ) -> Optional[
+        List[Union[itunes_api.ItunesApiSongModel, itunes_api.ItunesApiAlbumKeys]]
+    ]:
+        """Query the itunes api, see `AsyncItunesClient.query_api`"""
+        return self.run(
+            self.async_client.query_api(search_variable, limit, mode, lookup=lookup)
+        )
+
+    def query_many(
+        self, queries: List[ItunesQuery]
+    ) -> List[
+        Optional[
+            List[Union[itunes_api.ItunesApiSongModel, itunes_api.ItunesApiAlbumKeys]]
+        ]
+    ]:
+        """Run queries concurrently, see `AsyncItunesClient.query_many`"""
+        return self.run(self.async_client.query_many(queries))
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.async_client.close()
+
+
+def parse_results(
+    itunes_json_dict: dict, mode: modes.Modes
+) -> List[Union[itunes_api.ItunesApiSongModel, itunes_api.ItunesApiAlbumKeys]]:
+    """Parse an itunes api response into songbird models, as `songbirdcore.itunes.query_api` does.
+
+    Args:
+        itunes_json_dict (dict): the decoded itunes api response
+        mode (modes.Modes): value of album, or song for now
+
+    Returns:
+        List[Union[itunes_api.ItunesApiSongModel, itunes_api.ItunesApiAlbumKeys]]: the parsed results
+    """
+    parsed_results_list = []
+    for index, search_result in enumerate(itunes_json_dict["results"]):
+        try:
+            if mode == modes.Modes.SONG:
+                result = ItunesSongModel.model_validate(search_result)
+                # will grab the year from date formatted 2016-06-01
+                result.releaseDate = search_result[result.releaseDateKey].split("-")[0]
+            elif mode == modes.Modes.ALBUM:
+                result = itunes_api.ItunesApiAlbumKeys.model_validate(search_result)
+
+            parsed_results_list.append(result)
+        except ValidationError as e:
+            logger.warning(
+                f"Skipping the display of song at index [{index}] as it could not be loaded into expected format.\n{e}"
+            )
+    return parsed_results_list
@@ -0,0 +1,294 @@
+"""
+journal.py module for recording the progress of queued songs on disk, so that
+an interrupted run can be resumed without repeating finished work
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from enum import Enum
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, ValidationError
+
+from songbirdcli import pipeline
+from songbirdcli import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Stage(Enum):
+    """enum class containing the stages a song passes through"""
+
+    SEARCHED = "searched"
+    """Specifies that every selection for the song was gathered"""
+    DOWNLOADED = "downloaded"
+    """Specifies that the song was downloaded"""
+    TAGGED = "tagged"
+    """Specifies that the song was tagged"""
+    MOVED = "moved"
+    """Specifies that the song was moved to its destination folder"""
+    UPLOADED = "uploaded"
+    """Specifies that the song was uploaded to google drive"""
+    DONE = "done"
+    """Specifies that the song was saved"""
+    SKIPPED = "skipped"
+    """Specifies that the song will not be processed"""
+    FAILED = "failed"
+    """Specifies that the song could not be prepared for processing"""
+
+
+# the order songs are processed in, used to decide which stages remain
+PROCESSING_ORDER = [
+    Stage.SEARCHED,
+    Stage.DOWNLOADED,
+    Stage.TAGGED,
+    Stage.MOVED,
+    Stage.UPLOADED,
+    Stage.DONE,
+]
+# stages after which a song requires no more work
+FINISHED_STAGES = [Stage.DONE, Stage.SKIPPED, Stage.FAILED]
+
+
+class JournalRecord(BaseModel):
+    """A stage transition of a song, as written to the journal"""
+
+    job_id: str
+    """specifies the id of the song's job"""
+    stage: Stage
+    """specifies the stage the song reached"""
+    time: float
+    """specifies when the stage was reached, in seconds since the epoch"""
+    song_name: str = ""
+    """specifies the name of the song"""
+    entry: Optional[int] = None
+    """specifies the index of the manifest entry the song came from, in batch mode"""
+    job: Optional[pipeline.SongJob] = None
+    """specifies the selections gathered for the song, recorded once searched"""
+    path: Optional[str] = None
+    """specifies where the song's file is, once downloaded"""
+    message: str = ""
+    """specifies details about the stage"""
+
+
+class Journal:
+    """An append only json lines file of stage transitions. Every record is flushed
+    to disk as it is written, and the latest state of each song is kept in memory.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): path to the journal file, created if missing
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.records: Dict[str, JournalRecord] = {}
+        if os.path.exists(path):
+            self._load()
+        self.file = open(path, "a", encoding="utf-8")
+        if self.file.tell() > 0:
+            # terminate a line left incomplete by a crash, so the next record is readable
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self.file.write("\n")
+
+    @classmethod
+    def from_config(
+        cls, config: settings.SongbirdCliConfig, name: str = "journal"
+    ) -> "Journal":
+        """Open a journal inside of the data path
+
+        Args:
+            config (settings.SongbirdCliConfig): the songbirdcli config
+            name (str, optional): the name of the journal file, excluding format. Defaults to "journal".
+
+        Returns:
+            Journal: the journal
+        """
+        return cls(os.path.join(config.get_data_path(), f"{name}.jsonl"))
+
+    def record(
+        self,
+        job_id: str,
+        stage: Stage,
+        song_name: str = "",
+        entry: Optional[int] = None,
+        job: Optional[pipeline.SongJob] = None,
+        path: Optional[str] = None,
+        message: str = "",
+    ):
+        """Append a stage transition to the journal
+
+        Args:
+            job_id (str): the id of the song's job
+            stage (Stage): the stage the song reached
+            song_name (str, optional): the name of the song. Defaults to "".
+            entry (Optional[int], optional): the index of the manifest entry the song came from. Defaults to None.
+            job (Optional[pipeline.SongJob], optional): the selections gathered for the song. Defaults to None.
+            path (Optional[str], optional): where the song's file is. Defaults to None.
+            message (str, optional): details about the stage. Defaults to "".
+
+        Returns:
+            JournalRecord: the record appended
+        """
+        record = JournalRecord(
+            job_id=job_id,
+            stage=stage,
+            time=time.time(),
+            song_name=song_name,
+            entry=entry,
+            job=job,
+            path=path,
+            message=message,
+        )
+        with self.lock:
+            self.file.write(record.model_dump_json(exclude_defaults=True) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self._merge(record.model_copy())
+        return record
+
+    def record_job(
+        self,
+        job: pipeline.SongJob,
+        stage: Stage,
+        entry: Optional[int] = None,
+        path: Optional[str] = None,
+        message: str = "",
+    ):
+        """Append a stage transition of a queued job to the journal. The job's selections
+        are included when it is searched, so that it can be resumed without prompting.
+
+        Args:
+            job (pipeline.SongJob): the job
+            stage (Stage): the stage the job reached
+            entry (Optional[int], optional): the index of the manifest entry the job came from. Defaults to None.
+            path (Optional[str], optional): where the song's file is. Defaults to None.
+            message (str, optional): details about the stage. Defaults to "".
+        """
+        self.record(
+            job.job_id,
+            stage,
+            song_name=job.song_name,
+            entry=entry,
+            job=job if stage == Stage.SEARCHED else None,
+            path=path,
+            message=message,
+        )
+
+    def get(self, job_id: str) -> Optional[JournalRecord]:
+        """Get the latest state of a song
+
+        Args:
+            job_id (str): the id of the song's job
+
+        Returns:
+            Optional[JournalRecord]: the latest state, None if the song was never recorded
+        """
+        with self.lock:
+            return self.records.get(job_id)
+
+    def pending(self) -> List[JournalRecord]:
+        """Get the songs that were searched but never finished
+
+        Returns:
+            List[JournalRecord]: the latest state of each unfinished song, in the order they were searched
+        """
+        with self.lock:
+            return [
+                record
+                for record in self.records.values()
+                if record.stage not in FINISHED_STAGES and record.job is not None
+            ]
+
+    def compact(self, keep_finished: bool = False):
+        """Rewrite the journal with a single record per song, holding its latest state.
+
+        Args:
+            keep_finished (bool, optional): whether to keep the songs that are finished. Defaults to False.
+        """
+        with self.lock:
+            if not keep_finished:
+                self.records = {
+                    job_id: record
+                    for job_id, record in self.records.items()
+                    if record.stage not in FINISHED_STAGES
+                }
+            self._rewrite()
+
+    def clear(self):
+        """Drop every record, starting a fresh journal"""
+        with self.lock:
+            self.records = {}
+            self._rewrite()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    def _load(self):
+        """Load the latest state of each song from the journal file"""
+        with open(self.path, "r", encoding="utf-8") as f:
+            for idx, line in enumerate(f):
+                if line.strip() == "":
+                    continue
+                try:
+                    record = JournalRecord.model_validate(json.loads(line))
+                except (ValueError, ValidationError):
+                    # the last line is incomplete if we were killed while writing it
+                    logger.warning(f"Skipping unreadable journal line {idx + 1}.")
+                    continue
+                self._merge(record)
+
+    def _merge(self, record: JournalRecord):
+        """Merge a record into the latest state of its song"""
+        current = self.records.get(record.job_id)
+        if current is None:
+            self.records[record.job_id] = record
+            return
+        current.stage = record.stage
+        current.time = record.time
+        current.message = record.message
+        if record.path is not None:
+            current.path = record.path
+        if record.job is not None:
+            current.job = record.job
+
+    def _rewrite(self):
+        """Atomically replace the journal file with the records held in memory"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in self.records.values():
+                f.write(record.model_dump_json(exclude_defaults=True) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if hasattr(self, "file"):
+            self.file.close()
+        os.replace(tmp_path, self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+
+
+def remaining_stages(record: Optional[JournalRecord]) -> List[Stage]:
+    """Get the processing stages a song still has to pass through. Songs whose
+    file went missing since it was recorded restart from the download.
+
+    Args:
+        record (Optional[JournalRecord]): the latest state of the song, None if never recorded
+
+    Returns:
+        List[Stage]: the remaining stages, in processing order
+    """
+    if record is not None and record.stage in FINISHED_STAGES:
+        return []
+    if record is None or record.stage not in PROCESSING_ORDER:
+        return PROCESSING_ORDER[1:]
+    if record.stage != Stage.SEARCHED and (
+        record.path is None or not os.path.exists(record.path)
+    ):
+        return PROCESSING_ORDER[1:]
+    return PROCESSING_ORDER[PROCESSING_ORDER.index(record.stage) + 1 :]
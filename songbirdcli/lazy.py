@@ -0,0 +1,54 @@
+"""
+lazy.py module for deferring the import of heavy dependencies, such as yt-dlp
+and the google api client, until a feature first uses them
+"""
+
+import importlib
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Stands in for a module, importing it the first time one of its attributes is used.
+    Attributes are read from the imported module on every access, so that patching the
+    module itself, e.g. in tests, is seen through the stand in.
+    """
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name (str): the absolute name of the module, e.g. songbirdcore.youtube
+        """
+        super().__init__(name)
+
+    def load(self) -> types.ModuleType:
+        """Import the module, a no-op once imported
+
+        Returns:
+            types.ModuleType: the module
+        """
+        # the import system serializes imports of the same module between threads
+        return importlib.import_module(self.__name__)
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
+
+    def __setattr__(self, attr: str, value):
+        setattr(self.load(), attr, value)
+
+    def __delattr__(self, attr: str):
+        delattr(self.load(), attr)
+
+    def __dir__(self):
+        return dir(self.load())
+
+
+def load(name: str) -> LazyModule:
+    """Get a module that is imported the first time it is used
+
+    Args:
+        name (str): the absolute name of the module
+
+    Returns:
+        LazyModule: the stand in for the module
+    """
+    return LazyModule(name)
@@ -0,0 +1,630 @@
+"""
+library.py module for indexing the songs already saved locally, so that
+similar songs, and other copies of the same recording, can be found without
+walking every folder
+"""
+
+import bisect
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from songbirdcli import fingerprint
+from songbirdcli import lazy
+from songbirdcli import settings
+from songbirdcore import common
+
+logger = logging.getLogger(__name__)
+
+mutagen = lazy.load("mutagen")
+easyid3 = lazy.load("mutagen.easyid3")
+
+# folders modified this recently are rescanned on the next refresh, as further
+# changes within the same mtime tick would otherwise go unnoticed
+RACY_WINDOW = 2.0
+# bumped whenever the tables change, rebuilding the index from the files on disk
+SCHEMA_VERSION = 4
+# files fingerprinted at once in the background, each decoded by an ffmpeg process
+FINGERPRINT_WORKERS = 4
+# files fingerprinted between writes to the index, and seconds between progress logs
+FINGERPRINT_BATCH = 16
+FINGERPRINT_LOG_INTERVAL = 10.0
+
+
+class LibraryIndex:
+    """An sqlite index of the files within a set of library roots.
+
+    Each root is indexed to a fixed depth: files directly inside of the dump and
+    gdrive folders, and files at artist/album/file inside of the itunes library.
+    Folders are only rescanned when their mtime changes, which happens whenever
+    a file is added to, renamed within or removed from them. Search keys are also
+    held in memory, so that a search is a single substring scan.
+
+    Each file is also described by a recording key, from its title and artist tags,
+    and an acoustic fingerprint of its audio, which ignores the tags and survives re-encoding.
+    Both are computed once per file and held in memory, the recording keys as a hash table
+    and the fingerprints as integers, so that finding another copy of a recording is a
+    single lookup, or a few integer operations per file. A refresh only reads the tags,
+    leaving the fingerprints of new files to be filled in by a background thread, as
+    each means decoding the file.
+    """
+
+    def __init__(self, db_path: str, roots: Dict[str, int]):
+        """
+        Args:
+            db_path (str): path to the sqlite database file, created if missing
+            roots (Dict[str, int]): the folders to index, mapped to the depth their files are found at
+        """
+        self.db_path = db_path
+        self.roots = roots
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.conn.executescript("""
+                DROP TABLE IF EXISTS dirs;
+                DROP TABLE IF EXISTS files;
+                """)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY,
+                parent TEXT,
+                root TEXT NOT NULL,
+                mtime REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                dir TEXT NOT NULL,
+                root TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                title TEXT NOT NULL,
+                artist TEXT NOT NULL,
+                search_key TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                recording_key TEXT NOT NULL,
+                fingerprint TEXT
+            );
+            CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+            CREATE INDEX IF NOT EXISTS files_root ON files (root);
+            """)
+        self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.commit()
+        # in memory view of the dirs table, path -> mtime and parent -> children
+        self.dir_mtimes: Dict[str, float] = {}
+        self.dir_children: Dict[str, List[str]] = {}
+        # in memory view of the search keys, root -> path -> search key
+        self.keys: Dict[str, Dict[str, str]] = {root: {} for root in roots}
+        self.search_blobs: Dict[str, Tuple[str, List[int], List[str]]] = {}
+        # in memory lookups of the recordings, root -> recording key -> paths,
+        # and root -> path -> fingerprint
+        self.recordings: Dict[str, Dict[str, Set[str]]] = {root: {} for root in roots}
+        self.fingerprints: Dict[str, Dict[str, fingerprint.Fingerprint]] = {
+            root: {} for root in roots
+        }
+        self.loaded = False
+        # while a watcher keeps the index live, a refresh only rescans the folders it reported changed
+        self.live = False
+        self.changed: Set[str] = set()
+        self.stale = True
+        self.changed_lock = threading.Lock()
+        # called with each folder as a refresh visits it, before it is scanned
+        self.on_dir_visited: Optional[Callable[[str], None]] = None
+        # fills in the fingerprints of files indexed without one, while any remain
+        self.backfill_thread: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+
+    @classmethod
+    def from_config(cls, config: settings.SongbirdCliConfig) -> "LibraryIndex":
+        """Create an index over the folders enabled in the songbirdcli config
+
+        Args:
+            config (settings.SongbirdCliConfig): the songbirdcli config
+
+        Returns:
+            LibraryIndex: the index
+        """
+        roots = {config.get_local_folder_path(): 0}
+        if config.itunes_enabled:
+            roots[config.get_itunes_lib_path()] = 2
+        if config.gdrive_enabled:
+            roots[config.get_gdrive_folder_path()] = 0
+        return cls(os.path.join(config.get_data_path(), "library.sqlite"), roots)
+
+    def refresh(self, full: bool = False):
+        """Bring the index up to date with the files on disk, rescanning only
+        the folders that changed since the last refresh. While live, only the folders
+        marked changed are rescanned, rather than checking the mtime of every folder.
+
+        Args:
+            full (bool, optional): whether to check every folder, even while live. Defaults to False.
+        """
+        with self.lock:
+            if not self.loaded:
+                self._load()
+            with self.changed_lock:
+                changed, self.changed = self.changed, set()
+                stale, self.stale = self.stale, False
+            if self.live and not (full or stale):
+                # parents sort before their sub folders
+                for path in sorted(changed):
+                    self._refresh_changed(path)
+            else:
+                for root, depth in self.roots.items():
+                    if not os.path.isdir(root):
+                        self._remove_dir(root)
+                        continue
+                    self._refresh_dir(root, None, root, 0, depth)
+            self.conn.commit()
+            self._start_backfill()
+
+    def mark_changed(self, path: Optional[str] = None):
+        """Mark a folder to be rescanned on the next refresh, whatever its mtime.
+        Safe to call from any thread, including while a refresh is running.
+
+        Args:
+            path (Optional[str], optional): the folder. Defaults to None, checking every folder.
+        """
+        with self.changed_lock:
+            if path is None:
+                self.stale = True
+            else:
+                self.changed.add(path)
+
+    def search(self, root: str, search_term: str) -> List[str]:
+        """Find the files within a root whose names contain the search term.
+        Matching is case insensitive. Inside of the itunes library the album
+        and artist folder names are matched as well, as in `songbirdcore.itunes.itunes_lib_search`.
+
+        Args:
+            root (str): the root to search within
+            search_term (str): the term to search for
+
+        Returns:
+            List[str]: sorted list of the paths found
+        """
+        term = normalize(search_term).replace("\n", " ")
+        with self.lock:
+            if root not in self.search_blobs:
+                self._build_search_blob(root)
+            blob, offsets, paths = self.search_blobs[root]
+
+        matches = []
+        if len(paths) == 0:
+            return matches
+        idx = blob.find(term)
+        while idx != -1:
+            line = bisect.bisect_right(offsets, idx) - 1
+            matches.append(paths[line])
+            # continue from the start of the next key
+            if line + 1 == len(offsets):
+                break
+            idx = blob.find(term, offsets[line + 1])
+        matches.sort()
+        return matches
+
+    def find_recording(self, root: str, title: str, artist: str) -> List[str]:
+        """Find the files within a root holding the recording with the given title and artist,
+        whatever their file names. Files without an artist match on their title alone.
+
+        Args:
+            root (str): the root to search within
+            title (str): the title of the recording, e.g. an itunes trackName
+            artist (str): the artist of the recording, e.g. an itunes artistName
+
+        Returns:
+            List[str]: sorted list of the paths found
+        """
+        with self.lock:
+            recordings = self.recordings.get(root, {})
+            matches = recordings.get(recording_key(title, artist), set()) | (
+                recordings.get(recording_key(title, ""), set())
+            )
+        return sorted(matches)
+
+    def find_audio(
+        self, root: str, file_path: str, threshold: float = fingerprint.THRESHOLD
+    ) -> List[str]:
+        """Find the files within a root holding the same recording as a file, such as
+        a fresh download, by their acoustic fingerprints. Copies in another format or
+        at another bitrate match, as do files that differ only in their tags.
+
+        Args:
+            root (str): the root to search within
+            file_path (str): path to the file to compare, which need not be indexed
+            threshold (float, optional): the similarity the fingerprints must reach. Defaults to fingerprint.THRESHOLD.
+
+        Returns:
+            List[str]: list of the paths found, most similar first, excluding the file itself.
+                Files yet to be fingerprinted in the background are not found.
+        """
+        fp = fingerprint.from_hex(fingerprint.fingerprint(file_path))
+        if fp is None:
+            return []
+        with self.lock:
+            candidates = dict(self.fingerprints.get(root, {}))
+        candidates.pop(file_path, None)
+        matches = fingerprint.find_similar(fp, candidates, threshold)
+        return sorted(matches, key=lambda path: (-matches[path], path))
+
+    def wait_for_fingerprints(self, timeout: Optional[float] = None) -> bool:
+        """Block until every file indexed so far has been fingerprinted
+
+        Args:
+            timeout (Optional[float], optional): seconds to wait at most. Defaults to None, waiting indefinitely.
+
+        Returns:
+            bool: True if no fingerprints remain to be computed
+        """
+        thread = self.backfill_thread
+        if thread is not None:
+            thread.join(timeout)
+        return self.backfill_thread is None
+
+    def close(self):
+        self.stopped.set()
+        thread = self.backfill_thread
+        if thread is not None:
+            thread.join()
+        with self.lock:
+            self.conn.close()
+
+    def _start_backfill(self):
+        """Start fingerprinting the files indexed without a fingerprint in the background,
+        unless already running. Expects self.lock to be held."""
+        if self.backfill_thread is not None or self.stopped.is_set():
+            return
+        pending = self._count_pending()
+        if pending == 0:
+            return
+        logger.info(
+            f"Fingerprinting {pending} library files in the background, to find saved copies of recordings."
+        )
+        self.backfill_thread = threading.Thread(
+            target=self._backfill, name="library-fingerprint", daemon=True
+        )
+        self.backfill_thread.start()
+
+    def _count_pending(self) -> int:
+        """Count the files yet to be fingerprinted. Expects self.lock to be held."""
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM files WHERE fingerprint IS NULL"
+        ).fetchone()[0]
+
+    def _backfill(self):
+        """Fingerprint the files indexed without a fingerprint, a batch at a time,
+        until none remain. Files changed while being fingerprinted are left for
+        the next batch, as their row no longer matches."""
+        done = 0
+        logged = time.monotonic()
+        with ThreadPoolExecutor(
+            max_workers=FINGERPRINT_WORKERS, thread_name_prefix="fingerprint"
+        ) as executor:
+            while not self.stopped.is_set():
+                with self.lock:
+                    rows = self.conn.execute(
+                        "SELECT path, root, size, mtime FROM files WHERE fingerprint IS NULL LIMIT ?",
+                        (FINGERPRINT_BATCH,),
+                    ).fetchall()
+                    if len(rows) == 0:
+                        # cleared under the lock, so a refresh adding files starts a new backfill
+                        self.backfill_thread = None
+                        logger.info(f"Fingerprinted {done} library files.")
+                        return
+                fps = list(executor.map(fingerprint.fingerprint, [r[0] for r in rows]))
+                with self.lock:
+                    if self.stopped.is_set():
+                        return
+                    for (path, root, size, mtime), fp in zip(rows, fps):
+                        cursor = self.conn.execute(
+                            "UPDATE files SET fingerprint = ? WHERE path = ? AND size = ? AND mtime = ?",
+                            (fp, path, size, mtime),
+                        )
+                        if cursor.rowcount > 0:
+                            self._add_fingerprint(root, path, fp)
+                    self.conn.commit()
+                    done += len(rows)
+                    if time.monotonic() - logged >= FINGERPRINT_LOG_INTERVAL:
+                        logged = time.monotonic()
+                        logger.info(
+                            f"Fingerprinted {done} library files, {self._count_pending()} to go."
+                        )
+
+    def _load(self):
+        """Load the persisted index into memory"""
+        for path, parent, mtime in self.conn.execute(
+            "SELECT path, parent, mtime FROM dirs"
+        ):
+            self.dir_mtimes[path] = mtime
+            self.dir_children.setdefault(parent, []).append(path)
+        for root, path, search_key, key, fp in self.conn.execute(
+            "SELECT root, path, search_key, recording_key, fingerprint FROM files"
+        ):
+            if root in self.keys:
+                self.keys[root][path] = search_key
+                self._add_recording(root, path, key, fp)
+        self.loaded = True
+
+    def _add_recording(self, root: str, path: str, key: str, fp: Optional[str]):
+        """Add a file to the in memory lookups of the recordings"""
+        self.recordings.setdefault(root, {}).setdefault(key, set()).add(path)
+        if fp is not None:
+            self._add_fingerprint(root, path, fp)
+
+    def _add_fingerprint(self, root: str, path: str, fp: str):
+        """Add a file to the in memory lookup of the fingerprints"""
+        parsed = fingerprint.from_hex(fp)
+        if parsed is not None:
+            self.fingerprints.setdefault(root, {})[path] = parsed
+
+    def _remove_recording(self, root: str, path: str, key: str):
+        """Remove a file from the in memory lookups of the recordings"""
+        self.fingerprints.get(root, {}).pop(path, None)
+        paths = self.recordings.get(root, {}).get(key)
+        if paths is None:
+            return
+        paths.discard(path)
+        if len(paths) == 0:
+            del self.recordings[root][key]
+
+    def _build_search_blob(self, root: str):
+        """Join the search keys of a root into one newline separated string, along
+        with the offset at which each key starts, so a search is one substring scan.
+        """
+        paths = list(self.keys.get(root, {}).keys())
+        keys = [self.keys[root][path] for path in paths]
+        offsets = []
+        position = 0
+        for key in keys:
+            offsets.append(position)
+            position += len(key) + 1
+        self.search_blobs[root] = ("\n".join(keys), offsets, paths)
+
+    def _refresh_changed(self, path: str):
+        """Rescan a folder marked changed, along with any sub folders new to the index"""
+        for root, depth in self.roots.items():
+            if path == root or path.startswith(root + os.sep):
+                break
+        else:
+            return
+        level = 0
+        if path != root:
+            level = len(os.path.relpath(path, root).split(os.sep))
+        parent = os.path.dirname(path) if level > 0 else None
+        if level > depth or (level > 0 and parent not in self.dir_mtimes):
+            # folders new to the index are found when their parent is rescanned
+            return
+        self._refresh_dir(path, parent, root, level, depth, force=True)
+
+    def _refresh_dir(
+        self,
+        path: str,
+        parent: Optional[str],
+        root: str,
+        level: int,
+        depth: int,
+        force: bool = False,
+    ):
+        """Refresh a folder, recursing into its sub folders up to depth. A forced
+        refresh rescans the folder whatever its mtime, and only recurses into
+        sub folders new to the index, as the rest are marked changed themselves.
+        """
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            self._remove_dir(path)
+            return
+        if self.on_dir_visited is not None:
+            self.on_dir_visited(path)
+
+        if not force and self.dir_mtimes.get(path) == mtime:
+            subdirs = self.dir_children.get(path, [])
+        else:
+            subdirs = self._scan_dir(path, root, level, depth)
+            if time.time() - mtime < RACY_WINDOW:
+                mtime = -1
+            if path not in self.dir_mtimes:
+                self.dir_children.setdefault(parent, []).append(path)
+            self.dir_mtimes[path] = mtime
+            self.conn.execute(
+                "INSERT OR REPLACE INTO dirs (path, parent, root, mtime) VALUES (?, ?, ?, ?)",
+                (path, parent, root, mtime),
+            )
+
+        for subdir in list(subdirs):
+            if force and subdir in self.dir_mtimes:
+                continue
+            self._refresh_dir(subdir, path, root, level + 1, depth)
+
+    def _scan_dir(self, path: str, root: str, level: int, depth: int) -> List[str]:
+        """List a folder, updating the files indexed within it and dropping
+        any sub folders that no longer exist.
+
+        Returns:
+            List[str]: the sub folders to recurse into
+        """
+        subdirs = []
+        files = []
+        try:
+            entries = list(os.scandir(path))
+        except OSError as e:
+            logger.warning(f"Could not index {path}: {e}")
+            entries = []
+        for entry in entries:
+            # mimic glob, which skips hidden files
+            if entry.name.startswith("."):
+                continue
+            try:
+                if level < depth and entry.is_dir():
+                    subdirs.append(entry.path)
+                elif level == depth and entry.is_file():
+                    stat = entry.stat()
+                    files.append((entry.path, stat.st_size, stat.st_mtime))
+            except OSError:
+                continue
+
+        # files left unchanged keep their recording, rather than reading their tags and audio again.
+        # new files are left for the backfill to fingerprint, see `_start_backfill`
+        recorded = {
+            file_path: (size, mtime, key, fp)
+            for file_path, size, mtime, key, fp in self.conn.execute(
+                "SELECT path, size, mtime, recording_key, fingerprint FROM files WHERE dir = ?",
+                (path,),
+            )
+        }
+        self._remove_files(path)
+        described = [
+            (file_path, size, mtime) + describe(file_path, root, depth)
+            for file_path, size, mtime in files
+        ]
+        rows = []
+        for file_path, size, mtime, filename, title, artist, search_key in described:
+            previous = recorded.get(file_path)
+            if previous is not None and previous[:2] == (size, mtime):
+                key, fp = previous[2:]
+            else:
+                key, fp = identify(file_path, title, artist), None
+            rows.append(
+                (
+                    file_path,
+                    path,
+                    root,
+                    filename,
+                    title,
+                    artist,
+                    search_key,
+                    size,
+                    mtime,
+                    key,
+                    fp,
+                )
+            )
+        self.conn.executemany(
+            """INSERT OR REPLACE INTO files
+                (path, dir, root, filename, title, artist, search_key, size, mtime, recording_key, fingerprint)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            rows,
+        )
+        for row in rows:
+            self.keys.setdefault(root, {})[row[0]] = row[6]
+            self._add_recording(root, row[0], row[9], row[10])
+        self.search_blobs.pop(root, None)
+
+        for removed in set(self.dir_children.get(path, [])) - set(subdirs):
+            self._remove_dir(removed)
+        return subdirs
+
+    def _remove_files(self, path: str):
+        """Drop the files indexed directly inside of a folder"""
+        for file_path, root, key in self.conn.execute(
+            "SELECT path, root, recording_key FROM files WHERE dir = ?",
+            (path,),
+        ).fetchall():
+            self.keys.get(root, {}).pop(file_path, None)
+            self._remove_recording(root, file_path, key)
+            self.search_blobs.pop(root, None)
+        self.conn.execute("DELETE FROM files WHERE dir = ?", (path,))
+
+    def _remove_dir(self, path: str):
+        """Drop a folder and everything indexed beneath it"""
+        for child in list(self.dir_children.get(path, [])):
+            self._remove_dir(child)
+        self._remove_files(path)
+        self.conn.execute("DELETE FROM dirs WHERE path = ?", (path,))
+        self.dir_children.pop(path, None)
+        if self.dir_mtimes.pop(path, None) is not None:
+            for children in self.dir_children.values():
+                if path in children:
+                    children.remove(path)
+                    break
+
+
+def normalize(value: str) -> str:
+    """Normalize a name for matching, as `songbirdcore.itunes.itunes_lib_search` does
+
+    Args:
+        value (str): the name to normalize
+
+    Returns:
+        str: the lower case name, stripped of illegal characters
+    """
+    return common.remove_illegal_characters(value.lower())
+
+
+def describe(file_path: str, root: str, depth: int) -> Tuple[str, str, str, str]:
+    """Derive the indexed names for a file. Files nested as artist/album/file have
+    their artist and album taken from the folder names.
+
+    Args:
+        file_path (str): path to the file
+        root (str): the root the file was found in
+        depth (int): the depth of files within the root
+
+    Returns:
+        Tuple[str, str, str, str]: the filename, normalized title, normalized artist and search key
+    """
+    filename = os.path.basename(file_path)
+    title = normalize(os.path.splitext(filename)[0])
+    if depth < 2:
+        return filename, title, "", normalize(filename).replace("\n", " ")
+    parts = os.path.relpath(file_path, root).split(os.sep)
+    album = normalize(parts[-2])
+    artist = normalize(parts[-3])
+    search_key = normalize(filename) + " " + album + " " + artist
+    return filename, title, artist, search_key.replace("\n", " ")
+
+
+def recording_key(title: str, artist: str) -> str:
+    """Derive the key a recording is looked up by. Case, punctuation and spacing are
+    ignored, so that e.g. "Movin' Out" and "movin out" share a key.
+
+    Args:
+        title (str): the title of the recording
+        artist (str): the artist of the recording, empty if unknown
+
+    Returns:
+        str: the key
+    """
+
+    def simplify(value: str) -> str:
+        return " ".join(re.sub(r"[^\w\s]", "", value.lower()).split())
+
+    return simplify(title) + "\n" + simplify(artist)
+
+
+def identify(file_path: str, title: str, artist: str) -> str:
+    """Identify the recording held by a file, from its title and artist tags.
+    Files without tags fall back to the title and artist derived from their path,
+    less any leading track number.
+
+    Args:
+        file_path (str): path to the file
+        title (str): the title derived from the file's name
+        artist (str): the artist derived from the file's folders, empty if unknown
+
+    Returns:
+        str: the recording key
+    """
+    tags = {}
+    try:
+        if file_path.lower().endswith(".mp3"):
+            # reads the id3 tag alone, without parsing the audio frames
+            tags = easyid3.EasyID3(file_path)
+        else:
+            audio = mutagen.File(file_path, easy=True)
+            if audio is not None and audio.tags is not None:
+                tags = audio.tags
+    except (mutagen.MutagenError, OSError, ValueError) as e:
+        logger.debug(f"Could not read the tags of {file_path}: {e}")
+    tag_title = (tags.get("title") or [""])[0]
+    tag_artist = (tags.get("artist") or [""])[0]
+    if tag_title == "":
+        tag_title = re.sub(r"^\d+[\s.-]+", "", title)
+    if tag_artist == "":
+        tag_artist = artist
+    return recording_key(tag_title, tag_artist)
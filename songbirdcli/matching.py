@@ -0,0 +1,189 @@
+"""
+matching.py module for matching youtube videos to the itunes properties of a song,
+so that a video can be picked without asking the user
+"""
+
+import functools
+import logging
+import re
+import unicodedata
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from songbirdcli import render
+from songbirdcore.models import itunes_api
+
+logger = logging.getLogger(__name__)
+
+# the difference in seconds at which a video's length stops counting towards a match
+DURATION_TOLERANCE = 30
+# the highest score of a video whose length is unknown, as its title alone may mislead
+UNKNOWN_DURATION_SCORE = 0.8
+# words marking a different version of a song, mapped to the fraction of the score they cost
+PENALTIES = {
+    "live": 0.3,
+    "cover": 0.4,
+    "remix": 0.35,
+    "karaoke": 0.5,
+    "instrumental": 0.4,
+    "nightcore": 0.5,
+    "slowed": 0.35,
+    "sped": 0.35,
+    "reaction": 0.5,
+}
+# words youtube titles commonly add to a song's title, without naming a different recording
+NOISE_WORDS = frozenset(
+    [
+        "official",
+        "video",
+        "audio",
+        "music",
+        "lyric",
+        "lyrics",
+        "hd",
+        "hq",
+        "4k",
+        "remastered",
+        "remaster",
+        "visualizer",
+        "ft",
+        "feat",
+        "topic",
+        "vevo",
+    ]
+)
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize(text: str) -> str:
+    """Lowercase text and strip its accents and punctuation. Cached, as the same
+    titles are scored against each search run for a song.
+
+    Args:
+        text (str): the text
+
+    Returns:
+        str: the normalized text, with words separated by single spaces
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return " ".join(re.findall(r"\w+", text))
+
+
+def get_tokens(text: str) -> FrozenSet[str]:
+    """Get the set of normalized words in text"""
+    return frozenset(normalize(text).split())
+
+
+def get_coverage(tokens: FrozenSet[str], other: FrozenSet[str]) -> float:
+    """Get the fraction of tokens also found in other, 1 if there are no tokens"""
+    if len(tokens) == 0:
+        return 1.0
+    return len(tokens & other) / len(tokens)
+
+
+def get_song_duration(song: itunes_api.ItunesApiSongModel) -> Optional[float]:
+    """Get the length of a song in seconds, if itunes provided it"""
+    millis = getattr(song, "trackTimeMillis", None)
+    if not millis:
+        return None
+    return millis / 1000
+
+
+class Scorer:
+    """Scores youtube videos against the itunes properties of a song. Everything derived
+    from the song is computed once up front, so that each candidate costs a handful of
+    set operations and hundreds of candidates can be scored per song.
+    """
+
+    def __init__(self, song: itunes_api.ItunesApiSongModel):
+        """
+        Args:
+            song (itunes_api.ItunesApiSongModel): the itunes properties of the song
+        """
+        self.title_tokens = get_tokens(song.trackName)
+        self.artist_tokens = get_tokens(song.artistName)
+        self.expected_tokens = self.title_tokens | self.artist_tokens
+        # channels often run the artist's name together, e.g. "DollyPartonVEVO"
+        self.artist_compact = normalize(song.artistName).replace(" ", "")
+        self.duration = get_song_duration(song)
+        # versions the song itself is named as, e.g. "Jolene (Live)", are not penalized
+        named = self.title_tokens | get_tokens(song.collectionName)
+        self.penalties: Dict[str, float] = {
+            word: penalty for word, penalty in PENALTIES.items() if word not in named
+        }
+
+    def score(self, videos: List[render.Video]) -> List[float]:
+        """Score a batch of videos
+
+        Args:
+            videos (List[render.Video]): the videos found by a youtube search
+
+        Returns:
+            List[float]: the score of each video, from 0 for no match to 1 for a certain match
+        """
+        return [self.score_video(video) for video in videos]
+
+    def score_video(self, video: render.Video) -> float:
+        """Score a single video, see `score`"""
+        video_tokens = get_tokens(video.title)
+        channel_tokens = get_tokens(video.channel)
+
+        # how much of the song's title the video names, and how little else it names
+        coverage = get_coverage(self.title_tokens, video_tokens)
+        extra_tokens = video_tokens - NOISE_WORDS
+        precision = get_coverage(extra_tokens, self.expected_tokens)
+        title = 0.8 * coverage + 0.2 * precision
+
+        artist = get_coverage(self.artist_tokens, video_tokens | channel_tokens)
+        if self.artist_compact and self.artist_compact in normalize(
+            video.channel
+        ).replace(" ", ""):
+            artist = 1.0
+
+        score = 0.6 * title + 0.4 * artist
+        for word, penalty in self.penalties.items():
+            if word in video_tokens:
+                score *= 1 - penalty
+
+        if self.duration is None or video.duration is None:
+            return score * UNKNOWN_DURATION_SCORE
+        difference = abs(self.duration - video.duration)
+        duration = max(0.0, 1 - difference / DURATION_TOLERANCE)
+        return 0.7 * score + 0.3 * duration
+
+
+def score_videos(
+    song: itunes_api.ItunesApiSongModel, videos: List[render.Video]
+) -> List[float]:
+    """Score how likely each video is to be the recording of a song
+
+    Args:
+        song (itunes_api.ItunesApiSongModel): the itunes properties of the song
+        videos (List[render.Video]): the videos found by a youtube search
+
+    Returns:
+        List[float]: the score of each video, from 0 for no match to 1 for a certain match
+    """
+    return Scorer(song).score(videos)
+
+
+def best_match(
+    song: itunes_api.ItunesApiSongModel, videos: Optional[List[render.Video]]
+) -> Tuple[Optional[render.Video], float]:
+    """Find the video most likely to be the recording of a song
+
+    Args:
+        song (itunes_api.ItunesApiSongModel): the itunes properties of the song
+        videos (Optional[List[render.Video]]): the videos found by a youtube search
+
+    Returns:
+        Tuple[Optional[render.Video], float]: the best video and its score, None, 0 if there are no videos
+    """
+    if not videos:
+        return None, 0.0
+    scores = score_videos(song, videos)
+    best_idx = max(range(len(videos)), key=lambda idx: scores[idx])
+    logger.debug(
+        f"Matched {song.trackName} to {videos[best_idx].title} ({scores[best_idx]:.2f})"
+    )
+    return videos[best_idx], scores[best_idx]
@@ -0,0 +1,174 @@
+"""
+names.py module for giving saved songs unique file names, without overwriting a
+song saved under the same name by another worker or program
+"""
+
+import logging
+import os
+import shutil
+import threading
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class NameAllocator:
+    """Allocates unique file names within folders. Each folder is listed once, and the
+    names taken within it are kept in memory along with the next duplicate number to try
+    for each name, so finding a free name does not probe the disk for every candidate.
+    Names handed out but not yet used are reserved, so concurrent workers never share one.
+
+    Duplicates are named with a key and a number, e.g. song.mp3, song_dup.mp3, song_dup2.mp3.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # folder -> the names found in it, or used since it was listed
+        self.existing: Dict[str, Set[str]] = {}
+        # paths handed out, but not yet used
+        self.reserved: Set[str] = set()
+        # path of a name -> the next duplicate number to try for it
+        self.next_dup: Dict[str, int] = {}
+
+    def reserve(self, folder: str, name: str, dup_key: str = "_dup") -> str:
+        """Reserve a free file name within a folder, until `release` is called
+
+        Args:
+            folder (str): the folder
+            name (str): the file name wanted, including format
+            dup_key (str, optional): the key for naming duplicates. Defaults to "_dup".
+
+        Returns:
+            str: the path reserved
+        """
+        stem, ext = os.path.splitext(name)
+        base = os.path.join(folder, name)
+        with self.lock:
+            if folder not in self.existing:
+                self.existing[folder] = list_names(folder)
+            candidate = name
+            if not self._is_free(folder, name):
+                n = self.next_dup.get(base, 1)
+                while not self._is_free(folder, dup_name(stem, ext, dup_key, n)):
+                    n += 1
+                self.next_dup[base] = n + 1
+                candidate = dup_name(stem, ext, dup_key, n)
+            path = os.path.join(folder, candidate)
+            self.reserved.add(path)
+            return path
+
+    def release(self, path: str, used: bool = False):
+        """Release a reserved path
+
+        Args:
+            path (str): the path, as returned by `reserve`
+            used (bool, optional): whether a file now exists at the path. Defaults to False.
+        """
+        with self.lock:
+            self.reserved.discard(path)
+            folder, name = os.path.split(path)
+            if used and folder in self.existing:
+                self.existing[folder].add(name)
+
+    def publish(
+        self, src_path: str, folder: str, name: str, dup_key: str = "_dup"
+    ) -> str:
+        """Move a file into a folder under a free name, never replacing an existing file.
+        The move is a hard link followed by removing the source, which fails rather than
+        replace a file created since the folder was listed, e.g. by another program.
+
+        Args:
+            src_path (str): the file to move
+            folder (str): the folder to move it to
+            name (str): the file name wanted, including format
+            dup_key (str, optional): the key for naming duplicates. Defaults to "_dup".
+
+        Returns:
+            str: the path the file was moved to
+        """
+        while True:
+            dest_path = self.reserve(folder, name, dup_key)
+            try:
+                os.link(src_path, dest_path)
+            except FileExistsError:
+                # created since the folder was listed, try the next name
+                self.release(dest_path, used=True)
+                continue
+            except OSError:
+                # e.g. across filesystems, or on a filesystem without hard links,
+                # where names are only unique among the workers of this process
+                try:
+                    shutil.move(src_path, dest_path)
+                except BaseException:
+                    self.release(dest_path)
+                    raise
+            else:
+                os.remove(src_path)
+            self.release(dest_path, used=True)
+            if os.path.basename(dest_path) != name:
+                logger.warning(
+                    f"{name} already exists in {folder}, so I generated a new filename {dest_path}!"
+                )
+            return dest_path
+
+    def _is_free(self, folder: str, name: str) -> bool:
+        """Whether a name is neither reserved nor taken. Names seen when the folder was
+        listed are checked for on disk, in case they were removed since.
+        """
+        path = os.path.join(folder, name)
+        if path in self.reserved:
+            return False
+        existing = self.existing[folder]
+        if name not in existing:
+            return True
+        if os.path.lexists(path):
+            return False
+        existing.discard(name)
+        return True
+
+
+def dup_name(stem: str, ext: str, dup_key: str, n: int) -> str:
+    """Name the nth duplicate of a file, e.g. song_dup.mp3 then song_dup2.mp3
+
+    Args:
+        stem (str): the file name, excluding format
+        ext (str): the format, including the dot
+        dup_key (str): the key for naming duplicates
+        n (int): the number of the duplicate, from 1
+
+    Returns:
+        str: the file name
+    """
+    return f"{stem}{dup_key}{n if n > 1 else ''}{ext}"
+
+
+def list_names(folder: str) -> Set[str]:
+    """List the names within a folder
+
+    Args:
+        folder (str): the folder
+
+    Returns:
+        Set[str]: the names, empty if the folder does not exist
+    """
+    try:
+        return set(os.listdir(folder))
+    except OSError:
+        return set()
+
+
+_allocator: Optional[NameAllocator] = None
+_allocator_lock = threading.Lock()
+
+
+def get_allocator() -> NameAllocator:
+    """Get the allocator shared by the whole process, creating it on first use
+
+    Returns:
+        NameAllocator: the allocator
+    """
+    global _allocator
+    with _allocator_lock:
+        if _allocator is None:
+            _allocator = NameAllocator()
+        return _allocator
@@ -0,0 +1,112 @@
+"""
+pipeline.py module for running queued songs through the download, tag and save
+stages concurrently, once every interactive selection has been gathered
+"""
+
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Optional, Union
+
+from pydantic import BaseModel, Field
+
+from songbirdcli import helpers
+from songbirdcore import common
+from songbirdcore.models import itunes_api
+
+logger = logging.getLogger(__name__)
+
+
+class SongJob(BaseModel):
+    """A song whose selections have all been gathered from the user,
+    ready to be downloaded, tagged and saved without further prompting"""
+
+    song_name: str
+    """specifies the name of the song, as entered by the user"""
+    song_properties: Union[itunes_api.ItunesApiSongModel, bool] = False
+    """specifies the itunes properties to tag with, False if the user selected none"""
+    file_path_no_format: str
+    """specifies the path to download to, excluding file format"""
+    file_format: str
+    """specifies the file format to download"""
+    video_url: Optional[str] = None
+    """specifies the youtube url to download, None if youtube downloads are disabled"""
+    destination: str = "l"
+    """specifies where to save the song. One or more of gdrive (g), itunes (i) or locally (l), e.g. ig"""
+    job_id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    """specifies a unique id for the job, used to track its progress in the journal"""
+
+
+def run_jobs(
+    jobs: List[SongJob],
+    process_job: Callable[[SongJob], Optional[bool]],
+    workers: int,
+    quit_str: str = "q",
+    interactive: bool = True,
+) -> List[Optional[bool]]:
+    """Run the queued jobs through process_job in a bounded pool of workers,
+    reporting progress as each song completes. If a song fails while others are
+    still queued, the user is asked whether to continue with the remaining songs.
+
+    Args:
+        jobs (List[SongJob]): the jobs to process
+        process_job (Callable[[SongJob], Optional[bool]]): runs the download, tag and save stages for a job,
+            returning True on success and None on failure
+        workers (int): the maximum number of jobs processed at once
+        quit_str (str, optional): allows the user to quit out of the continue prompt. Defaults to "q".
+        interactive (bool, optional): whether to prompt the user after a failure. Otherwise the queue always continues. Defaults to True.
+
+    Returns:
+        List[Optional[bool]]: the result for each job, in the order given. None for jobs that failed or were cancelled.
+    """
+    results = [None] * len(jobs)
+    if len(jobs) == 0:
+        return results
+
+    n_workers = max(1, min(workers, len(jobs)))
+    logger.info(f"Processing {len(jobs)} queued songs with {n_workers} workers.")
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = {
+            executor.submit(_run_job, job, process_job): idx
+            for idx, job in enumerate(jobs)
+        }
+        n_done = 0
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            idx = futures[future]
+            n_done += 1
+            results[idx] = future.result()
+            status = "done" if results[idx] is True else "failed"
+            logger.info(f"[{n_done}/{len(jobs)}] {status}: {jobs[idx].song_name}")
+
+            # detect if more songs are queued, and ask if user wants to continue with them
+            pending = [jobs[i] for f, i in futures.items() if not f.done() and i != idx]
+            if interactive and results[idx] is not True and len(pending) > 0:
+                common.pretty_lst_printer([job.song_name for job in pending])
+                continue_queue = helpers.get_input(
+                    prompt=f"You have {len(pending)} songs (above) in queue. Would you like to continue?",
+                    choices=["y", "n"],
+                    out_type=str,
+                    quit_str=quit_str,
+                )
+                if continue_queue == "n" or continue_queue == quit_str:
+                    # songs already downloading are left to finish
+                    for f in futures:
+                        f.cancel()
+                    logger.info("Cancelled the remaining queued songs.")
+    return results
+
+
+def _run_job(
+    job: SongJob, process_job: Callable[[SongJob], Optional[bool]]
+) -> Optional[bool]:
+    """Run a single job, logging rather than raising any unexpected errors so
+    that the remaining queue is unaffected.
+    """
+    logger.info(f"Starting: {job.song_name}")
+    try:
+        return process_job(job)
+    except Exception:
+        logger.exception(f"Unexpected error occurred processing {job.song_name}.")
+        return None
@@ -0,0 +1,173 @@
+"""
+prefetch.py module for running youtube searches in the background, so that
+their results are ready by the time the user is asked to pick a video
+"""
+
+import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from songbirdcli import lazy
+from songbirdcli import render
+from songbirdcli import search
+from songbirdcli import settings
+
+logger = logging.getLogger(__name__)
+
+youtube = lazy.load("songbirdcore.youtube")
+
+
+class SearchPrefetcher:
+    """Speculatively runs youtube searches from a small pool of workers.
+
+    A search is started as soon as its payload is known, e.g. the bare song name while
+    the user is still choosing itunes properties. Asking for the results of a payload
+    waits on the search already in flight, or runs it in place if it was never started.
+    """
+
+    def __init__(
+        self,
+        search: Callable[[dict], Optional[List[render.Video]]],
+        workers: int = 2,
+        max_entries: int = 8,
+        enabled: bool = True,
+    ):
+        """
+        Args:
+            search (Callable[[dict], Optional[List[render.Video]]]): runs a youtube search for a payload,
+                returning the videos found, or None on failure
+            workers (int, optional): the maximum number of searches run at once. Defaults to 2.
+            max_entries (int, optional): the number of searches kept before the oldest are dropped. Defaults to 8.
+            enabled (bool, optional): whether to prefetch. Otherwise every search runs in place when asked for. Defaults to True.
+        """
+        self.search = search
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, workers), thread_name_prefix="youtube-prefetch"
+        )
+        self.futures: "OrderedDict[str, Future]" = OrderedDict()
+
+    @classmethod
+    def from_config(
+        cls,
+        config: settings.SongbirdCliConfig,
+        search_engine: Optional[search.SearchEngine] = None,
+    ) -> "SearchPrefetcher":
+        """Create a prefetcher searching youtube with the render settings in the songbirdcli config
+
+        Args:
+            config (settings.SongbirdCliConfig): the songbirdcli config
+            search_engine (Optional[search.SearchEngine], optional): the engine to search with.
+                Defaults to None, launching a browser for every search.
+
+        Returns:
+            SearchPrefetcher: the prefetcher
+        """
+        if search_engine is not None:
+            return cls(
+                search_engine.search_videos, enabled=config.youtube_prefetch_enabled
+            )
+
+        def render_search(payload: dict) -> Optional[List[render.Video]]:
+            _, links = youtube.get_video_links(
+                config.youtube_home_url,
+                config.youtube_search_url,
+                payload,
+                config.youtube_render_timeout,
+                config.youtube_render_wait,
+                config.youtube_render_retries,
+                config.youtube_render_sleep,
+            )
+            return search.get_videos(links)
+
+        return cls(render_search, enabled=config.youtube_prefetch_enabled)
+
+    def prefetch(self, payload: dict):
+        """Start searching for a payload in the background, unless already started
+
+        Args:
+            payload (dict): the query payload for youtube's search api
+        """
+        if not self.enabled:
+            return
+        key = make_key(payload)
+        with self.lock:
+            if key in self.futures:
+                self.futures.move_to_end(key)
+                return
+            logger.debug(f"Prefetching youtube search: {payload}")
+            self.futures[key] = self.executor.submit(self._search, payload)
+            while len(self.futures) > self.max_entries:
+                _, future = self.futures.popitem(last=False)
+                future.cancel()
+
+    def get(
+        self, payload: dict, fallback: Optional[dict] = None
+    ) -> Optional[List[render.Video]]:
+        """Get the results of a search. If the search is still running but the search
+        for the fallback payload has already finished with results, those are used instead.
+
+        Args:
+            payload (dict): the query payload for youtube's search api
+            fallback (Optional[dict], optional): a broader payload whose results may be reused, e.g. the bare song name. Defaults to None.
+
+        Returns:
+            Optional[List[render.Video]]: the videos found, None if the search failed
+        """
+        with self.lock:
+            future = self.futures.get(make_key(payload))
+            fallback_future = None
+            if fallback is not None:
+                fallback_future = self.futures.get(make_key(fallback))
+
+        if future is None or future.cancelled():
+            return self._search(payload)
+        if (
+            not future.done()
+            and fallback_future is not None
+            and fallback_future.done()
+            and not fallback_future.cancelled()
+            and fallback_future.result()
+        ):
+            logger.info(f"Using the finished youtube search for {fallback}.")
+            return fallback_future.result()
+        if not future.done():
+            logger.info("Waiting for the youtube search to finish.")
+        result = future.result()
+        if not result:
+            # allow a failed search to be retried
+            with self.lock:
+                if self.futures.get(make_key(payload)) is future:
+                    del self.futures[make_key(payload)]
+        return result
+
+    def close(self):
+        """Stop the workers, abandoning any searches not yet started"""
+        with self.lock:
+            self.futures.clear()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def _search(self, payload: dict) -> Optional[List[render.Video]]:
+        """Run a search, logging rather than raising any errors"""
+        try:
+            return self.search(payload)
+        except Exception:
+            logger.exception(f"Youtube search failed for {payload}.")
+            return None
+
+
+def make_key(payload: dict) -> str:
+    """Make the cache key for a search payload
+
+    Args:
+        payload (dict): the query payload for youtube's search api
+
+    Returns:
+        str: the key
+    """
+    return json.dumps(payload, sort_keys=True)
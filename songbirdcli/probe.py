@@ -0,0 +1,141 @@
+"""
+probe.py module for checking that a url can be downloaded from, without
+fetching the page it points to
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import urlparse
+
+import requests
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/106.0.0.0 Safari/537.36",  # ubuntu chrome headers
+}
+# status codes of servers that refuse HEAD requests
+HEAD_UNSUPPORTED = [403, 405, 501]
+
+
+class ProbeResult(BaseModel):
+    """The outcome of probing a url"""
+
+    url: str
+    """specifies the url that was probed"""
+    ok: bool
+    """specifies whether the url can be downloaded from"""
+    resolved_url: Optional[str] = None
+    """specifies the url after following redirects, if it was reached"""
+    status_code: Optional[int] = None
+    """specifies the status code of the response, if one was received"""
+    message: str = ""
+    """specifies why the url cannot be downloaded from"""
+
+
+class UrlProber:
+    """Checks urls with a HEAD request, falling back to a GET of a single byte for
+    servers that refuse HEAD. Requests share one pooled session, and the results
+    of urls that answered are cached, so a url is probed at most once.
+    """
+
+    def __init__(self, timeout: float = 5, max_entries: int = 256):
+        """
+        Args:
+            timeout (float, optional): seconds before abandoning a probe. Defaults to 5.
+            max_entries (int, optional): the number of results kept before the oldest are dropped. Defaults to 256.
+        """
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        self.results: "OrderedDict[str, ProbeResult]" = OrderedDict()
+
+    def get(self, url: str) -> Optional[ProbeResult]:
+        """Get the cached result of a url
+
+        Args:
+            url (str): the url
+
+        Returns:
+            Optional[ProbeResult]: the result, None if the url was never probed
+        """
+        with self.lock:
+            result = self.results.get(url)
+            if result is not None:
+                self.results.move_to_end(url)
+            return result
+
+    def probe(self, url: str) -> ProbeResult:
+        """Check that a url is well formed and that its server answers with success,
+        reusing the cached result if the url was probed before.
+
+        Args:
+            url (str): the url, normalized by the caller so that equal urls share a result
+
+        Returns:
+            ProbeResult: the result
+        """
+        parsed_url = urlparse(url)
+        if parsed_url.scheme not in ["http", "https"] or parsed_url.netloc == "":
+            return ProbeResult(url=url, ok=False, message="not an http(s) url")
+
+        result = self.get(url)
+        if result is not None:
+            logger.debug(f"Using the cached probe of {url}")
+            return result
+
+        try:
+            response = self.session.head(
+                url, allow_redirects=True, timeout=self.timeout
+            )
+            if response.status_code in HEAD_UNSUPPORTED:
+                response = self.session.get(
+                    url,
+                    headers={"Range": "bytes=0-0"},
+                    allow_redirects=True,
+                    stream=True,
+                    timeout=self.timeout,
+                )
+                response.close()
+        except requests.exceptions.RequestException as e:
+            # not cached, as the failure may be temporary
+            return ProbeResult(url=url, ok=False, message=str(e))
+
+        ok = response.status_code in [200, 206]
+        result = ProbeResult(
+            url=url,
+            ok=ok,
+            resolved_url=response.url,
+            status_code=response.status_code,
+            message="" if ok else f"received status {response.status_code}",
+        )
+        with self.lock:
+            self.results[url] = result
+            while len(self.results) > self.max_entries:
+                self.results.popitem(last=False)
+        return result
+
+    def close(self):
+        self.session.close()
+
+
+_prober: Optional[UrlProber] = None
+_prober_lock = threading.Lock()
+
+
+def get_prober() -> UrlProber:
+    """Get the prober shared by the whole process, creating it on first use
+
+    Returns:
+        UrlProber: the prober
+    """
+    global _prober
+    with _prober_lock:
+        if _prober is None:
+            _prober = UrlProber()
+        return _prober
@@ -0,0 +1,330 @@
+"""
+render.py module for searching youtube through a pool of long lived headless
+browser sessions, rather than launching a browser for every search
+"""
+
+import logging
+import queue
+import re
+import threading
+from concurrent.futures import CancelledError, Future
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from songbirdcli import lazy
+from songbirdcli import settings
+from songbirdcli import throttle
+
+logger = logging.getLogger(__name__)
+
+# requests-html is imported when a session is first opened
+web = lazy.load("songbirdcore.web")
+
+# the display list and the href of each video, None, None if a search failed
+SearchResult = Tuple[Optional[List[str]], Optional[List[str]]]
+
+# the length of a video as read aloud at the end of its label, e.g. "1 hour, 2 minutes, 3 seconds"
+SPOKEN_DURATION_PATTERN = re.compile(r"((?:\d+ (?:hours?|minutes?|seconds?),? ?)+)$")
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/106.0.0.0 Safari/537.36",  # ubuntu chrome headers
+}
+
+
+class Video(BaseModel):
+    """A video found by a youtube search"""
+
+    href: str
+    """specifies the path of the video, relative to youtube's home page"""
+    title: str
+    """specifies the title of the video"""
+    duration: Optional[float] = None
+    """specifies the length of the video in seconds, if known"""
+    channel: str = ""
+    """specifies the name of the channel that uploaded the video, if known"""
+
+
+class RenderWorker:
+    """A thread owning a single render session. The session's browser and event loop
+    are only ever used from this thread, as playwright requires.
+    """
+
+    def __init__(self, pool: "RenderSessionPool", idx: int):
+        self.pool = pool
+        self.session: Optional["web.SimpleSession"] = None
+        self.form_inputs: Optional[dict] = None
+        self.pages = 0
+        self.thread = threading.Thread(
+            target=self.run, name=f"youtube-render-{idx}", daemon=True
+        )
+        self.thread.start()
+
+    def run(self):
+        """Serve searches from the pool's queue until told to stop"""
+        while True:
+            task = self.pool.tasks.get()
+            if task is None:
+                break
+            payload, future = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.search(payload))
+            except Exception:
+                logger.exception(f"Youtube search failed for {payload}.")
+                self.recycle()
+                future.set_result(None)
+        self.close()
+
+    def search(self, payload: dict) -> Optional[List[Video]]:
+        """Search youtube, retrying renders that find no videos
+
+        Args:
+            payload (dict): the query payload for youtube's search api
+
+        Returns:
+            Optional[List[Video]]: the videos found, None if the search failed
+        """
+        pool = self.pool
+        for tries in range(pool.render_retries):
+            session = self.get_session()
+            if self.form_inputs is None:
+                # the search form's inputs are the same for every search, so load them once
+                self.form_inputs = session.get_form_inputs(
+                    pool.youtube_home_url, log_calls=tries == 0
+                )
+                if self.form_inputs is None:
+                    self.recycle()
+                    continue
+            response = pool.throttle.request(
+                pool.youtube_search_url,
+                lambda: session.s.get(
+                    pool.youtube_search_url,
+                    params={**self.form_inputs, **payload},
+                    headers=session.headers,
+                ),
+            )
+            response.html.render(
+                timeout=pool.render_timeout,
+                wait=pool.render_wait,
+                sleep=pool.render_sleep,
+            )
+            response.close()
+            self.pages += 1
+            links = response.html.find("#video-title")
+            if len(links) > 0:
+                break
+            logger.warning(f"{tries + 1}:{pool.render_retries}.")
+        else:
+            logger.error(
+                f"Failed to get links from {pool.youtube_home_url} after {pool.render_retries} tries."
+            )
+            return None
+        if self.pages >= pool.max_pages:
+            self.recycle()
+
+        return [
+            Video(
+                href=link.attrs["href"],
+                title=link.attrs["title"],
+                duration=parse_spoken_duration(link.attrs.get("aria-label", "")),
+            )
+            for link in links
+            if "title" in link.attrs and "href" in link.attrs
+        ]
+
+    def get_session(self) -> "web.SimpleSession":
+        """Get the worker's session, replacing it if its browser has died"""
+        if self.session is not None and not self.is_healthy():
+            logger.info("Replacing an unresponsive render session.")
+            self.recycle()
+        if self.session is None:
+            self.session = web.SimpleSession(
+                "youtube",
+                root_url=self.pool.youtube_home_url,
+                headers={**HEADERS, "Referrer": self.pool.youtube_home_url},
+            )
+        return self.session
+
+    def is_healthy(self) -> bool:
+        """Check that the session's browser, if launched, is still connected"""
+        browser = getattr(self.session.s, "_browser", None)
+        return browser is None or browser.is_connected()
+
+    def recycle(self):
+        """Close the session, so that the next search starts a fresh one"""
+        if self.session is not None:
+            logger.debug(f"Recycling render session after {self.pages} pages.")
+        self.close()
+        self.session = None
+        self.form_inputs = None
+        self.pages = 0
+
+    def close(self):
+        if self.session is None:
+            return
+        try:
+            self.session.close()
+        except Exception as e:
+            logger.warning(f"Could not close render session cleanly: {e}")
+
+
+class RenderSessionPool:
+    """A fixed number of render sessions, shared by every youtube search in a session.
+
+    Each session keeps its browser open between searches, so a search only pays for
+    loading and rendering the results page. Sessions are replaced when their browser
+    disconnects or a search raises, and recycled after max_pages renders to bound
+    the memory a long lived browser accumulates.
+    """
+
+    def __init__(
+        self,
+        youtube_home_url: str,
+        youtube_search_url: str,
+        render_timeout: int,
+        render_wait: float,
+        render_retries: int,
+        render_sleep: int,
+        size: int = 1,
+        max_pages: int = 50,
+        request_throttle: Optional[throttle.Throttle] = None,
+    ):
+        """
+        Args:
+            youtube_home_url (str): the url to youtube's home page
+            youtube_search_url (str): the search url for youtube
+            render_timeout (int): amount of time before abandoning a render
+            render_wait (float): the amount of time before attempting a render
+            render_retries (int): the number of retries for a render
+            render_sleep (int): the amount of time to wait after rendering
+            size (int, optional): the number of render sessions. Defaults to 1.
+            max_pages (int, optional): the number of renders before a session is recycled. Defaults to 50.
+            request_throttle (Optional[throttle.Throttle], optional): paces and retries searches. Defaults to the shared throttle.
+        """
+        self.youtube_home_url = youtube_home_url
+        self.youtube_search_url = youtube_search_url
+        self.render_timeout = render_timeout
+        self.render_wait = render_wait
+        self.render_retries = max(1, render_retries)
+        self.render_sleep = render_sleep
+        self.max_pages = max(1, max_pages)
+        self.throttle = request_throttle or throttle.get_throttle()
+        self.tasks: "queue.Queue[Optional[Tuple[dict, Future]]]" = queue.Queue()
+        self.workers = [RenderWorker(self, idx) for idx in range(max(1, size))]
+        self.closed = False
+
+    @classmethod
+    def from_config(cls, config: settings.SongbirdCliConfig) -> "RenderSessionPool":
+        """Create a pool with the render settings in the songbirdcli config
+
+        Args:
+            config (settings.SongbirdCliConfig): the songbirdcli config
+
+        Returns:
+            RenderSessionPool: the pool
+        """
+        return cls(
+            config.youtube_home_url,
+            config.youtube_search_url,
+            config.youtube_render_timeout,
+            config.youtube_render_wait,
+            config.youtube_render_retries,
+            config.youtube_render_sleep,
+            size=config.youtube_render_pool_size,
+            max_pages=config.youtube_render_pool_max_pages,
+        )
+
+    def submit(self, payload: dict) -> Future:
+        """Queue a search for the next free session
+
+        Args:
+            payload (dict): the query payload for youtube's search api
+
+        Returns:
+            Future: resolves to the videos found, None if the search failed
+        """
+        future = Future()
+        if self.closed:
+            future.set_result(None)
+            return future
+        self.tasks.put((payload, future))
+        return future
+
+    def search_videos(self, payload: dict) -> Optional[List[Video]]:
+        """Search youtube with the next free session, waiting for the results
+
+        Args:
+            payload (dict): the query payload for youtube's search api
+
+        Returns:
+            Optional[List[Video]]: the videos found, None if the search failed
+        """
+        try:
+            return self.submit(payload).result()
+        except CancelledError:
+            return None
+
+    def search(self, payload: dict) -> SearchResult:
+        """Search youtube with the next free session, waiting for the results
+
+        Args:
+            payload (dict): the query payload for youtube's search api
+
+        Returns:
+            SearchResult: the display list and the video hrefs, None, None if the search failed
+        """
+        return to_search_result(self.youtube_home_url, self.search_videos(payload))
+
+    def close(self):
+        """Cancel the queued searches and close every session"""
+        self.closed = True
+        while True:
+            try:
+                task = self.tasks.get_nowait()
+            except queue.Empty:
+                break
+            if task is not None:
+                task[1].cancel()
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.thread.join()
+
+
+def to_search_result(
+    youtube_home_url: str, videos: Optional[List[Video]]
+) -> SearchResult:
+    """Build the display list and hrefs for a list of videos
+
+    Args:
+        youtube_home_url (str): the url to youtube's home page
+        videos (Optional[List[Video]]): the videos, None if the search failed
+
+    Returns:
+        SearchResult: the display list and the video hrefs, None, None if there are no videos
+    """
+    if not videos:
+        return None, None
+    link_list = [f"{video.title} - {youtube_home_url + video.href}" for video in videos]
+    return link_list, [video.href for video in videos]
+
+
+def parse_spoken_duration(label: str) -> Optional[float]:
+    """Read the length of a video from the end of its accessibility label
+
+    Args:
+        label (str): the label, e.g. "Jolene by Dolly Parton 1,234 views 2 years ago 2 minutes, 42 seconds"
+
+    Returns:
+        Optional[float]: the length in seconds, None if the label has no length
+    """
+    match = SPOKEN_DURATION_PATTERN.search(label.strip())
+    if match is None:
+        return None
+    seconds = {"hour": 3600, "minute": 60, "second": 1}
+    duration = 0
+    for amount, unit in re.findall(r"(\d+) (hour|minute|second)", match.group(1)):
+        duration += int(amount) * seconds[unit]
+    return float(duration)
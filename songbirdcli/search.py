@@ -0,0 +1,327 @@
+"""
+search.py module containing the engines used to search youtube. The render engine
+runs youtube's page in a headless browser, while the http and yt-dlp engines read
+the results without running any javascript
+"""
+
+import json
+import logging
+import re
+import threading
+from typing import Iterator, List, Optional, Union
+
+import requests
+
+from songbirdcli import lazy
+from songbirdcli import render
+from songbirdcli import settings
+from songbirdcli import throttle
+
+logger = logging.getLogger(__name__)
+
+yt_dlp = lazy.load("yt_dlp")
+
+SearchResult = render.SearchResult
+Video = render.Video
+to_search_result = render.to_search_result
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36",
+    "Accept-Language": "en-US,en;q=0.5",
+}
+
+INITIAL_DATA_PATTERN = re.compile(
+    r"(?:var\s+ytInitialData|window\[\"ytInitialData\"\])\s*=\s*(\{.*?\});\s*</script>",
+    re.DOTALL,
+)
+
+
+class HttpSearchEngine:
+    """Searches youtube with a plain http request, reading the results from the
+    initial data json that youtube embeds in its results page.
+    """
+
+    def __init__(
+        self,
+        youtube_home_url: str,
+        youtube_search_url: str,
+        timeout: float = 10,
+        max_results: int = 20,
+        request_throttle: Optional[throttle.Throttle] = None,
+    ):
+        """
+        Args:
+            youtube_home_url (str): the url to youtube's home page
+            youtube_search_url (str): the search url for youtube
+            timeout (float, optional): seconds before abandoning a request. Defaults to 10.
+            max_results (int, optional): the maximum number of videos returned. Defaults to 20.
+            request_throttle (Optional[throttle.Throttle], optional): paces and retries searches. Defaults to the shared throttle.
+        """
+        self.youtube_home_url = youtube_home_url
+        self.youtube_search_url = youtube_search_url
+        self.timeout = timeout
+        self.max_results = max_results
+        self.throttle = request_throttle or throttle.get_throttle()
+        # one session for every search, so connections are reused
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        # skip the cookie consent page served to some regions
+        self.session.cookies.set("CONSENT", "YES+cb", domain=".youtube.com")
+
+    def search_videos(self, payload: dict) -> Optional[List[Video]]:
+        """Search youtube
+
+        Args:
+            payload (dict): the query payload for youtube's search api
+
+        Returns:
+            Optional[List[Video]]: the videos found, None if the search failed
+        """
+        try:
+            response = self.throttle.request(
+                self.youtube_search_url,
+                lambda: self.session.get(
+                    self.youtube_search_url, params=payload, timeout=self.timeout
+                ),
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error submitting request to: {self.youtube_search_url}: {e}")
+            return None
+
+        videos = parse_initial_data(response.text)[: self.max_results]
+        if len(videos) == 0:
+            logger.error(f"Found no videos in the youtube results for {payload}.")
+            return None
+        return videos
+
+    def search(self, payload: dict) -> SearchResult:
+        """Search youtube
+
+        Args:
+            payload (dict): the query payload for youtube's search api
+
+        Returns:
+            SearchResult: the display list and the video hrefs, None, None if the search failed
+        """
+        return to_search_result(self.youtube_home_url, self.search_videos(payload))
+
+    def close(self):
+        self.session.close()
+
+
+class YtDlpSearchEngine:
+    """Searches youtube with yt-dlp's search extractor, without resolving each video"""
+
+    def __init__(
+        self,
+        youtube_home_url: str,
+        search_tag: str = "search_query",
+        max_results: int = 20,
+        request_throttle: Optional[throttle.Throttle] = None,
+    ):
+        """
+        Args:
+            youtube_home_url (str): the url to youtube's home page
+            search_tag (str, optional): the key of the query within a search payload. Defaults to "search_query".
+            max_results (int, optional): the maximum number of videos returned. Defaults to 20.
+            request_throttle (Optional[throttle.Throttle], optional): paces and retries searches. Defaults to the shared throttle.
+        """
+        self.youtube_home_url = youtube_home_url
+        self.search_tag = search_tag
+        self.max_results = max_results
+        self.throttle = request_throttle or throttle.get_throttle()
+        self.ydl = yt_dlp.YoutubeDL(
+            {"quiet": True, "no_warnings": True, "extract_flat": True}
+        )
+        self.lock = threading.Lock()
+
+    def search_videos(self, payload: dict) -> Optional[List[Video]]:
+        """Search youtube
+
+        Args:
+            payload (dict): the query payload for youtube's search api
+
+        Returns:
+            Optional[List[Video]]: the videos found, None if the search failed
+        """
+        query = payload.get(self.search_tag, "")
+
+        def extract_info() -> Optional[dict]:
+            try:
+                with self.lock:
+                    return self.ydl.extract_info(
+                        f"ytsearch{self.max_results}:{query}", download=False
+                    )
+            except yt_dlp.utils.DownloadError as e:
+                logger.error(f"yt-dlp could not search youtube for {query}: {e}")
+                return None
+
+        info = self.throttle.call(self.youtube_home_url, extract_info)
+        if info is None:
+            return None
+
+        videos = [
+            Video(
+                href=f"/watch?v={entry['id']}",
+                title=entry.get("title") or entry["id"],
+                duration=entry.get("duration"),
+                channel=entry.get("channel") or entry.get("uploader") or "",
+            )
+            for entry in info.get("entries") or []
+            if entry.get("id")
+        ]
+        if len(videos) == 0:
+            logger.error(f"Found no videos in the youtube results for {query}.")
+            return None
+        return videos
+
+    def search(self, payload: dict) -> SearchResult:
+        """Search youtube
+
+        Args:
+            payload (dict): the query payload for youtube's search api
+
+        Returns:
+            SearchResult: the display list and the video hrefs, None, None if the search failed
+        """
+        return to_search_result(self.youtube_home_url, self.search_videos(payload))
+
+    def close(self):
+        self.ydl.close()
+
+
+SearchEngine = Union[render.RenderSessionPool, HttpSearchEngine, YtDlpSearchEngine]
+
+
+def from_config(config: settings.SongbirdCliConfig) -> SearchEngine:
+    """Create the search engine selected in the songbirdcli config
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbirdcli config
+
+    Returns:
+        SearchEngine: the search engine
+    """
+    if config.youtube_search_engine == "http":
+        return HttpSearchEngine(
+            config.youtube_home_url,
+            config.youtube_search_url,
+            timeout=config.youtube_render_timeout,
+        )
+    if config.youtube_search_engine == "ytdlp":
+        return YtDlpSearchEngine(
+            config.youtube_home_url, search_tag=config.youtube_search_tag
+        )
+    return render.RenderSessionPool.from_config(config)
+
+
+def parse_initial_data(html: str) -> List[Video]:
+    """Read the videos from the initial data json embedded in a youtube results page
+
+    Args:
+        html (str): the results page
+
+    Returns:
+        List[Video]: the videos, in the order listed
+    """
+    match = INITIAL_DATA_PATTERN.search(html)
+    if match is None:
+        return []
+    try:
+        initial_data = json.loads(match.group(1))
+    except json.JSONDecodeError as e:
+        logger.error(f"Could not parse youtube's initial data: {e}")
+        return []
+
+    videos = []
+    for renderer in find_video_renderers(initial_data):
+        video_id = renderer.get("videoId")
+        if video_id:
+            videos.append(
+                Video(
+                    href=f"/watch?v={video_id}",
+                    title=get_text(renderer.get("title")),
+                    duration=parse_clock_duration(get_text(renderer.get("lengthText"))),
+                    channel=get_text(renderer.get("ownerText")),
+                )
+            )
+    return videos
+
+
+def get_text(node: Optional[dict]) -> str:
+    """Get the text of a text node in youtube's initial data, which holds
+    either a simpleText or a list of runs"""
+    if not node:
+        return ""
+    if "runs" in node:
+        return "".join(run.get("text", "") for run in node["runs"])
+    return node.get("simpleText", "")
+
+
+def parse_clock_duration(text: str) -> Optional[float]:
+    """Read a video length shown as a clock, e.g. "3:45" or "1:02:03"
+
+    Args:
+        text (str): the length
+
+    Returns:
+        Optional[float]: the length in seconds, None if unreadable
+    """
+    try:
+        parts = [int(part) for part in text.strip().split(":")]
+    except ValueError:
+        return None
+    duration = 0
+    for part in parts:
+        duration = duration * 60 + part
+    return float(duration)
+
+
+def find_video_renderers(node: Union[dict, list]) -> Iterator[dict]:
+    """Walk youtube's initial data, yielding every video result in document order"""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "videoRenderer" and isinstance(value, dict):
+                yield value
+            else:
+                yield from find_video_renderers(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from find_video_renderers(value)
+
+
+def get_videos(links: Optional[list]) -> Optional[List[Video]]:
+    """Get the videos of the links found by `songbirdcore.youtube.get_video_links`
+
+    Args:
+        links (Optional[list]): the html elements of each video
+
+    Returns:
+        Optional[List[Video]]: the videos, None if links is None
+    """
+    if links is None:
+        return None
+    return [
+        Video(
+            href=link.attrs["href"],
+            title=link.attrs["title"],
+            duration=render.parse_spoken_duration(link.attrs.get("aria-label", "")),
+        )
+        for link in links
+        if "title" in link.attrs and "href" in link.attrs
+    ]
+
+
+def get_hrefs(links: Optional[list]) -> Optional[List[str]]:
+    """Get the hrefs of the links found by `songbirdcore.youtube.get_video_links`
+
+    Args:
+        links (Optional[list]): the html elements of each video
+
+    Returns:
+        Optional[List[str]]: the href of each video, None if links is None
+    """
+    if links is None:
+        return None
+    return [link.attrs["href"] for link in links]
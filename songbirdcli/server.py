@@ -0,0 +1,463 @@
+"""
+server.py module for running songbird as a long lived service, which keeps its
+sessions warm and accepts song and album jobs over localhost http
+"""
+
+import http.server
+import json
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, Optional, Set
+
+import requests
+from pydantic import BaseModel, ValidationError
+
+from songbirdcli import artwork
+from songbirdcli import batch
+from songbirdcli import cli
+from songbirdcli import itunes_search
+from songbirdcli import journal
+from songbirdcli import library
+from songbirdcli import pipeline
+from songbirdcli import search
+from songbirdcli import settings
+from songbirdcli import throttle
+from songbirdcli import timing
+from songbirdcli import transcode
+from songbirdcli import uploads
+from songbirdcli import watcher
+from songbirdcore import common
+
+logger = logging.getLogger(__name__)
+
+
+class JobEvent(BaseModel):
+    """A progress update of a job, streamed to the client as a json line"""
+
+    event: str
+    """specifies the kind of update. One of stage, result or done"""
+    song_name: str = ""
+    """specifies the name of the song the update is about, empty for done"""
+    stage: Optional[journal.Stage] = None
+    """specifies the stage the song reached, for stage updates"""
+    status: str = ""
+    """specifies the outcome of the song, or of the whole job. One of success, failed or skipped"""
+    message: str = ""
+    """specifies details about the update"""
+
+
+class ProgressJournal(journal.Journal):
+    """A journal that also passes each record to the listener of its song's job,
+    so that progress can be streamed to the client that submitted it.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): path to the journal file, created if missing
+        """
+        super().__init__(path)
+        self.listeners_lock = threading.Lock()
+        self.listeners: Dict[str, Callable[[journal.JournalRecord], None]] = {}
+
+    def listen(self, job_id: str, listener: Callable[[journal.JournalRecord], None]):
+        """Pass the records of a job to a listener, until `unlisten` is called
+
+        Args:
+            job_id (str): the id of the song's job
+            listener (Callable[[journal.JournalRecord], None]): called from the recording thread with each record
+        """
+        with self.listeners_lock:
+            self.listeners[job_id] = listener
+
+    def unlisten(self, job_id: str):
+        """Stop passing the records of a job to its listener
+
+        Args:
+            job_id (str): the id of the song's job
+        """
+        with self.listeners_lock:
+            self.listeners.pop(job_id, None)
+
+    def record(self, job_id: str, stage: journal.Stage, **kwargs):
+        record = super().record(job_id, stage, **kwargs)
+        with self.listeners_lock:
+            listener = self.listeners.get(job_id)
+        if listener is not None:
+            listener(record)
+        return record
+
+
+class SongbirdServer:
+    """Runs jobs through the same stages as batch mode, sharing one set of warm
+    resources (the itunes client, library index, youtube search engine, artwork
+    cache and google drive uploader) between every job it is sent.
+    """
+
+    def __init__(
+        self,
+        config: settings.SongbirdCliConfig,
+        itunes_client: itunes_search.ItunesClient,
+        song_journal: ProgressJournal,
+        library_index: Optional[library.LibraryIndex] = None,
+        search_engine: Optional[search.SearchEngine] = None,
+        artwork_cache: Optional[artwork.ArtworkCache] = None,
+        uploader: Optional[uploads.DriveUploader] = None,
+        library_watcher: Optional[watcher.LibraryWatcher] = None,
+    ):
+        """
+        Args:
+            config (settings.SongbirdCliConfig): the songbird config
+            itunes_client (itunes_search.ItunesClient): the client used to query the itunes api
+            song_journal (ProgressJournal): the journal progress is recorded in, and streamed from
+            library_index (Optional[library.LibraryIndex], optional): the index used to find similar local files. Defaults to None.
+            search_engine (Optional[search.SearchEngine], optional): the engine to search youtube with. Defaults to None.
+            artwork_cache (Optional[artwork.ArtworkCache], optional): the cache to read album artwork from. Defaults to None.
+            uploader (Optional[uploads.DriveUploader], optional): the uploader to queue gdrive uploads with. Defaults to None.
+            library_watcher (Optional[watcher.LibraryWatcher], optional): the watcher keeping the library index live. Defaults to None.
+        """
+        self.config = config
+        self.itunes_client = itunes_client
+        self.song_journal = song_journal
+        self.library_index = library_index
+        self.search_engine = search_engine
+        self.artwork_cache = artwork_cache
+        self.uploader = uploader
+        self.library_watcher = library_watcher
+        self.lock = threading.Lock()
+        # normalized names of the songs queued by every running job
+        self.queued_names: Set[str] = set()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, config.pipeline_workers), thread_name_prefix="server-job"
+        )
+
+    @classmethod
+    def from_config(cls, config: settings.SongbirdCliConfig) -> "SongbirdServer":
+        """Create a server with the resources enabled in the songbirdcli config,
+        importing the download and tagging libraries and authorizing google drive up front.
+
+        Args:
+            config (settings.SongbirdCliConfig): the songbirdcli config
+
+        Returns:
+            SongbirdServer: the server
+        """
+        library_index = None
+        library_watcher = None
+        if config.library_index_enabled:
+            library_index = library.LibraryIndex.from_config(config)
+            library_watcher = watcher.from_config(config, library_index)
+            if library_watcher is not None:
+                library_watcher.start()
+        search_engine = None
+        if config.youtube_dl_enabled:
+            search_engine = search.from_config(config)
+            cli.youtube.load()
+        artwork_cache = None
+        if config.artwork_cache_enabled and os.path.exists(config.get_data_path()):
+            artwork_cache = artwork.ArtworkCache.from_config(config)
+        uploader = None
+        if config.gdrive_enabled:
+            uploader = uploads.DriveUploader.from_config(config)
+            uploader.get_credentials()
+        cli.itunes.load()
+        song_journal = ProgressJournal.from_config(config, "server-journal")
+        # jobs are not resumed, as the clients that sent them are gone
+        song_journal.clear()
+        return cls(
+            config,
+            itunes_search.ItunesClient.from_config(config),
+            song_journal,
+            library_index=library_index,
+            search_engine=search_engine,
+            artwork_cache=artwork_cache,
+            uploader=uploader,
+            library_watcher=library_watcher,
+        )
+
+    def run_job(self, entry: batch.ManifestEntry) -> Iterator[JobEvent]:
+        """Resolve a song or album into jobs and process them without prompting
+
+        Args:
+            entry (batch.ManifestEntry): the song or album
+
+        Yields:
+            Iterator[JobEvent]: a stage update as each song completes a stage, a result once each song
+                is finished, then a final done update
+        """
+        with self.lock:
+            queued_names = set(self.queued_names)
+        jobs, skipped = batch.prepare_entry(
+            self.config,
+            0,
+            entry,
+            self.itunes_client,
+            self.library_index,
+            queued_names,
+            self.search_engine,
+        )
+        with self.lock:
+            # another job may have queued the same song while this one was resolving
+            for job in list(jobs):
+                name = library.normalize(job.song_name)
+                if name in self.queued_names:
+                    jobs.remove(job)
+                    skipped.append(
+                        batch.BatchResult(
+                            entry=0,
+                            song_name=job.song_name,
+                            status="skipped",
+                            message="already queued by another job",
+                        )
+                    )
+                    continue
+                self.queued_names.add(name)
+
+        results = [
+            JobEvent(
+                event="result",
+                song_name=result.song_name,
+                status=result.status,
+                message=result.message,
+            )
+            for result in skipped
+        ]
+        yield from results
+        events = queue.Queue()
+        try:
+            for job in jobs:
+                self.song_journal.listen(
+                    job.job_id,
+                    lambda record: events.put(
+                        JobEvent(
+                            event="stage",
+                            song_name=record.song_name,
+                            stage=record.stage,
+                            message=record.message,
+                        )
+                    ),
+                )
+                self.song_journal.record_job(job, journal.Stage.SEARCHED)
+                future = self.executor.submit(self.process_job, job)
+                future.add_done_callback(lambda f: events.put(f.result()))
+            for _ in jobs:
+                event = events.get()
+                while event.event != "result":
+                    yield event
+                    event = events.get()
+                results.append(event)
+                yield event
+        finally:
+            with self.lock:
+                for job in jobs:
+                    self.song_journal.unlisten(job.job_id)
+                    self.queued_names.discard(library.normalize(job.song_name))
+            self.song_journal.compact()
+
+        n_success = len([r for r in results if r.status == "success"])
+        yield JobEvent(
+            event="done",
+            status=(
+                "failed" if any(r.status == "failed" for r in results) else "success"
+            ),
+            message=f"Processed {len(results)} songs: {n_success} succeeded.",
+        )
+
+    def process_job(self, job: pipeline.SongJob) -> JobEvent:
+        """Process a single job from a worker, waiting for its upload if saved to gdrive
+
+        Args:
+            job (pipeline.SongJob): the song and the selections gathered for it
+
+        Returns:
+            JobEvent: the result of the song
+        """
+        result = JobEvent(event="result", song_name=job.song_name, status="failed")
+        try:
+            success = cli.process_song(
+                self.config,
+                job,
+                self.song_journal,
+                self.uploader,
+                self.artwork_cache,
+                self.library_index,
+            )
+        except Exception:
+            logger.exception(f"Unexpected error occurred processing {job.song_name}.")
+            success = None
+        if success is True and self.uploader is not None and "g" in job.destination:
+            if self.uploader.pop(job.job_id) is None:
+                result.message = "could not upload to google drive"
+                return result
+        if success is True:
+            result.status = "success"
+        return result
+
+    def close(self):
+        """Wait for the running jobs, then close every resource"""
+        self.executor.shutdown(wait=True)
+        if self.search_engine is not None:
+            self.search_engine.close()
+        if self.uploader is not None:
+            self.uploader.close()
+        self.itunes_client.close()
+        if self.artwork_cache is not None:
+            self.artwork_cache.close()
+        if self.library_watcher is not None:
+            self.library_watcher.close()
+        if self.library_index is not None:
+            self.library_index.close()
+        self.song_journal.close()
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    """Handles the http api of the server:
+
+    - `GET /health` reports that the server is up, and its version
+    - `POST /jobs` takes a manifest entry as json, and streams the job's progress back as json lines
+    """
+
+    protocol_version = "HTTP/1.1"
+    server: "HTTPServer"
+
+    def do_GET(self):
+        if self.path != "/health":
+            self.send_json(404, {"error": f"no such path {self.path}"})
+            return
+        self.send_json(
+            200, {"status": "ok", "version": self.server.songbird.config.version}
+        )
+
+    def do_POST(self):
+        if self.path != "/jobs":
+            self.send_json(404, {"error": f"no such path {self.path}"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            entry = batch.ManifestEntry.model_validate_json(self.rfile.read(length))
+        except ValidationError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for event in self.server.songbird.run_job(entry):
+            self.write_chunk((event.model_dump_json() + "\n").encode("utf-8"))
+        self.write_chunk(b"")
+
+    def send_json(self, code: int, body: dict):
+        """Send a json response
+
+        Args:
+            code (int): the http status code
+            body (dict): the response body
+        """
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def write_chunk(self, data: bytes):
+        """Write a chunk of a chunked response, flushing it to the client straight away.
+        An empty chunk ends the response.
+
+        Args:
+            data (bytes): the chunk
+        """
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format: str, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+
+class HTTPServer(http.server.ThreadingHTTPServer):
+    """Serves the http api, handling each request in its own thread"""
+
+    daemon_threads = True
+
+    def __init__(self, address, songbird: SongbirdServer):
+        """
+        Args:
+            address (Tuple[str, int]): the host and port to listen on. Port 0 picks a free port.
+            songbird (SongbirdServer): the server to run jobs with
+        """
+        super().__init__(address, RequestHandler)
+        self.songbird = songbird
+
+
+def submit(url: str, entry: batch.ManifestEntry) -> Iterator[JobEvent]:
+    """Send a job to a running server, following its progress
+
+    Args:
+        url (str): the url of the server, e.g. http://127.0.0.1:8765
+        entry (batch.ManifestEntry): the song or album
+
+    Yields:
+        Iterator[JobEvent]: the progress of the job, as the server sends it
+    """
+    try:
+        with requests.post(
+            f"{url}/jobs", data=entry.model_dump_json(), stream=True
+        ) as response:
+            if response.status_code != 200:
+                logger.error(f"Server rejected the job: {response.text}")
+                return
+            for line in response.iter_lines():
+                if line:
+                    yield JobEvent.model_validate_json(line)
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Could not reach the server at {url}: {e}")
+
+
+def run(config: Optional[settings.SongbirdCliConfig] = None):
+    """entrypoint for songbirdcli's server mode. Starts the warm resources, then
+    serves jobs on `server_host`:`server_port` until interrupted.
+
+    Args:
+        config (Optional[settings.SongbirdCliConfig], optional): songbirdcli settings pydantic model
+    """
+    if not config:
+        config = settings.SongbirdCliConfig(version=cli.version.version)
+    common.set_logger_config_globally(log_level=config.log_level)
+    if config.run_local:
+        cli.initialize_dirs(
+            [
+                config.get_data_path(),
+                config.get_itunes_folder_path(),
+                config.get_itunes_lib_path(),
+                config.get_gdrive_folder_path(),
+                config.get_local_folder_path(),
+            ]
+        )
+    if not cli.validate_essentials(config):
+        return
+
+    timing.set_recorder(timing.Recorder.from_config(config))
+    transcode.set_transcoder(transcode.Transcoder.from_config(config))
+    songbird = SongbirdServer.from_config(config)
+    httpd = HTTPServer((config.server_host, config.server_port), songbird)
+    try:
+        host, port = httpd.server_address[:2]
+        logger.info(f"Serving songbird on http://{host}:{port}")
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("\nReceived keyboard interrupt :o")
+    finally:
+        httpd.server_close()
+        songbird.close()
+        transcode.get_transcoder().close()
+        cli.remove_staging_folders(config)
+        throttle.get_throttle().log_stats()
+        timing.get_recorder().close()
+        if config.timings_enabled:
+            timing.get_recorder().log_summary()
+
+    logger.info("Shutting down!")
@@ -1,13 +1,31 @@
 import os
 import sys
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 import pydantic
 from pydantic import BaseModel, Field, field_validator, ValidationInfo
 from pydantic_settings import BaseSettings
 import sys
 
+# the formats songs can be saved in
+FILE_FORMATS = ["mp3", "m4a", "flac", "opus"]
+
+
+class FormatProfile(BaseModel):
+    """The format songs saved to a destination are encoded in"""
+
+    file_format: str
+    """specifies the file format, one of FILE_FORMATS"""
+    bitrate: Optional[str] = None
+    """specifies the audio bitrate, e.g. 256k. None uses the encoder's default, and is ignored for flac."""
+
+    @field_validator("file_format")
+    def validate_file_format(cls, value: str):
+        if value not in FILE_FORMATS:
+            raise ValueError(f"file_format must be one of {FILE_FORMATS}")
+        return value
+
 
 class SongbirdCliConfig(BaseSettings):
     """Configuration using .env file or defaults declared in here"""
@@ -30,6 +48,15 @@ class SongbirdCliConfig(BaseSettings):
 
     data_path: str = "data"
     itunes_search_api_base_url: str = "https://itunes.apple.com/search"
+    itunes_lookup_api_base_url: str = "https://itunes.apple.com/lookup"
+    itunes_cache_enabled: bool = True
+    itunes_cache_ttl: int = 86400
+    itunes_cache_lookup_ttl: int = 2592000
+    itunes_cache_max_entries: int = 2000
+    itunes_requests_per_minute: int = 20
+    itunes_max_connections: int = 4
+    artwork_cache_enabled: bool = True
+    artwork_cache_max_bytes: int = 268435456
     itunes_enabled: bool = True
     itunes_folder_path: Optional[str] = "itunesauto"
     itunes_lib_path: Optional[str] = "ituneslib"
@@ -37,14 +64,30 @@ class SongbirdCliConfig(BaseSettings):
     gdrive_folder_path: Optional[str] = "gdrive"
     gdrive_folder_id: Optional[str] = ""
     gdrive_auth_port: int = 8080
+    gdrive_upload_workers: int = 2
+    gdrive_upload_chunk_size: int = 5242880
     local_song_store_str: str = "dump"
+    library_index_enabled: bool = True
     fname_dup_key: str = "_dup"
-    fname_dup_limit: int = 8
     youtube_dl_enabled: bool = True
+    youtube_prefetch_enabled: bool = True
     youtube_render_timeout: int = 20
     youtube_render_wait: float = 0.2
     youtube_render_sleep: int = 1
     youtube_render_retries: int = 3
+    youtube_render_pool_size: int = 1
+    youtube_render_pool_max_pages: int = 50
+    youtube_search_engine: str = "render"
+    youtube_match_threshold: float = 0.75
+    youtube_auto_select_enabled: bool = False
+
+    @field_validator("youtube_search_engine")
+    def validate_youtube_search_engine(cls, value: str):
+        engines = ["render", "http", "ytdlp"]
+        if value not in engines:
+            raise ValueError(f"youtube_search_engine must be one of {engines}")
+        return value
+
     youtube_home_url: str = "https://www.youtube.com"
     youtube_search_url: str = "https://www.youtube.com/results"
     youtube_search_tag: str = "search_query"
@@ -52,6 +95,43 @@ class SongbirdCliConfig(BaseSettings):
     youtube_dl_retries: int = 3
     file_format: str = "mp3"
 
+    @field_validator("file_format")
+    def validate_file_format(cls, value: str):
+        if value not in FILE_FORMATS:
+            raise ValueError(f"file_format must be one of {FILE_FORMATS}")
+        return value
+
+    format_profiles: Dict[str, FormatProfile] = {}
+
+    @field_validator("format_profiles")
+    def validate_format_profiles(cls, value: Dict[str, FormatProfile]):
+        for destination in value:
+            if destination not in ["g", "i", "l"]:
+                raise ValueError(
+                    f"format_profiles must be keyed by a destination, one of g, i or l, not {destination}"
+                )
+        return value
+
+    transcode_workers: int = 2
+
+    pipeline_workers: int = 1
+    album_fast_path_enabled: bool = True
+    album_workers: int = 4
+    journal_enabled: bool = True
+    timings_enabled: bool = False
+    server_host: str = "127.0.0.1"
+    server_port: int = 8765
+    library_watcher: str = "auto"
+    library_poll_interval: float = 10.0
+    tagging_workers: int = 4
+
+    @field_validator("library_watcher")
+    def validate_library_watcher(cls, value: str):
+        watchers = ["auto", "inotify", "poll", "off"]
+        if value not in watchers:
+            raise ValueError(f"library_watcher must be one of {watchers}")
+        return value
+
     class ConfigDict:
         env = os.getenv("ENV", "dev")
         config_path = os.path.join(os.path.dirname(sys.path[0]), f"{env}.env")
@@ -0,0 +1,599 @@
+"""
+tagging.py module for writing the itunes properties of songs into their tags, and for
+retagging a folder of saved songs in a process pool
+"""
+
+import base64
+import functools
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+from songbirdcore import common
+from songbirdcore.models import itunes_api, modes
+
+from songbirdcli import artwork
+from songbirdcli import itunes_search
+from songbirdcli import lazy
+from songbirdcli import matching
+from songbirdcli import settings
+from songbirdcli import version
+
+logger = logging.getLogger(__name__)
+
+mutagen = lazy.load("mutagen")
+easyid3 = lazy.load("mutagen.easyid3")
+id3 = lazy.load("mutagen.id3")
+mp4 = lazy.load("mutagen.mp4")
+flac = lazy.load("mutagen.flac")
+oggopus = lazy.load("mutagen.oggopus")
+itunes = lazy.load("songbirdcore.itunes")
+
+# the formats songs can be tagged in
+TAG_FORMATS = ["mp3", "m4a", "flac", "opus"]
+# files handed to each worker at a time when retagging
+CHUNK_SIZE = 32
+
+
+class SongTags(BaseModel):
+    """The tags read from a saved song, used to find its itunes properties"""
+
+    title: str = ""
+    """specifies the song name"""
+    artist: str = ""
+    """specifies the artist name, preferring the album artist"""
+    album: str = ""
+    """specifies the album name"""
+    track_number: Optional[int] = None
+    """specifies the song number in the album"""
+    disc_number: Optional[int] = None
+    """specifies the disc number in the album"""
+
+
+class TagJob(BaseModel):
+    """A song to retag, as handed to a worker"""
+
+    file_path: str
+    """specifies the path of the song"""
+    song: itunes_api.ItunesApiSongModel
+    """specifies the itunes properties to tag the song with"""
+    image_path: Optional[str] = None
+    """specifies the path of the artwork to embed. None keeps the artwork the song has."""
+
+
+class RetagResult(BaseModel):
+    """The outcome of retagging a song"""
+
+    file_path: str
+    """specifies the path of the song"""
+    status: str
+    """specifies the outcome. One of tagged, unmatched or failed"""
+    message: str = ""
+    """specifies details about the outcome"""
+
+
+def get_file_format(file_path: str) -> Optional[str]:
+    """Get the format of a song from its extension
+
+    Args:
+        file_path (str): the path of the song
+
+    Returns:
+        Optional[str]: the format, None if songs in it cannot be tagged
+    """
+    file_format = os.path.splitext(file_path)[1][1:].lower()
+    return file_format if file_format in TAG_FORMATS else None
+
+
+def write_tags(
+    file_path: str,
+    file_format: str,
+    song: itunes_api.ItunesApiSongModel,
+    image: Optional[bytes] = None,
+) -> bool:
+    """Tag a song with its itunes properties and artwork in a single write. The tags are
+    rewritten in place within the padding left around them, so the audio is only moved
+    when the tags outgrow it, and padding is left for the next write when it is.
+    Ogg (opus) files are the exception, as the pages after the tags are renumbered
+    should the tags span a different number of pages.
+
+    Args:
+        file_path (str): the path of the song
+        file_format (str): the format of the song, one of TAG_FORMATS
+        song (itunes_api.ItunesApiSongModel): the itunes properties of the song
+        image (Optional[bytes], optional): the artwork to embed. Defaults to None, keeping the artwork the song has.
+
+    Returns:
+        bool: True if the song was tagged
+    """
+    try:
+        if file_format == "mp3":
+            write_id3(file_path, song, image)
+        elif file_format == "m4a":
+            write_mp4(file_path, song, image)
+        elif file_format in ["flac", "opus"]:
+            write_vorbis(file_path, file_format, song, image)
+        else:
+            logger.warning(f"Cannot tag {file_format} files.")
+            return False
+    except Exception as e:
+        logger.exception(f"Unexpected error occured while tagging {file_path}: {e}")
+        return False
+    logger.debug(f"Tagged {file_path}")
+    return True
+
+
+def write_id3(
+    file_path: str, song: itunes_api.ItunesApiSongModel, image: Optional[bytes]
+):
+    """Write the tags of an mp3, see `write_tags`"""
+    try:
+        tags = id3.ID3(file_path)
+    except id3.ID3NoHeaderError:
+        tags = id3.ID3()
+    tags.setall("TIT2", [id3.TIT2(encoding=3, text=song.trackName)])
+    tags.setall("TPE1", [id3.TPE1(encoding=3, text=song.artistName)])
+    tags.setall("TALB", [id3.TALB(encoding=3, text=song.collectionName)])
+    tags.setall("TCON", [id3.TCON(encoding=3, text=song.primaryGenreName)])
+    tags.setall(
+        "TRCK", [id3.TRCK(encoding=3, text=f"{song.trackNumber}/{song.trackCount}")]
+    )
+    tags.setall(
+        "TPOS", [id3.TPOS(encoding=3, text=f"{song.discNumber}/{song.discCount}")]
+    )
+    tags.setall("TDRC", [id3.TDRC(encoding=3, text=song.releaseDate)])
+    if song.collectionArtistName:
+        tags.setall("TPE2", [id3.TPE2(encoding=3, text=song.collectionArtistName)])
+    if image is not None:
+        # 3 is the front cover
+        tags.setall(
+            "APIC",
+            [
+                id3.APIC(
+                    encoding=3,
+                    mime=artwork.get_mime_type(image),
+                    type=3,
+                    desc="",
+                    data=image,
+                )
+            ],
+        )
+    tags.save(file_path)
+
+
+def write_mp4(
+    file_path: str, song: itunes_api.ItunesApiSongModel, image: Optional[bytes]
+):
+    """Write the tags of an m4a, see `write_tags`"""
+    audiofile = mp4.MP4(file_path)
+    if audiofile.tags is None:
+        audiofile.add_tags()
+    audiofile["\xa9ART"] = song.artistName
+    audiofile["\xa9alb"] = song.collectionName
+    audiofile["\xa9nam"] = song.trackName
+    audiofile["\xa9gen"] = song.primaryGenreName
+    audiofile["trkn"] = [(song.trackNumber, song.trackCount)]
+    audiofile["disk"] = [(song.discNumber, song.discCount)]
+    audiofile["\xa9day"] = song.releaseDate
+    if song.collectionArtistName:
+        audiofile["aART"] = song.collectionArtistName
+    if image is not None:
+        image_format = (
+            mp4.MP4Cover.FORMAT_PNG
+            if artwork.get_mime_type(image) == "image/png"
+            else mp4.MP4Cover.FORMAT_JPEG
+        )
+        audiofile["covr"] = [mp4.MP4Cover(image, image_format)]
+    audiofile.save()
+
+
+def write_vorbis(
+    file_path: str,
+    file_format: str,
+    song: itunes_api.ItunesApiSongModel,
+    image: Optional[bytes],
+):
+    """Write the vorbis comments of a flac or opus, see `write_tags`"""
+    if file_format == "flac":
+        audiofile = flac.FLAC(file_path)
+    else:
+        audiofile = oggopus.OggOpus(file_path)
+    if audiofile.tags is None:
+        audiofile.add_tags()
+    audiofile["title"] = song.trackName
+    audiofile["artist"] = song.artistName
+    audiofile["album"] = song.collectionName
+    audiofile["genre"] = song.primaryGenreName
+    audiofile["tracknumber"] = str(song.trackNumber)
+    audiofile["tracktotal"] = str(song.trackCount)
+    audiofile["discnumber"] = str(song.discNumber)
+    audiofile["disctotal"] = str(song.discCount)
+    audiofile["date"] = song.releaseDate
+    if song.collectionArtistName:
+        audiofile["albumartist"] = song.collectionArtistName
+    if image is not None:
+        picture = flac.Picture()
+        # 3 is the front cover
+        picture.type = 3
+        picture.mime = artwork.get_mime_type(image)
+        picture.data = image
+        if file_format == "flac":
+            audiofile.clear_pictures()
+            audiofile.add_picture(picture)
+        else:
+            # ogg files carry the picture block within their comments
+            audiofile["metadata_block_picture"] = [
+                base64.b64encode(picture.write()).decode("ascii")
+            ]
+    audiofile.save()
+
+
+def fetch_artwork(url: str) -> Optional[bytes]:
+    """Fetch the artwork of a song without a cache, as `songbirdcore.itunes.mp3ID3Tagger` does
+
+    Args:
+        url (str): the artwork url, as given in artworkUrl100
+
+    Returns:
+        Optional[bytes]: the image, None if it could not be fetched
+    """
+    if not url:
+        return None
+    try:
+        response = itunes.artwork_searcher(url)
+    except Exception as e:
+        logger.error(f"Failed to fetch album art: {e}")
+        return None
+    if response is None:
+        return None
+    return response.content
+
+
+def tag_song(
+    file_path: str,
+    file_format: str,
+    song: itunes_api.ItunesApiSongModel,
+    cache: Optional[artwork.ArtworkCache] = None,
+) -> bool:
+    """Tag a song with its itunes properties and artwork, see `write_tags`
+
+    Args:
+        file_path (str): the path of the song
+        file_format (str): the format of the song, one of TAG_FORMATS
+        song (itunes_api.ItunesApiSongModel): the itunes properties of the song
+        cache (Optional[artwork.ArtworkCache], optional): the cache to read artwork from. Defaults to None, fetching it.
+
+    Returns:
+        bool: True if the song was tagged, even if its artwork could not be found
+    """
+    if file_format not in TAG_FORMATS:
+        logger.warning(
+            "You've specified a file format that is has no tagger supported yet. Saving file without tags."
+        )
+        return False
+    if cache is not None:
+        image = cache.get_for_song(song)
+    else:
+        image = fetch_artwork(song.artworkUrl100)
+    return write_tags(file_path, file_format, song, image)
+
+
+def parse_number(value: str) -> Optional[int]:
+    """Parse a track or disc number, given alone or as a fraction e.g. 3/12"""
+    match = re.match(r"\s*(\d+)", value)
+    return int(match.group(1)) if match else None
+
+
+def read_tags(file_path: str) -> SongTags:
+    """Read the tags of a saved song. Songs without tags fall back to the title in their
+    file name, less any leading track number.
+
+    Args:
+        file_path (str): the path of the song
+
+    Returns:
+        SongTags: the tags
+    """
+    tags = {}
+    try:
+        if file_path.lower().endswith(".mp3"):
+            # reads the id3 tag alone, without parsing the audio frames
+            tags = easyid3.EasyID3(file_path)
+        else:
+            audio = mutagen.File(file_path, easy=True)
+            if audio is not None and audio.tags is not None:
+                tags = audio.tags
+    except (mutagen.MutagenError, OSError, ValueError) as e:
+        logger.debug(f"Could not read the tags of {file_path}: {e}")
+
+    def get(key: str) -> str:
+        return (tags.get(key) or [""])[0]
+
+    title = get("title")
+    if title == "":
+        title = re.sub(
+            r"^\d+[\s.-]+", "", os.path.splitext(os.path.basename(file_path))[0]
+        )
+    return SongTags(
+        title=title,
+        artist=get("albumartist") or get("artist"),
+        album=get("album"),
+        track_number=parse_number(get("tracknumber")),
+        disc_number=parse_number(get("discnumber")),
+    )
+
+
+def find_songs(folder: str) -> List[str]:
+    """Find the songs that can be tagged within a folder and its subfolders
+
+    Args:
+        folder (str): the folder
+
+    Returns:
+        List[str]: the paths of the songs, sorted so that songs in the same folder are tagged together
+    """
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(folder):
+        # skip the staging folders of songs still being downloaded
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        paths.extend(os.path.join(dirpath, f) for f in filenames if get_file_format(f))
+    return sorted(paths)
+
+
+def match_track(
+    tags: SongTags, tracks: List[itunes_api.ItunesApiSongModel]
+) -> Optional[itunes_api.ItunesApiSongModel]:
+    """Find the track of an album a song is, by its title, or else by its track and disc number
+
+    Args:
+        tags (SongTags): the tags of the song
+        tracks (List[itunes_api.ItunesApiSongModel]): the tracks of the album
+
+    Returns:
+        Optional[itunes_api.ItunesApiSongModel]: the track, None if no track matches
+    """
+    title = matching.normalize(tags.title)
+    for track in tracks:
+        if matching.normalize(track.trackName) == title:
+            return track
+    if tags.track_number is None:
+        return None
+    numbered = [
+        track
+        for track in tracks
+        if track.trackNumber == tags.track_number
+        and (tags.disc_number is None or track.discNumber == tags.disc_number)
+    ]
+    return numbered[0] if len(numbered) == 1 else None
+
+
+def resolve_songs(
+    tags: Dict[str, SongTags],
+    itunes_client: itunes_search.ItunesClient,
+    itunes_id: Optional[int] = None,
+) -> Dict[str, itunes_api.ItunesApiSongModel]:
+    """Find the itunes properties of saved songs. Songs are grouped by album, so each album
+    is searched for once, and the queries are run concurrently. Songs without an album
+    are searched for by their title.
+
+    Args:
+        tags (Dict[str, SongTags]): the path of each song, and its tags
+        itunes_client (itunes_search.ItunesClient): the client used to query the itunes api
+        itunes_id (Optional[int], optional): the itunes collection id every song belongs to. Defaults to None, searching for each album.
+
+    Returns:
+        Dict[str, itunes_api.ItunesApiSongModel]: the path of each song found, and its properties
+    """
+    albums: Dict[Tuple[str, str], List[str]] = {}
+    singles: List[str] = []
+    for path, song_tags in tags.items():
+        if itunes_id is not None:
+            albums.setdefault(("", ""), []).append(path)
+        elif song_tags.album:
+            albums.setdefault((song_tags.artist, song_tags.album), []).append(path)
+        else:
+            singles.append(path)
+
+    if itunes_id is not None:
+        collection_ids = [itunes_id]
+    else:
+        album_keys = list(albums.keys())
+        results = itunes_client.query_many(
+            [
+                itunes_search.ItunesQuery(
+                    search_variable=f"{artist} {album}".strip(),
+                    limit=1,
+                    mode=modes.Modes.ALBUM,
+                )
+                for artist, album in album_keys
+            ]
+        )
+        collection_ids = []
+        for (artist, album), found in zip(album_keys, results):
+            if not found:
+                logger.warning(f"Could not find the album {album} by {artist}.")
+                collection_ids.append(None)
+            else:
+                collection_ids.append(found[0].collectionId)
+
+    lookups = [
+        itunes_search.ItunesQuery(
+            search_variable=collection_id, limit=200, mode=modes.Modes.SONG, lookup=True
+        )
+        for collection_id in collection_ids
+        if collection_id is not None
+    ]
+    searches = [
+        itunes_search.ItunesQuery(
+            search_variable=f"{tags[path].artist} {tags[path].title}".strip(),
+            limit=1,
+            mode=modes.Modes.SONG,
+        )
+        for path in singles
+    ]
+    results = iter(itunes_client.query_many(lookups + searches))
+
+    songs = {}
+    for paths, collection_id in zip(albums.values(), collection_ids):
+        tracks = next(results) if collection_id is not None else None
+        for path in paths:
+            song = match_track(tags[path], tracks or [])
+            if song is not None:
+                songs[path] = song
+    for path in singles:
+        found = next(results)
+        if found:
+            songs[path] = found[0]
+    return songs
+
+
+@functools.lru_cache(maxsize=8)
+def read_image(image_path: str) -> bytes:
+    """Read an image, cached as the songs of an album are tagged together"""
+    with open(image_path, "rb") as f:
+        return f.read()
+
+
+def tag_file(job: TagJob) -> RetagResult:
+    """Retag a song, run within a worker process
+
+    Args:
+        job (TagJob): the song to retag
+
+    Returns:
+        RetagResult: the outcome
+    """
+    image = None
+    if job.image_path is not None:
+        image = read_image(job.image_path)
+    file_format = get_file_format(job.file_path)
+    if not write_tags(job.file_path, file_format, job.song, image):
+        return RetagResult(
+            file_path=job.file_path, status="failed", message="could not write tags"
+        )
+    return RetagResult(
+        file_path=job.file_path,
+        status="tagged",
+        message=f"{job.song.trackName} by {job.song.artistName}",
+    )
+
+
+def retag(
+    folder: str,
+    config: Optional[settings.SongbirdCliConfig] = None,
+    itunes_id: Optional[int] = None,
+    keep_artwork: bool = False,
+) -> Optional[List[RetagResult]]:
+    """entrypoint for retagging the songs saved in a folder with their latest itunes
+    properties, e.g. after itunes fixes the metadata of an album. Tags are read and written
+    in a pool of tagging_workers processes, each handed batches of songs from the same folder,
+    while the itunes lookups are run concurrently and the artwork of each album is fetched once.
+
+    Args:
+        folder (str): the folder, searched recursively for songs
+        config (Optional[settings.SongbirdCliConfig], optional): songbirdcli settings pydantic model
+        itunes_id (Optional[int], optional): the itunes collection id of the album the folder holds. Defaults to None, searching itunes for each album.
+        keep_artwork (bool, optional): whether to keep the artwork songs have rather than embed the latest. Defaults to False.
+
+    Returns:
+        Optional[List[RetagResult]]: the outcome for each song, None if the folder could not be retagged
+    """
+    if not config:
+        config = settings.SongbirdCliConfig(version=version.version)
+    common.set_logger_config_globally(log_level=config.log_level)
+    if not os.path.isdir(folder):
+        logger.error(f"Cannot retag {folder}, as it is not a folder.")
+        return None
+    paths = find_songs(folder)
+    if len(paths) == 0:
+        logger.info(f"No songs to retag in {folder}.")
+        return []
+    logger.info(f"Retagging {len(paths)} songs in {folder}.")
+
+    itunes_client = itunes_search.ItunesClient.from_config(config)
+    artwork_cache = None
+    if (
+        config.artwork_cache_enabled
+        and not keep_artwork
+        and os.path.exists(config.get_data_path())
+    ):
+        artwork_cache = artwork.ArtworkCache.from_config(config)
+    # spawned rather than forked, as the itunes client runs its event loop in a thread
+    executor = ProcessPoolExecutor(
+        max_workers=max(1, config.tagging_workers),
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    try:
+        tags = dict(zip(paths, executor.map(read_tags, paths, chunksize=CHUNK_SIZE)))
+        songs = resolve_songs(tags, itunes_client, itunes_id=itunes_id)
+        with tempfile.TemporaryDirectory(prefix="songbird-retag-") as image_folder:
+            image_paths: Dict[str, Optional[str]] = {}
+            jobs = []
+            for path in paths:
+                song = songs.get(path)
+                if song is None:
+                    continue
+                image_path = None
+                if not keep_artwork:
+                    key = str(song.collectionId or song.artworkUrl100)
+                    if key not in image_paths:
+                        image_paths[key] = save_artwork(
+                            image_folder, len(image_paths), song, artwork_cache
+                        )
+                    image_path = image_paths[key]
+                jobs.append(TagJob(file_path=path, song=song, image_path=image_path))
+            tagged = {
+                result.file_path: result
+                for result in executor.map(tag_file, jobs, chunksize=CHUNK_SIZE)
+            }
+    finally:
+        executor.shutdown()
+        itunes_client.close()
+        if artwork_cache is not None:
+            artwork_cache.close()
+
+    results = [
+        tagged.get(path)
+        or RetagResult(
+            file_path=path, status="unmatched", message="not found in itunes"
+        )
+        for path in paths
+    ]
+    for status in ["tagged", "unmatched", "failed"]:
+        count = sum(result.status == status for result in results)
+        logger.info(f"{status}: {count}")
+    return results
+
+
+def save_artwork(
+    folder: str,
+    idx: int,
+    song: itunes_api.ItunesApiSongModel,
+    cache: Optional[artwork.ArtworkCache] = None,
+) -> Optional[str]:
+    """Save the artwork of a song's album to a file the workers read it from
+
+    Args:
+        folder (str): the folder to save to
+        idx (int): the number of the album, naming the file
+        song (itunes_api.ItunesApiSongModel): the itunes properties of the song
+        cache (Optional[artwork.ArtworkCache], optional): the cache to read artwork from. Defaults to None, fetching it.
+
+    Returns:
+        Optional[str]: the path of the artwork, None if it could not be found
+    """
+    if cache is not None:
+        image = cache.get_for_song(song)
+    else:
+        image = fetch_artwork(song.artworkUrl100)
+    if image is None:
+        return None
+    image_path = os.path.join(folder, str(idx))
+    with open(image_path, "wb") as f:
+        f.write(image)
+    return image_path
@@ -0,0 +1,348 @@
+"""
+throttle.py module for pacing the requests sent to each host, backing off
+and retrying when a host signals that it is overloaded
+"""
+
+import email.utils
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+from urllib.parse import urlparse
+
+import requests
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# status codes of responses asking the client to slow down
+THROTTLED_STATUS_CODES = [403, 429, 503]
+# the rate each host starts at and the highest it is raised to, in requests per second,
+# and the number of requests that may be sent at once after a quiet period
+HOST_RATES: Dict[str, Tuple[float, float, int]] = {
+    # apple advises about 20 requests per minute
+    "itunes.apple.com": (20 / 60, 20 / 60, 1),
+    "www.youtube.com": (1.0, 5.0, 5),
+}
+DEFAULT_RATE = (2.0, 10.0, 5)
+# the lowest fraction of its starting rate a host is slowed to
+MIN_RATE_FRACTION = 1 / 16
+
+
+class HostStats(BaseModel):
+    """The requests sent to a host"""
+
+    host: str
+    """specifies the host"""
+    rate: float
+    """specifies the current rate of requests to the host, per second"""
+    requests: int = 0
+    """specifies the number of requests sent, including retries"""
+    throttled: int = 0
+    """specifies the number of responses asking to slow down"""
+    retries: int = 0
+    """specifies the number of requests retried"""
+    failures: int = 0
+    """specifies the number of requests that failed after every retry"""
+    waited: float = 0.0
+    """specifies the total seconds requests waited on the rate limit"""
+
+
+def get_host(url: str) -> str:
+    """Get the host of a url, or the url itself if it is already a host"""
+    return urlparse(url).netloc or url
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header, given either in seconds or as an http date
+
+    Args:
+        value (Optional[str]): the header value
+
+    Returns:
+        Optional[float]: the seconds to wait, None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def get_backoff(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Get the delay before retrying, growing exponentially with each attempt. The
+    delay is drawn at random up to that bound, so that callers failing together
+    do not retry together.
+
+    Args:
+        attempt (int): the number of attempts made so far, minus one
+        base_delay (float): the bound of the first delay in seconds
+        max_delay (float): the largest bound in seconds
+
+    Returns:
+        float: the delay in seconds
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2**attempt))
+
+
+class HostLimiter:
+    """A token bucket pacing the requests sent to one host. Its rate adapts to the host,
+    halving whenever the host asks to slow down, and climbing back a step with each
+    success, so that requests are sent as fast as the host allows without tuning.
+    """
+
+    def __init__(self, host: str, rate: float, max_rate: float, burst: int):
+        """
+        Args:
+            host (str): the host
+            rate (float): the starting rate in requests per second
+            max_rate (float): the highest rate in requests per second
+            burst (int): the number of requests that may be sent at once after a quiet period
+        """
+        self.host = host
+        self.max_rate = max(rate, max_rate)
+        self.min_rate = rate * MIN_RATE_FRACTION
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        # set by Retry-After, holding back every request to the host
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+        self.stats = HostStats(host=host, rate=rate)
+
+    @property
+    def rate(self) -> float:
+        return self.stats.rate
+
+    def reserve(self) -> float:
+        """Take a token for a request
+
+        Returns:
+            float: the seconds the request must wait before it is sent
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            # tokens may go negative, queueing requests behind each other
+            self.tokens -= 1
+            delay = max(0.0, -self.tokens / self.rate, self.blocked_until - now)
+            self.stats.requests += 1
+            self.stats.waited += delay
+        return delay
+
+    def wait(self):
+        """Block until a request may be sent"""
+        delay = self.reserve()
+        if delay > 0:
+            logger.debug(f"Waiting {delay:.1f}s to send a request to {self.host}")
+            time.sleep(delay)
+
+    def on_success(self):
+        """Raise the rate a step after a successful request"""
+        with self.lock:
+            self.stats.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+    def on_throttled(self, retry_after: Optional[float] = None):
+        """Halve the rate after the host asked to slow down
+
+        Args:
+            retry_after (Optional[float], optional): seconds the host asked to wait for. Defaults to None.
+        """
+        with self.lock:
+            self.stats.throttled += 1
+            self.stats.rate = max(self.min_rate, self.rate / 2)
+            if retry_after is not None:
+                self.blocked_until = max(
+                    self.blocked_until, time.monotonic() + retry_after
+                )
+        logger.warning(
+            f"{self.host} asked to slow down, sending {self.rate:.2f} requests per second."
+        )
+
+    def on_retry(self):
+        with self.lock:
+            self.stats.retries += 1
+
+    def on_failure(self):
+        with self.lock:
+            self.stats.failures += 1
+
+
+class Throttle:
+    """Paces the requests sent to each host with a `HostLimiter`, and retries requests
+    that failed with exponential backoff, honouring the Retry-After header of throttled
+    responses. Shared by every client making requests, see `get_throttle`.
+    """
+
+    def __init__(
+        self, max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 60.0
+    ):
+        """
+        Args:
+            max_retries (int, optional): retries of a throttled request before giving up. Defaults to 3.
+            base_delay (float, optional): the bound of the first backoff in seconds. Defaults to 1.
+            max_delay (float, optional): the largest bound of a backoff in seconds. Defaults to 60.
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.limiters: Dict[str, HostLimiter] = {}
+
+    def get(self, url: str) -> HostLimiter:
+        """Get the limiter of a host, creating it on first use
+
+        Args:
+            url (str): a url of the host, or the host
+
+        Returns:
+            HostLimiter: the limiter
+        """
+        host = get_host(url)
+        with self.lock:
+            limiter = self.limiters.get(host)
+            if limiter is None:
+                rate, max_rate, burst = HOST_RATES.get(host, DEFAULT_RATE)
+                limiter = HostLimiter(host, rate, max_rate, burst)
+                self.limiters[host] = limiter
+            return limiter
+
+    def configure(self, url: str, rate: float, max_rate: float, burst: int):
+        """Replace the limiter of a host, e.g. with a rate from the songbirdcli config
+
+        Args:
+            url (str): a url of the host, or the host
+            rate (float): the starting rate in requests per second
+            max_rate (float): the highest rate in requests per second
+            burst (int): the number of requests that may be sent at once after a quiet period
+        """
+        host = get_host(url)
+        with self.lock:
+            self.limiters[host] = HostLimiter(host, rate, max_rate, burst)
+
+    def backoff(self, attempt: int):
+        time.sleep(get_backoff(attempt, self.base_delay, self.max_delay))
+
+    def request(
+        self, url: str, send: Callable[[], requests.Response]
+    ) -> requests.Response:
+        """Send a request once the host's rate allows, retrying it while the host asks to slow down
+
+        Args:
+            url (str): the url requested
+            send (Callable[[], requests.Response]): sends the request, e.g. `lambda: session.get(url)`
+
+        Returns:
+            requests.Response: the response, throttled if every retry was throttled
+
+        Raises:
+            requests.exceptions.RequestException: if the last attempt could not connect
+        """
+        limiter = self.get(url)
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                limiter.on_retry()
+            limiter.wait()
+            try:
+                response = send()
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ):
+                if attempt == self.max_retries:
+                    limiter.on_failure()
+                    raise
+                self.backoff(attempt)
+                continue
+            if response.status_code not in THROTTLED_STATUS_CODES:
+                limiter.on_success()
+                return response
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            limiter.on_throttled(retry_after)
+            if attempt == self.max_retries:
+                break
+            # a Retry-After holds back the limiter itself
+            if retry_after is None:
+                self.backoff(attempt)
+        limiter.on_failure()
+        return response
+
+    def call(
+        self, url: str, fn: Callable[[], Optional[T]], retries: Optional[int] = None
+    ) -> Optional[T]:
+        """Call a function that requests a host without exposing its responses, such as yt-dlp.
+        The call is paced as a request would be, and retried with backoff while it returns None.
+        Failures do not slow the host, as they cannot be told apart from e.g. a missing video.
+
+        Args:
+            url (str): the url requested
+            fn (Callable[[], Optional[T]]): the function, returning None on failure
+            retries (Optional[int], optional): retries before giving up. Defaults to max_retries.
+
+        Returns:
+            Optional[T]: the result of the function, None if every attempt failed
+        """
+        limiter = self.get(url)
+        retries = self.max_retries if retries is None else retries
+        for attempt in range(retries + 1):
+            if attempt > 0:
+                limiter.on_retry()
+                self.backoff(attempt - 1)
+            limiter.wait()
+            result = fn()
+            if result is not None:
+                limiter.on_success()
+                return result
+            if attempt < retries:
+                logger.warning(
+                    f"Request to {limiter.host} failed, retrying. {attempt + 1}:{retries}."
+                )
+        limiter.on_failure()
+        return None
+
+    def get_stats(self) -> List[HostStats]:
+        """Get the stats of every host requested
+
+        Returns:
+            List[HostStats]: the stats, by host
+        """
+        with self.lock:
+            limiters = sorted(self.limiters.values(), key=lambda l: l.host)
+        return [limiter.stats.model_copy() for limiter in limiters]
+
+    def log_stats(self):
+        for stats in self.get_stats():
+            logger.info(
+                f"{stats.host}: {stats.requests} requests, {stats.throttled} throttled, "
+                + f"{stats.retries} retried, {stats.failures} failed, "
+                + f"waited {stats.waited:.1f}s, at {stats.rate:.2f} per second"
+            )
+
+
+_throttle: Optional[Throttle] = None
+_throttle_lock = threading.Lock()
+
+
+def get_throttle() -> Throttle:
+    """Get the throttle shared by the whole process, creating it on first use
+
+    Returns:
+        Throttle: the throttle
+    """
+    global _throttle
+    with _throttle_lock:
+        if _throttle is None:
+            _throttle = Throttle()
+        return _throttle
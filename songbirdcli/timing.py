@@ -0,0 +1,303 @@
+"""
+timing.py module for timing the stages each song goes through, keeping the time
+spent waiting on the user apart from the time spent working
+"""
+
+import contextlib
+import datetime
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+from pydantic import BaseModel
+
+from songbirdcli import settings
+
+logger = logging.getLogger(__name__)
+
+# the stage recording the time spent waiting on the user
+PROMPT_STAGE = "prompt"
+
+
+class SongTimings(BaseModel):
+    """The time a song spent in each stage"""
+
+    song_name: str
+    """specifies the name of the song"""
+    stages: Dict[str, float] = {}
+    """specifies the seconds spent working in each stage"""
+    machine_time: float = 0.0
+    """specifies the seconds spent working on the song"""
+    user_time: float = 0.0
+    """specifies the seconds spent waiting on the user"""
+    bytes_downloaded: int = 0
+    """specifies the size of the downloaded song"""
+
+
+class StageSummary(BaseModel):
+    """The times of a stage over a session"""
+
+    stage: str
+    """specifies the stage"""
+    count: int
+    """specifies the number of times the stage ran"""
+    total: float
+    """specifies the total seconds spent in the stage"""
+    p50: float
+    """specifies the median seconds spent in the stage"""
+    p95: float
+    """specifies the 95th percentile of the seconds spent in the stage"""
+
+
+def get_percentile(values: List[float], percentile: float) -> float:
+    """Get a percentile of values by the nearest rank method
+
+    Args:
+        values (List[float]): the values, sorted
+        percentile (float): the percentile, from 0 to 100
+
+    Returns:
+        float: the value at the percentile, 0 if there are no values
+    """
+    if len(values) == 0:
+        return 0.0
+    rank = max(1, math.ceil(percentile / 100 * len(values)))
+    return values[rank - 1]
+
+
+class Span:
+    """A stage being timed"""
+
+    def __init__(self, stage: str, song_name: Optional[str], user: bool):
+        self.stage = stage
+        self.song_name = song_name
+        self.user = user
+        self.start = time.perf_counter()
+        # time spent waiting on the user within this span
+        self.excluded = 0.0
+
+
+class Recorder:
+    """Records the time spent in each stage, per song and over the whole session. Stages are timed
+    with `span`, and the time of prompts is subtracted from the spans enclosing them, so waiting on
+    the user is reported as user time rather than inflating the stage. If a report path is given,
+    the timings of each song are written to it as json lines once the song is finished.
+    """
+
+    def __init__(self, report_path: Optional[str] = None):
+        """
+        Args:
+            report_path (Optional[str], optional): the path of the json lines report. Defaults to None, writing no report.
+        """
+        self.report_path = report_path
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.durations: Dict[str, List[float]] = {}
+        self.songs: Dict[str, SongTimings] = {}
+        self.bytes_downloaded = 0
+        self.machine_time = 0.0
+        self.user_time = 0.0
+
+    @classmethod
+    def from_config(cls, config: settings.SongbirdCliConfig) -> "Recorder":
+        """Create a recorder, writing its report to the data path if timings are enabled
+
+        Args:
+            config (settings.SongbirdCliConfig): the songbirdcli config
+
+        Returns:
+            Recorder: the recorder
+        """
+        report_path = None
+        if config.timings_enabled:
+            timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+            report_path = os.path.join(
+                config.get_data_path(), f"timings-{timestamp}.jsonl"
+            )
+        return cls(report_path)
+
+    def get_stack(self) -> List[Span]:
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def get_song(self, song_name: str) -> SongTimings:
+        """Get the timings of a song, expects self.lock to be held"""
+        timings = self.songs.get(song_name)
+        if timings is None:
+            timings = SongTimings(song_name=song_name)
+            self.songs[song_name] = timings
+        return timings
+
+    @contextlib.contextmanager
+    def song(self, song_name: str) -> Iterator[None]:
+        """Attribute the spans in this thread to a song, unless they name their own"""
+        previous = getattr(self.local, "song_name", None)
+        self.local.song_name = song_name
+        try:
+            yield
+        finally:
+            self.local.song_name = previous
+
+    @contextlib.contextmanager
+    def span(
+        self, stage: str, song_name: Optional[str] = None, user: bool = False
+    ) -> Iterator[None]:
+        """Time a stage
+
+        Args:
+            stage (str): the name of the stage
+            song_name (Optional[str], optional): the song to attribute the time to. Defaults to the song set with `song`.
+            user (bool, optional): whether the stage waits on the user. Defaults to False.
+        """
+        if song_name is None:
+            song_name = getattr(self.local, "song_name", None)
+        span = Span(stage, song_name, user)
+        stack = self.get_stack()
+        stack.append(span)
+        try:
+            yield
+        finally:
+            stack.pop()
+            elapsed = time.perf_counter() - span.start
+            if user:
+                for outer in stack:
+                    outer.excluded += elapsed
+            self.record(span, elapsed - span.excluded)
+
+    def record(self, span: Span, seconds: float):
+        # nested spans are already counted by the span enclosing them
+        top_level = not any(not outer.user for outer in self.get_stack())
+        with self.lock:
+            self.durations.setdefault(span.stage, []).append(seconds)
+            if span.user:
+                self.user_time += seconds
+            elif top_level:
+                self.machine_time += seconds
+            if span.song_name is None:
+                return
+            timings = self.get_song(span.song_name)
+            if span.user:
+                timings.user_time += seconds
+                return
+            timings.stages[span.stage] = timings.stages.get(span.stage, 0.0) + seconds
+            if top_level:
+                timings.machine_time += seconds
+
+    def add_bytes(self, n_bytes: int, song_name: Optional[str] = None):
+        """Count the bytes downloaded for a song
+
+        Args:
+            n_bytes (int): the number of bytes
+            song_name (Optional[str], optional): the song. Defaults to the song set with `song`.
+        """
+        if song_name is None:
+            song_name = getattr(self.local, "song_name", None)
+        with self.lock:
+            self.bytes_downloaded += n_bytes
+            if song_name is not None:
+                self.get_song(song_name).bytes_downloaded += n_bytes
+
+    def finish(self, song_name: str):
+        """Write the timings of a finished song to the report
+
+        Args:
+            song_name (str): the song
+        """
+        with self.lock:
+            timings = self.songs.pop(song_name, None)
+            if timings is None or self.report_path is None:
+                return
+            with open(self.report_path, "a", encoding="utf-8") as f:
+                f.write(timings.model_dump_json() + "\n")
+
+    def get_summary(self) -> List[StageSummary]:
+        """Get the times of each stage over the session
+
+        Returns:
+            List[StageSummary]: the summary of each stage, by stage
+        """
+        with self.lock:
+            durations = {stage: sorted(d) for stage, d in self.durations.items()}
+        return [
+            StageSummary(
+                stage=stage,
+                count=len(values),
+                total=sum(values),
+                p50=get_percentile(values, 50),
+                p95=get_percentile(values, 95),
+            )
+            for stage, values in sorted(durations.items())
+        ]
+
+    def log_summary(self):
+        summary = self.get_summary()
+        if len(summary) == 0:
+            return
+        lines = [
+            f"{'stage':<16}{'count':>7}{'p50 (s)':>10}{'p95 (s)':>10}{'total (s)':>11}"
+        ]
+        for stage in summary:
+            lines.append(
+                f"{stage.stage:<16}{stage.count:>7}{stage.p50:>10.2f}{stage.p95:>10.2f}{stage.total:>11.2f}"
+            )
+        download_time = sum(s.total for s in summary if s.stage == "download")
+        lines.append(
+            f"machine time: {self.machine_time:.2f}s, user time: {self.user_time:.2f}s, "
+            + f"downloaded: {self.bytes_downloaded / 1e6:.1f} MB"
+            + (
+                f" at {self.bytes_downloaded / 1e6 / download_time:.2f} MB/s"
+                if download_time > 0
+                else ""
+            )
+        )
+        logger.info("Timings for this session:\n" + "\n".join(lines))
+
+    def close(self):
+        """Write the timings of the songs left unfinished, e.g. by an error or the user quitting"""
+        with self.lock:
+            song_names = list(self.songs)
+        for song_name in song_names:
+            self.finish(song_name)
+
+
+_recorder = Recorder()
+
+
+def get_recorder() -> Recorder:
+    """Get the recorder shared by the whole process"""
+    return _recorder
+
+
+def set_recorder(recorder: Recorder):
+    """Replace the recorder shared by the whole process, e.g. with one writing a report"""
+    global _recorder
+    _recorder = recorder
+
+
+def span(stage: str, song_name: Optional[str] = None, user: bool = False):
+    """Time a stage with the shared recorder, see `Recorder.span`"""
+    return get_recorder().span(stage, song_name=song_name, user=user)
+
+
+def song(song_name: str):
+    """Attribute the spans in this thread to a song, see `Recorder.song`"""
+    return get_recorder().song(song_name)
+
+
+def add_bytes(n_bytes: int, song_name: Optional[str] = None):
+    """Count the bytes downloaded for a song, see `Recorder.add_bytes`"""
+    get_recorder().add_bytes(n_bytes, song_name=song_name)
+
+
+def finish(song_name: str):
+    """Write the timings of a finished song, see `Recorder.finish`"""
+    get_recorder().finish(song_name)
+
+
+def prompt():
+    """Time a wait on the user with the shared recorder, see `Recorder.span`"""
+    return get_recorder().span(PROMPT_STAGE, user=True)
@@ -0,0 +1,190 @@
+"""
+transcode.py module for downloading the audio of a song once, and encoding it in the
+format of each destination it is saved to
+"""
+
+import logging
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from songbirdcli import lazy
+from songbirdcli import settings
+
+logger = logging.getLogger(__name__)
+
+yt_dlp = lazy.load("yt_dlp")
+youtube = lazy.load("songbirdcore.youtube")
+
+# the ffmpeg encoder of each format
+ENCODERS = {"mp3": "libmp3lame", "m4a": "aac", "flac": "flac", "opus": "libopus"}
+
+
+def download_source(url: str, file_path_no_format: str) -> Optional[str]:
+    """Download the best audio of a video as is, without converting it, so that it can be
+    encoded in the format of each destination. Mirrors `songbirdcore.youtube.run_download`.
+
+    Args:
+        url (str): the url to download
+        file_path_no_format (str): the file path excluding file format, which yt-dlp picks
+
+    Returns:
+        Optional[str]: the path of the download, None if it failed
+    """
+    ydl_opts = {
+        "format": "bestaudio/best",
+        "cachedir": False,
+        "nocheckcertificate": True,
+        "logger": youtube.YtDlLogger(),
+        "progress_hooks": [youtube.my_hook],
+        "outtmpl": file_path_no_format + ".%(ext)s",
+    }
+    try:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=True)
+            local_file_path = ydl.prepare_filename(info)
+    except Exception:
+        logger.exception(f"Failed to complete the download of song at url: {url}.")
+        return None
+    logger.info(f"Downloading successful. File stored locally: {local_file_path}")
+    return local_file_path
+
+
+def get_command(
+    src_path: str, dest_path: str, profile: settings.FormatProfile
+) -> List[str]:
+    """Build the ffmpeg command encoding a song in the format of a profile. The audio is
+    copied rather than encoded when the song is already in that format, at any bitrate.
+
+    Args:
+        src_path (str): the path of the song
+        dest_path (str): the path to write to
+        profile (settings.FormatProfile): the format to encode in
+
+    Returns:
+        List[str]: the command
+    """
+    command = ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y"]
+    command += ["-i", src_path, "-vn"]
+    src_format = os.path.splitext(src_path)[1][1:].lower()
+    if src_format == profile.file_format and profile.bitrate is None:
+        return command + ["-c:a", "copy", dest_path]
+    command += ["-c:a", ENCODERS[profile.file_format]]
+    if profile.bitrate is not None and profile.file_format != "flac":
+        command += ["-b:a", profile.bitrate]
+    return command + [dest_path]
+
+
+def transcode(src_path: str, dest_path: str, profile: settings.FormatProfile) -> bool:
+    """Encode a song in the format of a profile with ffmpeg
+
+    Args:
+        src_path (str): the path of the song
+        dest_path (str): the path to write to
+        profile (settings.FormatProfile): the format to encode in
+
+    Returns:
+        bool: True if the song was encoded
+    """
+    try:
+        process = subprocess.run(
+            get_command(src_path, dest_path, profile), capture_output=True
+        )
+    except OSError as e:
+        logger.error(f"Could not run ffmpeg, is it installed? {e}")
+        return False
+    if process.returncode != 0:
+        logger.error(
+            f"ffmpeg failed to encode {src_path} as {profile.file_format}: {process.stderr.decode(errors='replace').strip()}"
+        )
+        return False
+    return True
+
+
+class Transcoder:
+    """Encodes songs in a bounded pool of ffmpeg processes, shared by every song being saved,
+    so that encoding the formats of several destinations neither runs serially nor
+    starts more encoders than there are workers. The pool starts on first use.
+    """
+
+    def __init__(self, workers: int = 2):
+        """
+        Args:
+            workers (int, optional): the ffmpeg processes run at once. Defaults to 2.
+        """
+        self.workers = max(1, workers)
+        self.lock = threading.Lock()
+        self.executor: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    def from_config(cls, config: settings.SongbirdCliConfig) -> "Transcoder":
+        """Create a transcoder from the songbirdcli config
+
+        Args:
+            config (settings.SongbirdCliConfig): the songbirdcli config
+
+        Returns:
+            Transcoder: the transcoder
+        """
+        return cls(workers=config.transcode_workers)
+
+    def transcode_all(
+        self, src_path: str, targets: Dict[str, Tuple[str, settings.FormatProfile]]
+    ) -> Optional[Dict[str, str]]:
+        """Encode a song in several formats at once, blocking until each is encoded
+
+        Args:
+            src_path (str): the path of the song
+            targets (Dict[str, Tuple[str, settings.FormatProfile]]): the key of each target,
+                and the path to write it to along with the format to encode it in
+
+        Returns:
+            Optional[Dict[str, str]]: the key and path of each target, None if any failed
+        """
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="transcode"
+                )
+            futures = {
+                key: self.executor.submit(transcode, src_path, dest_path, profile)
+                for key, (dest_path, profile) in targets.items()
+            }
+        if not all([future.result() for future in futures.values()]):
+            return None
+        return {key: dest_path for key, (dest_path, _) in targets.items()}
+
+    def close(self):
+        """Wait for the running encoders, then stop the pool"""
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+                self.executor = None
+
+
+_transcoder: Optional[Transcoder] = None
+_transcoder_lock = threading.Lock()
+
+
+def get_transcoder() -> Transcoder:
+    """Get the transcoder shared by the whole process, creating it on first use
+
+    Returns:
+        Transcoder: the transcoder
+    """
+    global _transcoder
+    with _transcoder_lock:
+        if _transcoder is None:
+            _transcoder = Transcoder()
+        return _transcoder
+
+
+def set_transcoder(transcoder: Transcoder):
+    """Replace the transcoder shared by the whole process, e.g. with one sized from the config"""
+    global _transcoder
+    with _transcoder_lock:
+        previous, _transcoder = _transcoder, transcoder
+    if previous is not None and previous is not transcoder:
+        previous.close()
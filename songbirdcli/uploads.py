@@ -0,0 +1,248 @@
+"""
+uploads.py module for uploading songs to google drive in the background, reusing
+one authenticated session for every upload
+"""
+
+import logging
+import mimetypes
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from songbirdcli import lazy
+from songbirdcli import settings
+from songbirdcli import timing
+
+logger = logging.getLogger(__name__)
+
+# the google api client is imported when the first song is uploaded
+transport = lazy.load("google.auth.transport.requests")
+oauth2 = lazy.load("google.oauth2.credentials")
+flow = lazy.load("google_auth_oauthlib.flow")
+http = lazy.load("googleapiclient.http")
+discovery = lazy.load("googleapiclient.discovery")
+
+SCOPES = ["https://www.googleapis.com/auth/drive"]
+
+
+class DriveUploader:
+    """Uploads songs to a google drive folder from a pool of workers.
+
+    The oauth credentials are loaded once, the first time a song is submitted, and
+    shared by every worker. Each worker keeps its own drive service, as the underlying
+    http client is not thread safe. Songs are sent as resumable uploads in chunks,
+    so that a dropped connection retries the current chunk rather than the whole file.
+    """
+
+    def __init__(
+        self,
+        folder_id: str,
+        credentials_path: str,
+        token_path: str,
+        auth_port: int,
+        bind_addr: Optional[str] = None,
+        workers: int = 2,
+        chunk_size: int = 5 * 1024 * 1024,
+        retries: int = 3,
+    ):
+        """
+        Args:
+            folder_id (str): the id of the google drive folder to upload to
+            credentials_path (str): path to a credentials.json file
+            token_path (str): path to a google cloud token file, created after the first authorization
+            auth_port (int): the port to use for oauth
+            bind_addr (Optional[str], optional): the bind address for oauth, otherwise localhost is used. Defaults to None.
+            workers (int, optional): the maximum number of songs uploaded at once. Defaults to 2.
+            chunk_size (int, optional): the size of each uploaded chunk in bytes, a multiple of 256 KiB. Defaults to 5 MiB.
+            retries (int, optional): the number of times to retry a failed chunk. Defaults to 3.
+        """
+        self.folder_id = folder_id
+        self.credentials_path = credentials_path
+        self.token_path = token_path
+        self.auth_port = auth_port
+        self.bind_addr = bind_addr
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.credentials = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, workers), thread_name_prefix="gdrive-upload"
+        )
+        # upload key -> future of the uploaded file id
+        self.futures: Dict[str, Future] = {}
+
+    @classmethod
+    def from_config(cls, config: settings.SongbirdCliConfig) -> "DriveUploader":
+        """Create an uploader for the google drive folder in the songbirdcli config
+
+        Args:
+            config (settings.SongbirdCliConfig): the songbirdcli config
+
+        Returns:
+            DriveUploader: the uploader
+        """
+        # If running in a container, we need to provide a bind address
+        # Users are expected to run the container with hostname songbird (--hostname songbird)
+        bind_addr = None
+        if not config.run_local:
+            bind_addr = "songbird"
+        return cls(
+            config.gdrive_folder_id,
+            credentials_path=os.path.join(
+                config.get_gdrive_folder_path(), "credentials.json"
+            ),
+            token_path=os.path.join(config.get_gdrive_folder_path(), "token.json"),
+            auth_port=config.gdrive_auth_port,
+            bind_addr=bind_addr,
+            workers=config.gdrive_upload_workers,
+            chunk_size=config.gdrive_upload_chunk_size,
+        )
+
+    def get_credentials(self) -> "oauth2.Credentials":
+        """Load the oauth credentials, refreshing or authorizing them as needed,
+        as in `songbirdcore.gdrive.save_song`. Only the first call does any work
+        while the credentials stay valid.
+
+        Returns:
+            oauth2.Credentials: the credentials
+        """
+        with self.lock:
+            creds = self.credentials
+            if creds is None and os.path.exists(self.token_path):
+                creds = oauth2.Credentials.from_authorized_user_file(
+                    self.token_path, SCOPES
+                )
+            if not creds or not creds.valid:
+                if creds and creds.expired and creds.refresh_token:
+                    creds.refresh(transport.Request())
+                else:
+                    app_flow = flow.InstalledAppFlow.from_client_secrets_file(
+                        self.credentials_path, SCOPES
+                    )
+                    creds = app_flow.run_local_server(
+                        port=self.auth_port,
+                        bind_addr=self.bind_addr,
+                        open_browser=False,
+                    )
+                # Save the credentials for the next run
+                with open(self.token_path, "w") as token:
+                    token.write(creds.to_json())
+            self.credentials = creds
+            return creds
+
+    def get_service(self):
+        """Get the drive service of the current worker, building it on first use"""
+        if getattr(self.local, "service", None) is None:
+            self.local.service = discovery.build(
+                "drive", "v3", credentials=self.credentials, cache_discovery=False
+            )
+        return self.local.service
+
+    def submit(
+        self,
+        key: str,
+        song_name: str,
+        song_path: str,
+        on_complete: Optional[Callable[[str], None]] = None,
+    ) -> Future:
+        """Queue a song for upload. Authorizes in the calling thread if needed,
+        so that any oauth prompt is not hidden behind a worker.
+
+        Args:
+            key (str): identifies the upload in the results of `wait`
+            song_name (str): the name of the file in google drive
+            song_path (str): the path of the song locally
+            on_complete (Optional[Callable[[str], None]], optional): called from the worker with the file id once uploaded. Defaults to None.
+
+        Returns:
+            Future: resolves to the file id of the upload, None if it failed
+        """
+        self.get_credentials()
+        future = self.executor.submit(self._upload, song_name, song_path, on_complete)
+        with self.lock:
+            self.futures[key] = future
+        return future
+
+    def wait(self) -> Dict[str, Optional[str]]:
+        """Wait for every queued upload to finish, and forget them, so that
+        an uploader reused across runs does not keep every result
+
+        Returns:
+            Dict[str, Optional[str]]: the key of each upload, mapped to its file id. None for uploads that failed.
+        """
+        with self.lock:
+            futures = self.futures
+            self.futures = {}
+        pending = len([f for f in futures.values() if not f.done()])
+        if pending > 0:
+            logger.info(f"Waiting for {pending} uploads to google drive to finish.")
+        return {key: future.result() for key, future in futures.items()}
+
+    def pop(self, key: str) -> Optional[str]:
+        """Wait for one upload and forget it, so that a long running uploader does not keep every result
+
+        Args:
+            key (str): identifies the upload, as given to `submit`
+
+        Returns:
+            Optional[str]: the file id of the upload, None if it failed or was never submitted
+        """
+        with self.lock:
+            future = self.futures.pop(key, None)
+        if future is None:
+            return None
+        return future.result()
+
+    def close(self):
+        """Wait for the queued uploads, then stop the workers"""
+        self.wait()
+        self.executor.shutdown(wait=True)
+
+    def upload(self, song_name: str, song_path: str) -> str:
+        """Upload a song in resumable chunks
+
+        Args:
+            song_name (str): the name of the file in google drive
+            song_path (str): the path of the song locally
+
+        Returns:
+            str: the file id of the upload
+        """
+        mimetype = mimetypes.guess_type(song_path)[0] or "application/octet-stream"
+        media = http.MediaFileUpload(
+            song_path, mimetype=mimetype, chunksize=self.chunk_size, resumable=True
+        )
+        file_metadata = {"name": song_name, "parents": [self.folder_id]}
+        request = (
+            self.get_service()
+            .files()
+            .create(body=file_metadata, media_body=media, fields="id")
+        )
+        response = None
+        while response is None:
+            status, response = request.next_chunk(num_retries=self.retries)
+            if status is not None:
+                logger.debug(f"Uploaded {int(status.progress() * 100)}% of {song_name}")
+        file_id = response.get("id")
+        logger.info(f"File creation successful -- ID: {file_id}")
+        return file_id
+
+    def _upload(
+        self,
+        song_name: str,
+        song_path: str,
+        on_complete: Optional[Callable[[str], None]] = None,
+    ) -> Optional[str]:
+        """Upload a song from a worker, logging rather than raising any errors"""
+        try:
+            # songs are uploaded under their file name
+            with timing.span("upload", os.path.splitext(song_name)[0]):
+                file_id = self.upload(song_name, song_path)
+            if on_complete is not None:
+                on_complete(file_id)
+            return file_id
+        except Exception:
+            logger.exception(f"Failed to upload {song_name} to google drive.")
+            return None
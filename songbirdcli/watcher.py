@@ -0,0 +1,245 @@
+"""
+watcher.py module for keeping the library index live while songbird runs, so that
+looking up a song does not check every folder for changes made by other tools
+"""
+
+import abc
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+from typing import Dict, Iterator, Optional, Tuple
+
+from songbirdcli import library
+from songbirdcli import settings
+
+logger = logging.getLogger(__name__)
+
+# inotify event masks, from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+# the events that change the files of a folder, or a file's tags
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_ATTRIB
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class LibraryWatcher(abc.ABC):
+    """Keeps a library index live, marking the folders that change so that a refresh
+    rescans only those. The index is walked in full once when the watcher starts.
+    """
+
+    def __init__(self, library_index: library.LibraryIndex):
+        """
+        Args:
+            library_index (library.LibraryIndex): the index to keep live
+        """
+        self.library_index = library_index
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run, name="library-watcher", daemon=True
+        )
+
+    def start(self):
+        """Walk the index in full, then keep it live from a background thread"""
+        self.library_index.live = True
+        self.library_index.refresh(full=True)
+        self.thread.start()
+
+    def close(self):
+        """Stop watching, leaving the index to check every folder on refresh again"""
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.library_index.live = False
+
+    @abc.abstractmethod
+    def _run(self):
+        """Keep the index live until the watcher is stopped, run in the background thread"""
+
+
+class PollingWatcher(LibraryWatcher):
+    """Walks the index in the background on an interval. Use this where inotify does not see
+    every change, e.g. for folders bind mounted into a container from a mac or windows host.
+    Changes are seen within one interval.
+    """
+
+    def __init__(self, library_index: library.LibraryIndex, interval: float = 10.0):
+        """
+        Args:
+            library_index (library.LibraryIndex): the index to keep live
+            interval (float, optional): the seconds between walks. Defaults to 10.0.
+        """
+        super().__init__(library_index)
+        self.interval = interval
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.library_index.refresh(full=True)
+            except Exception:
+                logger.exception("Failed to refresh the library index.")
+
+
+class InotifyWatcher(LibraryWatcher):
+    """Watches every folder of the index with inotify, which reports changes as they happen.
+    A watch is added to each folder as the index first visits it, before it is scanned,
+    so no change is missed between the scan and the watch.
+    """
+
+    def __init__(self, library_index: library.LibraryIndex):
+        """
+        Args:
+            library_index (library.LibraryIndex): the index to keep live
+
+        Raises:
+            OSError: if inotify is not available
+        """
+        super().__init__(library_index)
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is only available on linux")
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.stop_r, self.stop_w = os.pipe()
+        self.lock = threading.Lock()
+        # watch descriptor -> folder, and folder -> watch descriptor
+        self.watches: Dict[int, str] = {}
+        self.paths: Dict[str, int] = {}
+
+    def start(self):
+        self.library_index.on_dir_visited = self.add_watch
+        super().start()
+
+    def add_watch(self, path: str):
+        """Watch a folder, a no-op if already watched. If the watch cannot be added,
+        e.g. as the inotify watch limit was reached, the index falls back to checking
+        every folder on refresh.
+
+        Args:
+            path (str): the folder
+        """
+        if not self.library_index.live:
+            return
+        with self.lock:
+            if path in self.paths:
+                return
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            logger.warning(
+                f"Could not watch {path}: {os.strerror(err)}. Checking every library folder for changes instead."
+            )
+            self.library_index.live = False
+            return
+        with self.lock:
+            # a folder moved within the library keeps its watch under the new path
+            moved_from = self.watches.get(wd)
+            if moved_from is not None:
+                self.paths.pop(moved_from, None)
+            self.watches[wd] = path
+            self.paths[path] = wd
+
+    def close(self):
+        self.library_index.on_dir_visited = None
+        self.stopped.set()
+        os.write(self.stop_w, b"\0")
+        super().close()
+        os.close(self.fd)
+        os.close(self.stop_r)
+        os.close(self.stop_w)
+
+    def _run(self):
+        while not self.stopped.is_set():
+            readable, _, _ = select.select([self.fd, self.stop_r], [], [])
+            if self.stop_r in readable:
+                return
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except OSError as e:
+                logger.error(f"Stopped watching the library: {e}")
+                self.library_index.live = False
+                return
+            for wd, mask in parse_events(data):
+                self._handle(wd, mask)
+
+    def _handle(self, wd: int, mask: int):
+        """Mark the folder an event happened in as changed"""
+        if mask & IN_Q_OVERFLOW:
+            # events were dropped, so any folder may have changed
+            self.library_index.mark_changed()
+            return
+        with self.lock:
+            path = self.watches.get(wd)
+            if path is not None and mask & IN_IGNORED:
+                del self.watches[wd]
+                if self.paths.get(path) == wd:
+                    del self.paths[path]
+        if path is None or mask & IN_IGNORED:
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            self.library_index.mark_changed(os.path.dirname(path))
+        self.library_index.mark_changed(path)
+
+
+def parse_events(data: bytes) -> Iterator[Tuple[int, int]]:
+    """Read the events returned by a read of an inotify file descriptor
+
+    Args:
+        data (bytes): the bytes read
+
+    Yields:
+        Iterator[Tuple[int, int]]: the watch descriptor and mask of each event
+    """
+    offset = 0
+    while offset + EVENT_HEADER.size <= len(data):
+        wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+        offset += EVENT_HEADER.size + name_len
+        yield wd, mask
+
+
+def from_config(
+    config: settings.SongbirdCliConfig, library_index: library.LibraryIndex
+) -> Optional[LibraryWatcher]:
+    """Create the watcher selected in the songbirdcli config
+
+    Args:
+        config (settings.SongbirdCliConfig): the songbirdcli config
+        library_index (library.LibraryIndex): the index to keep live
+
+    Returns:
+        Optional[LibraryWatcher]: the watcher, None if watching is turned off
+    """
+    if config.library_watcher == "off":
+        return None
+    if config.library_watcher in ["auto", "inotify"]:
+        try:
+            return InotifyWatcher(library_index)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"Could not watch the library with inotify, polling: {e}")
+    return PollingWatcher(library_index, config.library_poll_interval)
@@ -0,0 +1,353 @@
+"""
+Fixtures for the benchmarks, which run the song pipeline fully offline. The itunes api,
+youtube's results pages, google drive and the album artwork are served by a local http
+server, and yt-dlp is replaced by a downloader writing dummy audio of a fixed size.
+
+The benchmarks are sized with environment variables:
+ - BENCHMARK_LIBRARY_SIZES: comma separated numbers of files in the synthetic library. Defaults to 1000.
+ - BENCHMARK_SONGS: the number of songs run through each flow. Defaults to 10.
+ - BENCHMARK_SONG_BYTES: the size of each downloaded song. Defaults to 4 MB.
+ - BENCHMARK_REPORT: a path to write the results to as json, to compare against later runs.
+ - BENCHMARK_BASELINE: the report of a previous run, logging the change in each stage.
+"""
+
+import contextlib
+import hashlib
+import http.server
+import json
+import os
+import threading
+import time
+import urllib.parse
+import uuid
+from typing import Dict, List
+
+import pytest
+import requests
+from songbirdcli import settings
+from songbirdcli import throttle
+from songbirdcli import timing
+from songbirdcli import uploads
+from songbirdcli import version
+from songbirdcore import youtube
+
+LIBRARY_SIZES = [
+    int(size) for size in os.getenv("BENCHMARK_LIBRARY_SIZES", "1000").split(",")
+]
+N_SONGS = int(os.getenv("BENCHMARK_SONGS", "10"))
+SONG_BYTES = int(os.getenv("BENCHMARK_SONG_BYTES", str(4 * 1000 * 1000)))
+TRACKS_PER_ALBUM = 12
+ARTWORK = b"\xff\xd8\xff\xe0" + b"\0" * 64 * 1024
+# an mpeg 1 layer 3 frame at 128 kbps and 44.1 kHz, holding silence
+MP3_FRAME = b"\xff\xfb\x90\x64" + b"\0" * 413
+
+
+def get_collection_id(term: str) -> int:
+    return int(hashlib.sha256(term.encode()).hexdigest()[:8], 16)
+
+
+def make_song(base_url: str, collection_id: int, track_number: int, name: str) -> dict:
+    """a song as returned by the itunes api"""
+    return {
+        "wrapperType": "track",
+        "kind": "song",
+        "trackName": name,
+        "artistName": f"artist {collection_id}",
+        "collectionName": f"album {collection_id}",
+        "artworkUrl100": f"{base_url}/artwork/{collection_id}/100x100bb.jpg",
+        "primaryGenreName": "Rock",
+        "trackNumber": track_number,
+        "trackCount": TRACKS_PER_ALBUM,
+        "collectionId": collection_id,
+        "discNumber": 1,
+        "discCount": 1,
+        "releaseDate": "1977-09-29T07:00:00Z",
+        "trackTimeMillis": 200000 + track_number * 1000,
+    }
+
+
+def make_results_page(query: str) -> bytes:
+    """a youtube results page, with its videos in the embedded initial data"""
+    videos = [
+        {
+            "videoRenderer": {
+                "videoId": hashlib.sha256(f"{query}{i}".encode()).hexdigest()[:11],
+                "title": {"runs": [{"text": f"{query} (video {i})"}]},
+                "lengthText": {"simpleText": f"3:{20 + i}"},
+                "ownerText": {"runs": [{"text": f"channel {i}"}]},
+            }
+        }
+        for i in range(20)
+    ]
+    initial_data = {
+        "contents": {"sectionListRenderer": {"contents": [{"contents": videos}]}}
+    }
+    return (
+        "<html><body><script>var ytInitialData = "
+        + json.dumps(initial_data)
+        + ";</script></body></html>"
+    ).encode()
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    """Serves the itunes search and lookup apis, youtube's results pages,
+    the album artwork and google drive's uploads"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, body: dict):
+        self.send(200, "application/json", json.dumps(body).encode())
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        limit = int(query.get("limit", 20))
+        if url.path == "/search" and query.get("entity") == "album":
+            term = query.get("term", "")
+            results = [
+                {
+                    "wrapperType": "collection",
+                    "artistName": f"artist {get_collection_id(term)}",
+                    "collectionName": term,
+                    "trackCount": TRACKS_PER_ALBUM,
+                    "collectionId": get_collection_id(term),
+                }
+            ]
+        elif url.path == "/search":
+            term = query.get("term", "")
+            results = [
+                make_song(self.server.url, get_collection_id(term), i, term)
+                for i in range(1, min(limit, 5) + 1)
+            ]
+        elif url.path == "/lookup":
+            collection_id = int(query.get("id", 0))
+            results = [
+                make_song(
+                    self.server.url,
+                    collection_id,
+                    i,
+                    f"album {collection_id} track {i}",
+                )
+                for i in range(1, min(limit, TRACKS_PER_ALBUM) + 1)
+            ]
+        elif url.path == "/results":
+            self.send(
+                200, "text/html", make_results_page(query.get("search_query", ""))
+            )
+            return
+        elif url.path.startswith("/artwork/"):
+            self.send(200, "image/jpeg", ARTWORK)
+            return
+        else:
+            self.send(404, "text/plain", b"")
+            return
+        self.send_json({"resultCount": len(results), "results": results})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        if not self.path.startswith("/upload/drive/v3/files"):
+            self.send(404, "text/plain", b"")
+            return
+        with self.server.lock:
+            self.server.uploaded_bytes += length
+        self.send_json({"id": uuid.uuid4().hex})
+
+
+class StandInServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.lock = threading.Lock()
+        self.uploaded_bytes = 0
+
+
+@pytest.fixture(scope="session")
+def stand_ins():
+    """the local http server standing in for itunes, youtube and google drive"""
+    server = StandInServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    # the stand ins answer as fast as they are asked
+    throttle.get_throttle().configure(server.url, 10000, 10000, 10000)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_dummy_audio(n_bytes: int) -> bytes:
+    """an mp3 of silence, with an empty id3 tag as yt-dlp leaves"""
+    id3_header = b"ID3\x03\x00\x00\x00\x00\x00\x00"
+    return id3_header + MP3_FRAME * max(1, n_bytes // len(MP3_FRAME))
+
+
+@pytest.fixture
+def offline(stand_ins, monkeypatch):
+    """replace yt-dlp and the google drive client with stand ins"""
+    audio = make_dummy_audio(SONG_BYTES)
+    upload_url = f"{stand_ins.url}/upload/drive/v3/files"
+
+    def fake_run_download(url, file_path_no_format, file_format, **kwargs):
+        file_path = f"{file_path_no_format}.{file_format}"
+        with open(file_path, "wb") as f:
+            # each video has its own audio, so no download is a copy of another
+            f.write(audio + url.encode("utf-8"))
+        return file_path
+
+    def fake_upload(self, song_name, song_path):
+        # sent in chunks, as a resumable upload is
+        with open(song_path, "rb") as f:
+            while chunk := f.read(self.chunk_size):
+                response = requests.post(
+                    upload_url, params={"name": song_name}, data=chunk
+                )
+                response.raise_for_status()
+        return response.json()["id"]
+
+    monkeypatch.setattr(youtube, "run_download", fake_run_download)
+    monkeypatch.setattr(uploads.DriveUploader, "get_credentials", lambda self: None)
+    monkeypatch.setattr(uploads.DriveUploader, "upload", fake_upload)
+    return stand_ins
+
+
+def build_library(folders: List[str], n_files: int):
+    """fill the folders with n_files empty songs, none named like the benchmarked songs"""
+    for i in range(n_files):
+        folder = folders[i % len(folders)]
+        open(
+            os.path.join(folder, f"library artist {i % 97} - library track {i}.mp3"),
+            "w",
+        ).close()
+
+
+@pytest.fixture
+def make_config(offline, tmp_path):
+    """create a config pointing at the stand ins, with a synthetic library of the given size"""
+
+    def _make_config(library_size: int, **kwargs) -> settings.SongbirdCliConfig:
+        config = settings.SongbirdCliConfig(
+            version=version.version,
+            root_path=str(tmp_path),
+            run_local=True,
+            itunes_enabled=False,
+            itunes_cache_enabled=False,
+            gdrive_enabled=True,
+            file_format="mp3",
+            itunes_search_api_base_url=f"{offline.url}/search",
+            itunes_lookup_api_base_url=f"{offline.url}/lookup",
+            itunes_requests_per_minute=600000,
+            youtube_home_url=offline.url,
+            youtube_search_url=f"{offline.url}/results",
+            youtube_search_engine="http",
+            **kwargs,
+        )
+        folders = [config.get_local_folder_path(), config.get_gdrive_folder_path()]
+        for folder in [config.get_data_path()] + folders:
+            os.makedirs(folder, exist_ok=True)
+        with open(
+            os.path.join(config.get_gdrive_folder_path(), "credentials.json"), "w"
+        ) as f:
+            f.write("{}")
+        build_library(folders, library_size)
+        return config
+
+    return _make_config
+
+
+def summarize(name: str, library_size: int, songs: int, seconds: float) -> dict:
+    recorder = timing.get_recorder()
+    return {
+        "name": name,
+        "library_size": library_size,
+        "songs": songs,
+        "seconds": seconds,
+        "songs_per_second": songs / seconds if seconds > 0 else 0.0,
+        "machine_time": recorder.machine_time,
+        "user_time": recorder.user_time,
+        "bytes_downloaded": recorder.bytes_downloaded,
+        "stages": [stage.model_dump() for stage in recorder.get_summary()],
+    }
+
+
+def format_results(results: List[dict], baseline: Dict[str, dict]) -> List[str]:
+    """a table of the stages of each benchmark, with the change in p50 from the baseline"""
+    lines = [
+        f"{'benchmark':<28}{'stage':<16}{'count':>7}{'p50 (ms)':>10}{'p95 (ms)':>10}{'change':>9}"
+    ]
+    for result in results:
+        key = f"{result['name']}[{result['library_size']}]"
+        previous = {
+            stage["stage"]: stage for stage in baseline.get(key, {}).get("stages", [])
+        }
+        for stage in result["stages"]:
+            change = ""
+            if stage["stage"] in previous and previous[stage["stage"]]["p50"] > 0:
+                ratio = stage["p50"] / previous[stage["stage"]]["p50"] - 1
+                change = f"{ratio:+.0%}"
+            lines.append(
+                f"{key:<28}{stage['stage']:<16}{stage['count']:>7}"
+                + f"{stage['p50'] * 1000:>10.1f}{stage['p95'] * 1000:>10.1f}{change:>9}"
+            )
+        lines.append(
+            f"{key:<28}{result['songs']} songs in {result['seconds']:.2f}s, "
+            + f"{result['songs_per_second']:.2f} songs/s, "
+            + f"{result['bytes_downloaded'] / 1e6 / max(result['seconds'], 1e-9):.1f} MB/s downloaded, "
+            + f"{result['machine_time']:.2f}s machine time, {result['user_time']:.2f}s user time"
+        )
+    return lines
+
+
+# the results of every benchmark run in this session
+RESULTS: List[dict] = []
+
+
+def pytest_terminal_summary(terminalreporter):
+    """show the results, writing them to BENCHMARK_REPORT"""
+    if len(RESULTS) == 0:
+        return
+    baseline = {}
+    baseline_path = os.getenv("BENCHMARK_BASELINE")
+    if baseline_path:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = {
+                f"{result['name']}[{result['library_size']}]": result
+                for result in json.load(f)["results"]
+            }
+    terminalreporter.section("benchmarks")
+    for line in format_results(RESULTS, baseline):
+        terminalreporter.write_line(line)
+    report_path = os.getenv("BENCHMARK_REPORT")
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump({"time": time.time(), "results": RESULTS}, f, indent=2)
+        terminalreporter.write_line(f"Benchmark results written to {report_path}")
+
+
+@pytest.fixture
+def measure():
+    """time a benchmark, collecting the stages recorded by `songbirdcli.timing`"""
+
+    @contextlib.contextmanager
+    def _measure(name: str, library_size: int, songs: int):
+        timing.set_recorder(timing.Recorder())
+        start = time.perf_counter()
+        yield
+        # batch.run replaces the recorder, so read whichever is current
+        RESULTS.append(
+            summarize(name, library_size, songs, time.perf_counter() - start)
+        )
+        timing.set_recorder(timing.Recorder())
+
+    return _measure
@@ -0,0 +1,144 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from conftest import LIBRARY_SIZES, N_SONGS, TRACKS_PER_ALBUM
+from songbirdcli import batch
+from songbirdcli import cli
+from songbirdcli import helpers
+from songbirdcli import itunes_search
+from songbirdcli import library
+from songbirdcli import prefetch
+from songbirdcli import search
+from songbirdcli import timing
+from songbirdcli import uploads
+from songbirdcore.models import itunes_api
+
+STARTUP_RUNS = 5
+# imports songbirdcli and runs it up to the main menu, printing the time each took
+STARTUP_SCRIPT = """
+import builtins, json, sys, time
+start = time.perf_counter()
+from songbirdcli import cli, settings
+imported = time.perf_counter() - start
+
+def first_prompt(prompt):
+    print(json.dumps({"import": imported, "first_prompt": time.perf_counter() - start}))
+    raise SystemExit
+
+builtins.input = first_prompt
+cli.run(settings.SongbirdCliConfig(
+    run_local=True, root_path=sys.argv[1], gdrive_enabled=False, itunes_enabled=False, log_level="ERROR"
+))
+"""
+
+
+def test_startup(measure, tmp_path):
+    script_path = os.path.join(tmp_path, "startup.py")
+    with open(script_path, "w") as f:
+        f.write(STARTUP_SCRIPT)
+    with measure("startup", 0, STARTUP_RUNS):
+        for _ in range(STARTUP_RUNS):
+            output = subprocess.run(
+                [sys.executable, script_path, str(tmp_path)],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            times = json.loads(output.strip().splitlines()[-1])
+            for stage, seconds in times.items():
+                timing.get_recorder().record(timing.Span(stage, None, False), seconds)
+
+
+@pytest.mark.parametrize("library_size", LIBRARY_SIZES)
+def test_run_for_song(make_config, measure, monkeypatch, library_size):
+    config = make_config(library_size)
+    inputs = iter(
+        [
+            "0",  # select the first itunes properties
+            "",  # search youtube
+            "0",  # select the first video
+            "g",  # save to google drive
+        ]
+        * N_SONGS
+    )
+    monkeypatch.setattr("builtins.input", lambda _: next(inputs))
+    itunes_client = itunes_search.ItunesClient.from_config(config)
+    library_index = library.LibraryIndex.from_config(config)
+    uploader = uploads.DriveUploader.from_config(config)
+    search_engine = search.from_config(config)
+    prefetcher = prefetch.SearchPrefetcher.from_config(config, search_engine)
+    try:
+        with measure("run_for_song", library_size, N_SONGS):
+            results = [
+                cli.run_for_song(
+                    config,
+                    f"benchmark song {i}",
+                    None,
+                    itunes_client=itunes_client,
+                    library_index=library_index,
+                    uploader=uploader,
+                    prefetcher=prefetcher,
+                )
+                for i in range(N_SONGS)
+            ]
+            uploaded = uploader.wait()
+    finally:
+        prefetcher.close()
+        search_engine.close()
+        uploader.close()
+        library_index.close()
+        itunes_client.close()
+    assert results == [True] * N_SONGS
+    assert len(uploaded) == N_SONGS and None not in uploaded.values()
+
+
+@pytest.mark.parametrize("library_size", LIBRARY_SIZES)
+def test_launch_album_mode(make_config, measure, monkeypatch, library_size):
+    config = make_config(library_size)
+    inputs = iter(
+        [
+            "0",  # select the first album
+            "-1",  # keep every song
+        ]
+        * N_SONGS
+    )
+    monkeypatch.setattr("builtins.input", lambda _: next(inputs))
+    itunes_client = itunes_search.ItunesClient.from_config(config)
+    try:
+        with measure("launch_album_mode", library_size, N_SONGS * TRACKS_PER_ALBUM):
+            albums = [
+                helpers.launch_album_mode(
+                    f"benchmark album {i}", itunes_client=itunes_client
+                )
+                for i in range(N_SONGS)
+            ]
+    finally:
+        itunes_client.close()
+    for songs in albums:
+        assert len(songs) == TRACKS_PER_ALBUM
+        assert isinstance(songs[0], itunes_api.ItunesApiSongModel)
+
+
+@pytest.mark.parametrize("library_size", LIBRARY_SIZES)
+def test_batch(make_config, measure, tmp_path, library_size):
+    config = make_config(library_size, pipeline_workers=4)
+    manifest_path = os.path.join(tmp_path, "benchmark.jsonl")
+    with open(manifest_path, "w") as f:
+        for i in range(N_SONGS):
+            f.write(
+                json.dumps({"query": f"benchmark song {i}", "destination": "g"}) + "\n"
+            )
+        f.write(
+            json.dumps(
+                {"mode": "album", "query": "benchmark album", "destination": "l"}
+            )
+            + "\n"
+        )
+    n_songs = N_SONGS + TRACKS_PER_ALBUM
+    with measure("batch", library_size, n_songs):
+        results = batch.run(manifest_path, config=config)
+    assert len(results) == n_songs
+    assert all(result.status == "success" for result in results)
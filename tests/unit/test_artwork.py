@@ -0,0 +1,80 @@
+import os
+
+import pytest
+from songbirdcli import artwork
+
+ARTWORK_URL = "https://is1-ssl.mzstatic.com/image/thumb/cover/100x100bb.jpg"
+
+
+class FakeResponse:
+    def __init__(self, content: bytes, status_code: int = 200):
+        self.content = content
+        self.status_code = status_code
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = artwork.ArtworkCache(str(tmp_path / "artwork"), max_bytes=100)
+    cache.requests = []
+    yield cache
+    cache.close()
+
+
+def test_artwork_is_fetched_once_per_collection(cache, monkeypatch):
+    def fake_get(url, **kwargs):
+        cache.requests.append(url)
+        if "3000x3000" in url:
+            return FakeResponse(b"", 404)
+        return FakeResponse(b"cover")
+
+    monkeypatch.setattr(cache.session, "get", fake_get)
+    assert cache.get(ARTWORK_URL, collection_id=1) == b"cover"
+    # another track of the album, whose artwork url differs
+    assert (
+        cache.get(ARTWORK_URL.replace("cover", "track2"), collection_id=1) == b"cover"
+    )
+    assert cache.requests == [
+        ARTWORK_URL.replace("100x100", "3000x3000"),
+        ARTWORK_URL.replace("100x100", "2500x2500"),
+    ]
+    # each size is its own variant, sharing the stored image
+    assert cache.get(ARTWORK_URL, collection_id=1, size="500x500") == b"cover"
+    assert len(cache.requests) == 3
+    images = [f for f in os.listdir(cache.folder) if not f.endswith(".sqlite")]
+    assert len(images) == 1
+
+
+def test_least_recently_used_artwork_is_evicted(cache, monkeypatch):
+    monkeypatch.setattr(
+        cache.session, "get", lambda url, **kwargs: FakeResponse(url.encode()[-40:])
+    )
+    first = cache.get(ARTWORK_URL + "?a", collection_id=1)
+    cache.get(ARTWORK_URL + "?b", collection_id=2)
+    # using the first cover makes the second the least recently used
+    assert cache.get(ARTWORK_URL, collection_id=1) == first
+    cache.get(ARTWORK_URL + "?c", collection_id=3)
+    assert cache.read(cache.make_key("", 1, "3000x3000")) == first
+    assert cache.read(cache.make_key("", 2, "3000x3000")) is None
+    assert cache.read(cache.make_key("", 3, "3000x3000")) is not None
+
+
+def test_failed_fetch_is_not_cached(cache, monkeypatch):
+    monkeypatch.setattr(
+        cache.session, "get", lambda url, **kwargs: FakeResponse(b"", 404)
+    )
+    assert cache.get(ARTWORK_URL, collection_id=1) is None
+    assert cache.read(cache.make_key(ARTWORK_URL, 1, "3000x3000")) is None
+    assert cache.get("", collection_id=1) is None
+
+
+def test_artwork_larger_than_the_cache_is_not_stored(cache, monkeypatch):
+    cover = b"x" * 50
+    monkeypatch.setattr(cache.session, "get", lambda url, **kwargs: FakeResponse(cover))
+    cache.get(ARTWORK_URL + "?a", collection_id=1)
+    monkeypatch.setattr(
+        cache.session, "get", lambda url, **kwargs: FakeResponse(b"y" * 101)
+    )
+    # still served, without evicting the covers that fit
+    assert cache.get(ARTWORK_URL + "?b", collection_id=2) == b"y" * 101
+    assert cache.read(cache.make_key("", 2, "3000x3000")) is None
+    assert cache.read(cache.make_key("", 1, "3000x3000")) == cover
@@ -0,0 +1,296 @@
+import json
+import os
+
+import pytest
+from songbirdcli import batch
+from songbirdcli import cli
+from songbirdcli import itunes_search
+from songbirdcli import library
+from songbirdcli import render
+from songbirdcli import settings
+from songbirdcli import tagging
+from songbirdcli import version
+from songbirdcore import itunes, youtube
+from songbirdcore.models import modes, itunes_api
+
+
+def make_song(track_name: str, track_number: int = 1) -> itunes_api.ItunesApiSongModel:
+    return itunes_api.ItunesApiSongModel(
+        trackName=track_name,
+        artistName="Dolly Parton",
+        collectionName="Jolene",
+        artworkUrl100="https://example.com/100x100bb.jpg",
+        primaryGenreName="Country",
+        trackNumber=track_number,
+        trackCount=2,
+        collectionId=123,
+        discNumber=1,
+        discCount=1,
+        releaseDate="1973",
+    )
+
+
+class FakeLink:
+    def __init__(self, href: str):
+        self.attrs = {"href": href, "title": href}
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    """config with the itunes api, youtube and yt-dlp replaced by fakes"""
+
+    def fake_query_api(search_variable, limit, mode, lookup=False):
+        if mode == modes.Modes.ALBUM:
+            return [
+                itunes_api.ItunesApiAlbumKeys(
+                    artistName="Dolly Parton",
+                    collectionName="Jolene",
+                    trackCount=2,
+                    collectionId=123,
+                )
+            ]
+        if lookup and str(search_variable) == "123":
+            return [make_song("Jolene", 1), make_song("Early Morning Breeze", 2)]
+        return [make_song("Jolene")]
+
+    def fake_get_video_links(*args, **kwargs):
+        return ["video"], [FakeLink("/watch?v=abc&list=xyz")]
+
+    def fake_run_download(url, file_path_no_format, file_format, **kwargs):
+        file_path = f"{file_path_no_format}.{file_format}"
+        with open(file_path, "wb") as f:
+            f.write(b"\0")
+        return file_path
+
+    monkeypatch.setattr(itunes, "query_api", fake_query_api)
+    monkeypatch.setattr(
+        itunes_search.ItunesClient,
+        "query_api",
+        lambda self, *args, **kwargs: fake_query_api(*args, **kwargs),
+    )
+    monkeypatch.setattr(
+        itunes_search.ItunesClient,
+        "query_many",
+        lambda self, queries: [fake_query_api(**q.model_dump()) for q in queries],
+    )
+    monkeypatch.setattr(youtube, "get_video_links", fake_get_video_links)
+    monkeypatch.setattr(
+        render.RenderSessionPool,
+        "search_videos",
+        lambda self, payload: [
+            render.Video(href="/watch?v=abc&list=xyz", title="video")
+        ],
+    )
+    monkeypatch.setattr(youtube, "run_download", fake_run_download)
+    monkeypatch.setattr(itunes, "mp3ID3Tagger", lambda *args: True)
+    monkeypatch.setattr(tagging, "tag_song", lambda *args: True)
+    return settings.SongbirdCliConfig(
+        version=version.version,
+        root_path=str(tmp_path),
+        gdrive_enabled=False,
+        itunes_enabled=False,
+        itunes_cache_enabled=False,
+        file_format="mp3",
+        itunes_lib_path=os.path.join(tmp_path, "mock-itunes-lib"),
+        itunes_folder_path=os.path.join(tmp_path, "mock-itunes-auto-folder"),
+        run_local=True,
+    )
+
+
+@pytest.mark.parametrize(
+    "fname,content",
+    [
+        (
+            "manifest.csv",
+            "mode,query,itunes_id,youtube_url,destination\n"
+            "song,jolene,,,local\n"
+            "album,,123,,l\n",
+        ),
+        (
+            "manifest.jsonl",
+            '{"query": "jolene", "destination": "local"}\n'
+            "\n"
+            '{"mode": "album", "itunes_id": 123}\n',
+        ),
+    ],
+)
+def test_load_manifest(tmp_path, fname, content):
+    manifest_path = os.path.join(tmp_path, fname)
+    with open(manifest_path, "w") as f:
+        f.write(content)
+    entries = batch.load_manifest(manifest_path)
+    assert len(entries) == 2
+    assert entries[0].mode == modes.Modes.SONG
+    assert entries[0].itunes_id is None
+    assert entries[0].destination == "l"
+    assert entries[1].mode == modes.Modes.ALBUM
+    assert entries[1].itunes_id == 123
+
+
+@pytest.mark.parametrize(
+    "fname,content",
+    [
+        ("manifest.txt", "jolene"),
+        ("manifest.jsonl", '{"query": "jolene", "destination": "dropbox"}'),
+        ("manifest.jsonl", '{"query": "jolene", "destination": "ii"}'),
+    ],
+)
+def test_load_manifest_invalid(tmp_path, fname, content):
+    manifest_path = os.path.join(tmp_path, fname)
+    with open(manifest_path, "w") as f:
+        f.write(content)
+    with pytest.raises(ValueError):
+        batch.load_manifest(manifest_path)
+
+
+def test_pick_video_url_best(config, monkeypatch):
+    videos = [
+        render.Video(href="/watch?v=abc", title="video"),
+        render.Video(href="/watch?v=def", title="Dolly Parton - Jolene"),
+    ]
+    monkeypatch.setattr(
+        render.RenderSessionPool, "search_videos", lambda self, payload: videos
+    )
+    pool = render.RenderSessionPool.from_config(config)
+    entry = batch.ManifestEntry(query="jolene", youtube_pick="best")
+    song = make_song("Jolene")
+    try:
+        url = batch.pick_video_url(config, entry, "Jolene", song, pool)
+        assert url == "https://www.youtube.com/watch?v=def"
+        # nothing is picked when no video is a confident match
+        videos.pop()
+        assert batch.pick_video_url(config, entry, "Jolene", song, pool) is None
+    finally:
+        pool.close()
+
+
+def test_prepare_entry(config):
+    entry = batch.ManifestEntry(
+        query="jolene", youtube_url="https://www.youtube.com/watch?v=abc&t=10"
+    )
+    jobs, skipped = batch.prepare_entry(config, 0, entry)
+    assert skipped == []
+    assert jobs[0].video_url == "https://www.youtube.com/watch?v=abc"
+    assert jobs[0].song_properties.trackName == "Jolene"
+
+    # destinations must be enabled
+    entry = batch.ManifestEntry(query="jolene", destination="i")
+    jobs, skipped = batch.prepare_entry(config, 0, entry)
+    assert jobs == []
+    assert skipped[0].status == "failed"
+
+
+def test_prepare_entry_same_recording(config):
+    cli.initialize_dirs([config.get_data_path(), config.get_local_folder_path()])
+    with open(os.path.join(config.get_local_folder_path(), "01 Jolene.mp3"), "wb") as f:
+        f.write(b"\0")
+    library_index = library.LibraryIndex.from_config(config)
+    entry = batch.ManifestEntry(
+        query="dolly parton hit", youtube_url="https://www.youtube.com/watch?v=abc"
+    )
+    try:
+        jobs, skipped = batch.prepare_entry(config, 0, entry, None, library_index)
+    finally:
+        library_index.close()
+    # the itunes properties match the recording, although the names do not
+    assert jobs == []
+    assert skipped[0].status == "skipped"
+
+
+def test_prefetch_song_properties():
+    class FakeClient:
+        queries = []
+
+        def query_many(self, queries):
+            self.queries.append(queries)
+            album = itunes_api.ItunesApiAlbumKeys(
+                artistName="Dolly Parton",
+                collectionName="Jolene",
+                trackCount=2,
+                collectionId=123,
+            )
+            return [[album] if q.mode == modes.Modes.ALBUM else [] for q in queries]
+
+    client = FakeClient()
+    batch.prefetch_song_properties(
+        [
+            batch.ManifestEntry(query="jolene"),
+            batch.ManifestEntry(query="9 to 5", itunes_pick="none"),
+            batch.ManifestEntry(mode="album", query="dolly parton jolene"),
+        ],
+        client,
+    )
+    # searches are sent together, then the track lists of the albums found
+    first, second = client.queries
+    assert [(q.search_variable, q.mode) for q in first] == [
+        ("jolene", modes.Modes.SONG),
+        ("dolly parton jolene", modes.Modes.ALBUM),
+    ]
+    assert [(q.search_variable, q.lookup) for q in second] == [(123, True)]
+
+
+def test_run(config, tmp_path):
+    manifest_path = os.path.join(tmp_path, "manifest.jsonl")
+    report_path = os.path.join(tmp_path, "report.jsonl")
+    with open(manifest_path, "w") as f:
+        f.write('{"query": "jolene", "itunes_pick": "none"}\n')
+        f.write('{"mode": "album", "query": "dolly parton jolene"}\n')
+
+    results = batch.run(manifest_path, report_path=report_path, config=config)
+    assert [(r.entry, r.song_name, r.status) for r in results] == [
+        (0, "jolene", "success"),
+        # the song from the album was already queued by the first entry
+        (1, "Jolene", "skipped"),
+        (1, "Early Morning Breeze", "success"),
+    ]
+    with open(report_path) as f:
+        assert len([json.loads(line) for line in f]) == 3
+    # the staging folder is removed at shutdown, once empty
+    assert sorted(os.listdir(config.get_local_folder_path())) == [
+        "Early Morning Breeze.mp3",
+        "jolene.mp3",
+    ]
+
+
+def test_run_resume(config, tmp_path, monkeypatch):
+    manifest_path = os.path.join(tmp_path, "manifest.jsonl")
+    with open(manifest_path, "w") as f:
+        f.write('{"mode": "album", "itunes_id": 123}\n')
+
+    downloads = []
+
+    def flaky_run_download(url, file_path_no_format, file_format, **kwargs):
+        downloads.append(os.path.basename(file_path_no_format))
+        if len(downloads) == 2:
+            # leave a partial download behind, as an interrupted yt-dlp would
+            with open(f"{file_path_no_format}.webm.part", "wb") as f:
+                f.write(b"\0")
+            return None
+        file_path = f"{file_path_no_format}.{file_format}"
+        with open(file_path, "wb") as f:
+            f.write(b"\0")
+        return file_path
+
+    monkeypatch.setattr(youtube, "run_download", flaky_run_download)
+    # fail the download, rather than retry it
+    config.youtube_dl_retries = 0
+    results = batch.run(manifest_path, config=config)
+    assert [r.status for r in results] == ["success", "failed"]
+
+    monkeypatch.setattr(
+        render.RenderSessionPool,
+        "search_videos",
+        lambda self, payload: pytest.fail("resumed entries are not searched again"),
+    )
+    results = batch.run(manifest_path, config=config, resume=True)
+    assert [(r.song_name, r.status) for r in results] == [
+        ("Jolene", "success"),
+        ("Early Morning Breeze", "success"),
+    ]
+    assert results[0].message == "finished by a previous run"
+    # only the failed job is downloaded again, to the same staging path
+    assert len(downloads) == 3 and downloads[1] == downloads[2] != downloads[0]
+    assert sorted(os.listdir(config.get_local_folder_path())) == [
+        "Early Morning Breeze.mp3",
+        "Jolene.mp3",
+    ]
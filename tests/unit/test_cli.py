@@ -1,6 +1,11 @@
 from songbirdcli import cli
+from songbirdcli import itunes_search
+from songbirdcli import prefetch
+from songbirdcli import render
 from songbirdcli import settings
 from songbirdcli import version
+from songbirdcore import itunes
+from songbirdcore import youtube
 from io import StringIO
 import os, sys, shutil
 import pytest
@@ -148,3 +153,99 @@ def test_cli_mp3(load_mp3_config):
 def test_cli_m4a(load_m4a_config):
     # invoke the main function of the cli
     cli.run(config=load_m4a_config)
+
+
+def test_select_video_url_prefetched(monkeypatch):
+    inputs = iter(["", "1"])  # search youtube, then pick the second video
+    monkeypatch.setattr("builtins.input", lambda _: next(inputs))
+    prefetcher = prefetch.SearchPrefetcher(
+        lambda payload: [
+            render.Video(href="/watch?v=a", title="a"),
+            render.Video(href="/watch?v=b&list=c", title="b"),
+        ]
+    )
+    try:
+        video_url = cli.select_video_url(
+            "https://www.youtube.com",
+            "https://www.youtube.com/results",
+            {"search_query": "jolene"},
+            render_timeout=1,
+            render_wait=0,
+            render_retries=1,
+            render_sleep=0,
+            prefetcher=prefetcher,
+        )
+    finally:
+        prefetcher.close()
+    assert video_url == "https://www.youtube.com/watch?v=b"
+
+
+class FakeSearchEngine:
+    def __init__(self, videos: dict):
+        self.videos = videos
+
+    def search_videos(self, payload):
+        return self.videos[payload["search_query"]]
+
+
+def test_run_album(tmp_path, monkeypatch):
+    def make_song(name: str, track_number: int):
+        return itunes_search.ItunesSongModel(
+            trackName=name,
+            artistName="Dolly Parton",
+            collectionName="Jolene",
+            artworkUrl100="",
+            primaryGenreName="Country",
+            trackNumber=track_number,
+            trackCount=2,
+            collectionId=123,
+            discNumber=1,
+            discCount=1,
+            releaseDate="1973",
+            trackTimeMillis=162000,
+        )
+
+    def fake_run_download(url, file_path_no_format, file_format, **kwargs):
+        downloads.append(url)
+        file_path = f"{file_path_no_format}.{file_format}"
+        with open(file_path, "wb") as f:
+            f.write(b"\0")
+        return file_path
+
+    downloads = []
+    monkeypatch.setattr(youtube, "run_download", fake_run_download)
+    monkeypatch.setattr(itunes, "mp3ID3Tagger", lambda *args: True)
+    inputs = iter(
+        ["", "0"]
+    )  # search youtube for the unmatched track, pick the first video
+    monkeypatch.setattr("builtins.input", lambda _: next(inputs))
+    engine = FakeSearchEngine(
+        {
+            "Dolly Parton Jolene": [
+                render.Video(
+                    href="/watch?v=a", title="Dolly Parton - Jolene", duration=162
+                )
+            ],
+            "Dolly Parton Early Morning Breeze": [
+                render.Video(href="/watch?v=b", title="something else", duration=600)
+            ],
+        }
+    )
+    config = settings.SongbirdCliConfig(
+        version=version.version,
+        root_path=str(tmp_path),
+        gdrive_enabled=False,
+        itunes_enabled=False,
+        run_local=True,
+    )
+    cli.initialize_dirs([config.get_data_path(), config.get_local_folder_path()])
+    results = cli.run_album(
+        config,
+        [make_song("Jolene", 1), make_song("Early Morning Breeze", 2)],
+        engine,
+    )
+    assert results == [True, True]
+    assert sorted(downloads) == [
+        "https://www.youtube.com/watch?v=a",
+        "https://www.youtube.com/watch?v=b",
+    ]
@@ -0,0 +1,52 @@
+import math
+import random
+
+from songbirdcli import fingerprint
+
+
+def make_audio(seed: int, seconds: int = 12) -> list:
+    """a song of random chords, a quarter of a second each"""
+    rng = random.Random(seed)
+    note_length = fingerprint.SAMPLE_RATE // 4
+    samples = []
+    for note in range(seconds * 4):
+        freqs = [rng.uniform(80, 2000) for _ in range(3)]
+        for i in range(note_length):
+            t = (note * note_length + i) / fingerprint.SAMPLE_RATE
+            envelope = 1 - i / note_length
+            samples.append(
+                int(6000 * envelope * sum(math.sin(2 * math.pi * f * t) for f in freqs))
+            )
+    return samples
+
+
+def reencode(samples: list, seed: int) -> list:
+    """the same song, quieter, filtered, noisy and starting later, as a lossy re-encode might be"""
+    rng = random.Random(seed)
+    filtered = [(a + b) // 2 for a, b in zip(samples, samples[1:] + [0])]
+    return [0] * 1700 + [int(0.6 * s + rng.gauss(0, 300)) for s in filtered]
+
+
+def test_compute_matches_reencodes():
+    audio = make_audio(1)
+    fp = fingerprint.from_hex(fingerprint.compute(audio))
+    reencoded = fingerprint.from_hex(fingerprint.compute(reencode(audio, 2)))
+    other = fingerprint.from_hex(fingerprint.compute(make_audio(3)))
+    assert fingerprint.similarity(fp, reencoded) >= fingerprint.THRESHOLD
+    assert fingerprint.similarity(fp, other) < fingerprint.THRESHOLD
+    assert fingerprint.find_similar(fp, {"reencoded": reencoded, "other": other}) == {
+        "reencoded": fingerprint.similarity(fp, reencoded)
+    }
+
+
+def test_compute_short_or_silent():
+    assert fingerprint.compute([0] * fingerprint.SAMPLE_RATE * 5) == ""
+    assert fingerprint.compute(make_audio(1, seconds=1)) == ""
+
+
+def test_hex_round_trip():
+    fp = fingerprint.from_hex(fingerprint.compute(make_audio(1)))
+    # leading zero frames are kept, so the number of frames survives
+    for value in [fp, (1, fp[1])]:
+        assert fingerprint.from_hex(fingerprint.to_hex(value)) == value
+    assert fingerprint.from_hex("") is None
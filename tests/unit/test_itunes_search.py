@@ -0,0 +1,197 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from songbirdcli import itunes_search
+from songbirdcli import throttle
+from songbirdcore.models import modes, itunes_api
+
+song_result = {
+    "wrapperType": "track",
+    "trackName": "Jolene",
+    "artistName": "Dolly Parton",
+    "collectionName": "Jolene",
+    "artworkUrl100": "https://example.com/100x100bb.jpg",
+    "primaryGenreName": "Country",
+    "trackNumber": 1,
+    "trackCount": 10,
+    "collectionId": 123,
+    "discNumber": 1,
+    "discCount": 1,
+    "releaseDate": "1973-10-15T07:00:00Z",
+}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = itunes_search.ResponseCache(
+        os.path.join(tmp_path, "cache.sqlite"), max_entries=2
+    )
+    yield cache
+    cache.close()
+
+
+def test_response_cache_ttl(cache):
+    cache.put("key", "body")
+    assert cache.get("key", ttl=60) == "body"
+    # stale entries are treated as missing
+    assert cache.get("key", ttl=-1) is None
+    assert cache.get("key", ttl=60) is None
+
+
+def test_response_cache_lru_eviction(cache, monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr(itunes_search.time, "time", lambda: next(clock))
+    cache.put("a", "1")
+    cache.put("b", "2")
+    # mark a as recently used, so b is evicted first
+    assert cache.get("a", ttl=60) == "1"
+    cache.put("c", "3")
+    assert cache.get("b", ttl=60) is None
+    assert cache.get("a", ttl=60) == "1"
+    assert cache.get("c", ttl=60) == "3"
+
+
+def test_client_serves_from_cache(cache, monkeypatch):
+    client = itunes_search.ItunesClient(
+        search_url="https://example.com/search",
+        lookup_url="https://example.com/lookup",
+        cache=cache,
+    )
+    calls = []
+
+    def fake_fetch(search_variable, limit, mode, lookup=False):
+        calls.append((search_variable, limit, mode, lookup))
+        return json.dumps({"resultCount": 1, "results": [song_result]})
+
+    monkeypatch.setattr(client.async_client, "fetch", fake_fetch)
+    for _ in range(3):
+        results = client.query_api("jolene", 5, modes.Modes.SONG)
+        assert isinstance(results[0], itunes_api.ItunesApiSongModel)
+        assert results[0].releaseDate == "1973"
+    # lookups are cached under their own key
+    client.query_api("jolene", 5, modes.Modes.SONG, lookup=True)
+    assert len(calls) == 2
+    client.close()
+
+
+def test_client_coalesces_concurrent_queries(monkeypatch):
+    client = itunes_search.ItunesClient(
+        search_url="https://example.com/search",
+        lookup_url="https://example.com/lookup",
+        max_connections=4,
+    )
+    calls = []
+    release = threading.Event()
+
+    def slow_fetch(search_variable, limit, mode, lookup=False):
+        calls.append(search_variable)
+        release.wait(timeout=5)
+        return json.dumps({"resultCount": 1, "results": [song_result]})
+
+    monkeypatch.setattr(client.async_client, "fetch", slow_fetch)
+    queries = [
+        itunes_search.ItunesQuery(search_variable=term, limit=1, mode=modes.Modes.SONG)
+        for term in ["jolene", "jolene", "9 to 5"]
+    ]
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(client.query_many, queries)
+        # both distinct queries are requested at once, without waiting on each other
+        while len(calls) < 2:
+            time.sleep(0.01)
+        release.set()
+        results = future.result(timeout=5)
+    assert sorted(calls) == ["9 to 5", "jolene"]
+    assert all(result[0].trackName == "Jolene" for result in results)
+    client.close()
+
+
+class FakeSession:
+    """a session answering with the queued status codes, then 200"""
+
+    def __init__(self, status_codes=None, headers=None):
+        self.status_codes = list(status_codes or [])
+        self.headers = headers or {}
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def get(self, url, params=None, timeout=None):
+        with self.lock:
+            self.calls.append(params["term"])
+            status_code = self.status_codes.pop(0) if self.status_codes else 200
+        response = FakeResponse(status_code, self.headers if status_code != 200 else {})
+        response.url = url
+        return response
+
+    def close(self):
+        pass
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = b""
+        self.text = json.dumps({"resultCount": 1, "results": [song_result]})
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """a frozen clock, recording the seconds each request was held back"""
+    sleeps = []
+    lock = threading.Lock()
+
+    def fake_sleep(seconds):
+        with lock:
+            sleeps.append(seconds)
+
+    monkeypatch.setattr(throttle.time, "monotonic", lambda: 1000.0)
+    monkeypatch.setattr(throttle.time, "sleep", fake_sleep)
+    return sleeps
+
+
+def make_throttled_client(session, requests_per_minute=20):
+    client = itunes_search.ItunesClient(
+        search_url="https://example.com/search",
+        lookup_url="https://example.com/lookup",
+        requests_per_minute=requests_per_minute,
+        max_connections=4,
+        request_throttle=throttle.Throttle(max_retries=2),
+    )
+    client.async_client.session = session
+    return client
+
+
+def test_client_paces_concurrent_queries(sleeps):
+    session = FakeSession()
+    client = make_throttled_client(session, requests_per_minute=20)
+    queries = [
+        itunes_search.ItunesQuery(search_variable=term, limit=1, mode=modes.Modes.SONG)
+        for term in ["jolene", "9 to 5", "coat of many colors", "here you come again"]
+    ]
+    try:
+        results = client.query_many(queries)
+    finally:
+        client.close()
+    assert all(result[0].trackName == "Jolene" for result in results)
+    assert len(session.calls) == 4
+    # sent concurrently, yet spaced 3 seconds apart at 20 requests per minute
+    assert sorted(sleeps) == pytest.approx([3, 6, 9])
+
+
+def test_client_retries_throttled_queries(sleeps):
+    session = FakeSession(status_codes=[429], headers={"Retry-After": "5"})
+    client = make_throttled_client(session)
+    try:
+        results = client.query_api("jolene", 1, modes.Modes.SONG)
+    finally:
+        client.close()
+    assert results[0].trackName == "Jolene"
+    assert session.calls == ["jolene", "jolene"]
+    # the retry waited at least as long as the api asked
+    assert len(sleeps) == 1 and sleeps[0] >= 5
+    stats = client.async_client.throttle.get_stats()[0]
+    assert (stats.throttled, stats.retries) == (1, 1)
@@ -0,0 +1,125 @@
+import os
+
+import pytest
+from songbirdcli import cli
+from songbirdcli import journal
+from songbirdcli import pipeline
+from songbirdcli import settings
+from songbirdcli import version
+from songbirdcore import youtube
+
+
+@pytest.fixture
+def job(tmp_path):
+    return pipeline.SongJob(
+        song_name="jolene",
+        file_path_no_format=os.path.join(tmp_path, "jolene"),
+        file_format="mp3",
+        video_url="https://www.youtube.com/watch?v=abc",
+    )
+
+
+def test_record_and_load(tmp_path, job):
+    path = os.path.join(tmp_path, "journal.jsonl")
+    song_journal = journal.Journal(path)
+    song_journal.record_job(job, journal.Stage.SEARCHED)
+    song_journal.record_job(job, journal.Stage.DOWNLOADED, path="jolene.mp3")
+    song_journal.record("other", journal.Stage.SKIPPED, song_name="other")
+    song_journal.close()
+    # a crash while writing leaves an incomplete last line
+    with open(path, "a") as f:
+        f.write('{"job_id": "partial", "sta')
+
+    song_journal = journal.Journal(path)
+    record = song_journal.get(job.job_id)
+    assert record.stage == journal.Stage.DOWNLOADED
+    assert record.path == "jolene.mp3"
+    assert record.job == job
+    assert [record.job_id for record in song_journal.pending()] == [job.job_id]
+
+    song_journal.record_job(job, journal.Stage.DONE)
+    song_journal.close()
+    song_journal = journal.Journal(path)
+    assert song_journal.pending() == []
+    assert song_journal.get(job.job_id).stage == journal.Stage.DONE
+
+    song_journal.compact()
+    song_journal.close()
+    with open(path) as f:
+        assert f.read() == ""
+
+
+def test_remaining_stages(tmp_path, job):
+    assert journal.remaining_stages(None) == journal.PROCESSING_ORDER[1:]
+    record = journal.JournalRecord(
+        job_id=job.job_id,
+        stage=journal.Stage.TAGGED,
+        time=0,
+        path=os.path.join(tmp_path, "jolene.mp3"),
+    )
+    # the file went missing, so the song is downloaded again
+    assert journal.remaining_stages(record) == journal.PROCESSING_ORDER[1:]
+    with open(record.path, "wb") as f:
+        f.write(b"\0")
+    assert journal.remaining_stages(record) == [
+        journal.Stage.MOVED,
+        journal.Stage.UPLOADED,
+        journal.Stage.DONE,
+    ]
+
+
+def test_process_song_resume(tmp_path, job, monkeypatch):
+    config = settings.SongbirdCliConfig(
+        version=version.version,
+        root_path=str(tmp_path),
+        itunes_enabled=False,
+        run_local=True,
+    )
+    song_journal = journal.Journal(os.path.join(tmp_path, "journal.jsonl"))
+    song_journal.record_job(job, journal.Stage.SEARCHED)
+    with open(f"{cli.get_staging_path(config, job)}.webm.part", "wb") as f:
+        f.write(b"\0")
+
+    def fake_run_download(url, file_path_no_format, file_format, **kwargs):
+        assert not os.path.exists(f"{file_path_no_format}.webm.part")
+        file_path = f"{file_path_no_format}.{file_format}"
+        with open(file_path, "wb") as f:
+            f.write(b"\0")
+        return file_path
+
+    monkeypatch.setattr(youtube, "run_download", fake_run_download)
+    assert cli.process_song(config, job, song_journal) is True
+    assert song_journal.get(job.job_id).stage == journal.Stage.DONE
+    assert sorted(os.listdir(tmp_path)) == [
+        cli.STAGING_FOLDER,
+        "jolene.mp3",
+        "journal.jsonl",
+    ]
+
+
+def test_resume_jobs_skips_saved_recordings(tmp_path, job, monkeypatch):
+    config = settings.SongbirdCliConfig(
+        version=version.version,
+        root_path=str(tmp_path),
+        itunes_enabled=False,
+        run_local=True,
+    )
+    song_journal = journal.Journal(os.path.join(tmp_path, "journal.jsonl"))
+    song_journal.record_job(job, journal.Stage.SEARCHED)
+
+    def fake_run_download(url, file_path_no_format, file_format, **kwargs):
+        file_path = f"{file_path_no_format}.{file_format}"
+        with open(file_path, "wb") as f:
+            f.write(b"\0")
+        return file_path
+
+    class FakeLibraryIndex:
+        def find_audio(self, root, file_path):
+            return [os.path.join(root, "saved jolene.mp3")]
+
+    monkeypatch.setattr(youtube, "run_download", fake_run_download)
+    results = cli.resume_jobs(config, song_journal, library_index=FakeLibraryIndex())
+    assert results == [True]
+    # the resumed song was checked against the library, and not saved again
+    assert song_journal.get(job.job_id).message.startswith("same recording as")
+    assert not os.path.exists(os.path.join(tmp_path, "jolene.mp3"))
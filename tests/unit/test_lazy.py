@@ -0,0 +1,20 @@
+import sys
+
+from songbirdcli import lazy
+
+
+def test_module_is_imported_on_first_use(tmp_path, monkeypatch):
+    (tmp_path / "heavy_module.py").write_text("VALUE = 1\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "heavy_module", raising=False)
+    heavy_module = lazy.load("heavy_module")
+    assert "heavy_module" not in sys.modules
+    assert heavy_module.VALUE == 1
+    assert "heavy_module" in sys.modules
+    # patches are made to, and seen through, the module itself
+    monkeypatch.setattr(heavy_module, "VALUE", 2)
+    assert sys.modules["heavy_module"].VALUE == 2
+    monkeypatch.undo()
+    sys.modules["heavy_module"].VALUE = 3
+    assert heavy_module.VALUE == 3
+    del sys.modules["heavy_module"]
@@ -0,0 +1,151 @@
+import os
+import threading
+
+import pytest
+from mutagen.easyid3 import EasyID3
+from songbirdcli import fingerprint
+from songbirdcli import library
+from test_fingerprint import make_audio, reencode
+
+
+def touch(path: str, size: int = 10):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+
+
+@pytest.fixture
+def roots(tmp_path):
+    dump = os.path.join(tmp_path, "dump")
+    itunes_lib = os.path.join(tmp_path, "ituneslib")
+    touch(os.path.join(dump, "jolene.m4a"))
+    touch(os.path.join(dump, "billy joel - piano man.mp3"))
+    touch(os.path.join(dump, ".hidden jolene.m4a"))
+    touch(os.path.join(itunes_lib, "Dolly Parton", "Jolene", "01 Jolene.m4a"))
+    touch(os.path.join(itunes_lib, "Billy Joel", "The Stranger", "02 Movin' Out.m4a"))
+    return dump, itunes_lib
+
+
+@pytest.fixture
+def index(tmp_path, roots, monkeypatch):
+    dump, itunes_lib = roots
+    monkeypatch.setattr(library, "RACY_WINDOW", 0)
+    index = library.LibraryIndex(
+        os.path.join(tmp_path, "library.sqlite"), {dump: 0, itunes_lib: 2}
+    )
+    index.refresh()
+    yield index
+    index.close()
+
+
+@pytest.mark.parametrize(
+    "root_idx,term,expected",
+    [
+        (0, "jolene", ["jolene.m4a"]),
+        (0, "Piano", ["billy joel - piano man.mp3"]),
+        (0, "missing", []),
+        # album and artist folders are matched in the itunes library
+        (1, "dolly", ["01 Jolene.m4a"]),
+        (1, "movin out", ["02 Movin' Out.m4a"]),
+        (1, "stranger", ["02 Movin' Out.m4a"]),
+    ],
+)
+def test_search(index, roots, root_idx, term, expected):
+    results = index.search(roots[root_idx], term)
+    assert [os.path.basename(r) for r in results] == expected
+
+
+def test_refresh_is_incremental(index, roots, monkeypatch):
+    dump, itunes_lib = roots
+    touch(os.path.join(itunes_lib, "Dolly Parton", "Jolene", "02 Early Morning.m4a"))
+    os.remove(os.path.join(dump, "jolene.m4a"))
+    scanned = []
+    scan_dir = index._scan_dir
+
+    def spy(path, *args):
+        scanned.append(path)
+        return scan_dir(path, *args)
+
+    monkeypatch.setattr(index, "_scan_dir", spy)
+    index.refresh()
+    # only the folders that changed are rescanned
+    assert sorted(scanned) == sorted(
+        [dump, os.path.join(itunes_lib, "Dolly Parton", "Jolene")]
+    )
+    assert index.search(dump, "jolene") == []
+    assert len(index.search(itunes_lib, "early morning")) == 1
+
+
+def test_refresh_removed_folder(index, roots):
+    dump, itunes_lib = roots
+    album = os.path.join(itunes_lib, "Billy Joel", "The Stranger")
+    os.remove(os.path.join(album, "02 Movin' Out.m4a"))
+    os.rmdir(album)
+    index.refresh()
+    assert index.search(itunes_lib, "stranger") == []
+
+
+def write_mp3(path: str, audio: bytes, title: str = "", artist: str = ""):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"\xff\xfb\x90\x64" + audio)
+    if title:
+        tags = EasyID3()
+        tags["title"] = title
+        tags["artist"] = artist
+        tags.save(path)
+
+
+def test_find_recording(index, roots):
+    dump, itunes_lib = roots
+    write_mp3(os.path.join(dump, "track01.mp3"), b"a", "Piano Man", "Billy Joel")
+    index.refresh()
+    # matched on the tags, whatever the file is called
+    assert index.find_recording(dump, "piano man", "Billy Joel") == [
+        os.path.join(dump, "track01.mp3")
+    ]
+    assert index.find_recording(dump, "Piano Man", "Elton John") == []
+    # untagged files fall back to their path, less the track number
+    assert index.find_recording(itunes_lib, "Movin Out", "billy joel") == [
+        os.path.join(itunes_lib, "Billy Joel", "The Stranger", "02 Movin' Out.m4a")
+    ]
+    # files without an artist match on their title alone
+    assert index.find_recording(dump, "Jolene", "Dolly Parton") == [
+        os.path.join(dump, "jolene.m4a")
+    ]
+
+
+def test_find_audio(index, roots, tmp_path, monkeypatch):
+    dump, _ = roots
+    # ffmpeg is stood in for, decoding each file to the song named by its audio
+    songs = {b"a": make_audio(1), b"b": make_audio(2)}
+    songs[b"a reencoded"] = reencode(songs[b"a"], 3)
+    release = threading.Event()
+
+    def fake_decode(file_path):
+        if file_path.startswith(dump):
+            release.wait(timeout=5)
+        with open(file_path, "rb") as f:
+            data = f.read()
+        for audio, samples in songs.items():
+            # after the frame header written by write_mp3
+            if data.endswith(b"\xff\xfb\x90\x64" + audio):
+                return samples
+        return None
+
+    monkeypatch.setattr(fingerprint, "decode", fake_decode)
+    write_mp3(os.path.join(dump, "piano man.mp3"), b"a", "Piano Man", "Billy Joel")
+    write_mp3(os.path.join(dump, "other.mp3"), b"b")
+    # the refresh returns without waiting on the fingerprints
+    index.refresh()
+    assert index.find_recording(dump, "Piano Man", "Billy Joel") != []
+    download = os.path.join(tmp_path, "download.mp3")
+    write_mp3(download, b"a reencoded")
+    assert index.find_audio(dump, download) == []
+
+    release.set()
+    assert index.wait_for_fingerprints(timeout=5)
+    # a fresh download of the same recording matches, although it was re-encoded and has no tags
+    assert index.find_audio(dump, download) == [os.path.join(dump, "piano man.mp3")]
+    write_mp3(download, b"c")
+    assert index.find_audio(dump, download) == []
@@ -0,0 +1,67 @@
+from songbirdcli import itunes_search
+from songbirdcli import matching
+from songbirdcli import render
+
+
+def make_song(**kwargs) -> itunes_search.ItunesSongModel:
+    return itunes_search.ItunesSongModel(
+        **{
+            "trackName": "Jolene",
+            "artistName": "Dolly Parton",
+            "collectionName": "Jolene",
+            "artworkUrl100": "",
+            "primaryGenreName": "Country",
+            "trackNumber": 1,
+            "trackCount": 10,
+            "collectionId": 123,
+            "discNumber": 1,
+            "discCount": 1,
+            "releaseDate": "1973",
+            "trackTimeMillis": 162000,
+            **kwargs,
+        }
+    )
+
+
+def test_best_match_prefers_title_artist_and_length():
+    videos = [
+        render.Video(href="/watch?v=a", title="Jolene", duration=400, channel="Cover"),
+        render.Video(
+            href="/watch?v=b",
+            title="Jolene (Audio)",
+            duration=163,
+            channel="Dolly Parton - Topic",
+        ),
+        render.Video(href="/watch?v=c", title="Islands in the Stream", duration=162),
+    ]
+    video, score = matching.best_match(make_song(), videos)
+    assert video.href == "/watch?v=b"
+    assert score > 0.9
+
+
+def test_other_versions_are_penalized():
+    videos = [
+        render.Video(href="/watch?v=a", title="Dolly Parton - Jolene", duration=162),
+        render.Video(
+            href="/watch?v=b", title="Dolly Parton - Jolene (Live)", duration=162
+        ),
+        render.Video(
+            href="/watch?v=c", title="Jolene - Dolly Parton cover", duration=162
+        ),
+    ]
+    studio, live, cover = matching.score_videos(make_song(), videos)
+    assert studio > live > cover
+    # unless the song is itself that version
+    studio, live, _ = matching.score_videos(
+        make_song(trackName="Jolene (Live)"), videos
+    )
+    assert live > studio
+
+
+def test_unknown_length_lowers_confidence():
+    video = render.Video(href="/watch?v=a", title="Dolly Parton - Jolene")
+    assert (
+        matching.score_videos(make_song(), [video])[0]
+        <= matching.UNKNOWN_DURATION_SCORE
+    )
+    assert matching.best_match(make_song(), None) == (None, 0.0)
@@ -0,0 +1,59 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from songbirdcli import names
+
+
+def stage(tmp_path, name: str) -> str:
+    path = os.path.join(tmp_path, "staging", name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(name)
+    return path
+
+
+def test_reserve(tmp_path):
+    folder = str(tmp_path)
+    with open(os.path.join(folder, "jolene.mp3"), "w") as f:
+        f.write("")
+    allocator = names.NameAllocator()
+    assert allocator.reserve(folder, "9 to 5.mp3") == os.path.join(folder, "9 to 5.mp3")
+    # reserved names and existing files are both skipped, without a limit
+    reserved = [allocator.reserve(folder, "jolene.mp3") for _ in range(10)]
+    assert [os.path.basename(path) for path in reserved[:3]] == [
+        "jolene_dup.mp3",
+        "jolene_dup2.mp3",
+        "jolene_dup3.mp3",
+    ]
+    assert len(set(reserved)) == 10
+
+
+def test_publish_concurrent(tmp_path):
+    folder = os.path.join(tmp_path, "dump")
+    os.makedirs(folder)
+    allocator = names.NameAllocator()
+    staged = [stage(tmp_path, f"job{i}") for i in range(20)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        published = list(
+            executor.map(
+                lambda path: allocator.publish(path, folder, "jolene.mp3"), staged
+            )
+        )
+    # every song is kept, none replaced another
+    assert len(set(published)) == 20
+    assert len(os.listdir(folder)) == 20
+    assert not any(os.path.exists(path) for path in staged)
+
+
+def test_publish_created_since_listed(tmp_path):
+    folder = os.path.join(tmp_path, "dump")
+    os.makedirs(folder)
+    allocator = names.NameAllocator()
+    allocator.publish(stage(tmp_path, "first"), folder, "jolene.mp3")
+    # another program saves the next duplicate name after the folder was listed
+    with open(os.path.join(folder, "jolene_dup.mp3"), "w") as f:
+        f.write("other")
+    path = allocator.publish(stage(tmp_path, "second"), folder, "jolene.mp3")
+    assert os.path.basename(path) == "jolene_dup2.mp3"
+    with open(os.path.join(folder, "jolene_dup.mp3")) as f:
+        assert f.read() == "other"
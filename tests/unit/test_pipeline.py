@@ -0,0 +1,79 @@
+import threading
+import time
+from typing import List
+
+import pytest
+from songbirdcli import pipeline
+
+
+def make_jobs(n: int) -> List[pipeline.SongJob]:
+    return [
+        pipeline.SongJob(
+            song_name=f"song{i}",
+            file_path_no_format=f"/tmp/song{i}",
+            file_format="mp3",
+            video_url=f"https://www.youtube.com/watch?v={i}",
+        )
+        for i in range(n)
+    ]
+
+
+def test_run_jobs_concurrently():
+    """jobs should overlap when more than one worker is available"""
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def process_job(job):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.05)
+        with lock:
+            active -= 1
+        return True
+
+    results = pipeline.run_jobs(make_jobs(6), process_job, workers=3)
+    assert results == [True] * 6
+    assert 1 < peak <= 3
+
+
+@pytest.mark.parametrize(
+    "inp,expected",
+    [
+        # user continues with the queue after the failure
+        ("y", [None, True, True]),
+        # user stops the queue after the failure, the song already
+        # downloading is left to finish
+        ("n", [None, True, None]),
+    ],
+)
+def test_run_jobs_failure_prompt(monkeypatch, inp, expected):
+    """a failed song should prompt the user to continue with the remaining queue"""
+    started = threading.Event()
+    prompted = threading.Event()
+
+    def fake_input(_):
+        started.wait()
+        prompted.set()
+        return inp
+
+    monkeypatch.setattr("builtins.input", fake_input)
+
+    def process_job(job):
+        if job.song_name == "song0":
+            return None
+        started.set()
+        prompted.wait()
+        return True
+
+    results = pipeline.run_jobs(make_jobs(3), process_job, workers=1)
+    assert results == expected
+
+
+def test_run_jobs_catches_errors():
+    def process_job(job):
+        raise RuntimeError("boom")
+
+    assert pipeline.run_jobs(make_jobs(1), process_job, workers=2) == [None]
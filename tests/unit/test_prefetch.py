@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+from songbirdcli import prefetch
+
+
+@pytest.fixture
+def searches():
+    return []
+
+
+@pytest.fixture
+def prefetcher(searches):
+    release = threading.Event()
+    release.set()
+
+    def search(payload):
+        searches.append(payload["search_query"])
+        if payload["search_query"] == "slow":
+            release.wait(5)
+        if payload["search_query"] == "missing":
+            return None
+        return [payload["search_query"]]
+
+    prefetcher = prefetch.SearchPrefetcher(search)
+    prefetcher.release = release
+    yield prefetcher
+    release.set()
+    prefetcher.close()
+
+
+def test_prefetch(prefetcher, searches):
+    prefetcher.prefetch({"search_query": "jolene"})
+    prefetcher.prefetch({"search_query": "jolene"})
+    assert prefetcher.get({"search_query": "jolene"}) == ["jolene"]
+    # searches that were never prefetched run in place
+    assert prefetcher.get({"search_query": "dolly"}) == ["dolly"]
+    assert searches == ["jolene", "dolly"]
+
+
+def test_prefetch_fallback(prefetcher, searches):
+    prefetcher.prefetch({"search_query": "jolene"})
+    prefetcher.get({"search_query": "jolene"})
+    prefetcher.release.clear()
+    prefetcher.prefetch({"search_query": "slow"})
+    # the refined search is still running, so the finished search is reused
+    result = prefetcher.get({"search_query": "slow"}, {"search_query": "jolene"})
+    assert result == ["jolene"]
+    prefetcher.release.set()
+    assert prefetcher.get({"search_query": "slow"}) == ["slow"]
+
+
+def test_prefetch_failure_is_retried(prefetcher, searches):
+    prefetcher.prefetch({"search_query": "missing"})
+    assert prefetcher.get({"search_query": "missing"}) is None
+    assert prefetcher.get({"search_query": "missing"}) is None
+    assert searches == ["missing", "missing"]
@@ -0,0 +1,72 @@
+import pytest
+import requests
+from songbirdcli import cli
+from songbirdcli import probe
+
+
+class FakeResponse:
+    def __init__(self, url: str, status_code: int):
+        self.url = url
+        self.status_code = status_code
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def prober():
+    prober = probe.UrlProber()
+    prober.requests = []
+    yield prober
+    prober.close()
+
+
+def test_probe_is_cached(prober, monkeypatch):
+    def fake_head(url, **kwargs):
+        prober.requests.append(("head", url))
+        return FakeResponse(url, 200)
+
+    monkeypatch.setattr(prober.session, "head", fake_head)
+    url = "https://www.youtube.com/watch?v=abc"
+    assert prober.probe(url).ok
+    assert prober.probe(url).ok
+    assert prober.requests == [("head", url)]
+    assert not prober.probe("www.youtube.com/watch?v=abc").ok
+    assert len(prober.requests) == 1
+
+
+def test_probe_falls_back_to_range_request(prober, monkeypatch):
+    def fake_get(url, headers=None, **kwargs):
+        prober.requests.append(("get", headers))
+        return FakeResponse(url, 206)
+
+    monkeypatch.setattr(
+        prober.session, "head", lambda url, **kwargs: FakeResponse(url, 405)
+    )
+    monkeypatch.setattr(prober.session, "get", fake_get)
+    assert prober.probe("https://example.com/song").ok
+    assert prober.requests == [("get", {"Range": "bytes=0-0"})]
+
+
+def test_probe_errors_are_not_cached(prober, monkeypatch):
+    def fake_head(url, **kwargs):
+        raise requests.exceptions.ConnectionError("internet down")
+
+    monkeypatch.setattr(prober.session, "head", fake_head)
+    url = "https://www.youtube.com/watch?v=abc"
+    assert not prober.probe(url).ok
+    assert prober.get(url) is None
+
+
+def test_probe_video_url_follows_short_links(prober, monkeypatch):
+    monkeypatch.setattr(
+        prober.session,
+        "head",
+        lambda url, **kwargs: FakeResponse(
+            "https://www.youtube.com/watch?v=abc&feature=youtu.be", 200
+        ),
+    )
+    assert (
+        cli.probe_video_url("https://youtu.be/abc?si=xyz", prober)
+        == "https://www.youtube.com/watch?v=abc"
+    )
@@ -0,0 +1,133 @@
+import threading
+
+import pytest
+from songbirdcli import render
+from songbirdcore import web
+
+
+class FakeLink:
+    def __init__(self, href: str):
+        self.attrs = {"href": href, "title": href}
+
+
+class FakeHtml:
+    def __init__(self, query: str):
+        self.query = query
+
+    def render(self, **kwargs):
+        pass
+
+    def find(self, selector):
+        if self.query == "nothing":
+            return []
+        return [FakeLink(f"/watch?v={self.query}"), FakeLink("/watch?v=other")]
+
+
+class FakeResponse:
+    def __init__(self, query: str):
+        self.html = FakeHtml(query)
+        self.status_code = 200
+        self.headers = {}
+
+    def close(self):
+        pass
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+
+    def is_connected(self):
+        return self.connected
+
+
+class FakeHTMLSession:
+    def __init__(self, session):
+        self.session = session
+        self._browser = FakeBrowser()
+
+    def get(self, url, params, headers):
+        assert threading.current_thread().name.startswith("youtube-render")
+        self.session.pages.append(params["search_query"])
+        return FakeResponse(params["search_query"])
+
+
+class FakeSimpleSession:
+    sessions = []
+
+    def __init__(self, name, root_url, headers=None):
+        self.headers = headers
+        self.pages = []
+        self.form_loads = 0
+        self.closed = False
+        self.s = FakeHTMLSession(self)
+        FakeSimpleSession.sessions.append(self)
+
+    def get_form_inputs(self, form_url, payload={}, log_calls=True):
+        self.form_loads += 1
+        return {"search_query": ""}
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    FakeSimpleSession.sessions = []
+    monkeypatch.setattr(web, "SimpleSession", FakeSimpleSession)
+    return FakeSimpleSession.sessions
+
+
+def make_pool(**kwargs):
+    return render.RenderSessionPool(
+        "https://www.youtube.com",
+        "https://www.youtube.com/results",
+        render_timeout=1,
+        render_wait=0,
+        render_retries=2,
+        render_sleep=0,
+        **kwargs,
+    )
+
+
+def test_search_reuses_session(sessions):
+    pool = make_pool(max_pages=3)
+    for query in ["a", "b", "c", "d"]:
+        link_list, links = pool.search({"search_query": query})
+        assert links[0] == f"/watch?v={query}"
+        assert (
+            link_list[0]
+            == f"/watch?v={query} - https://www.youtube.com/watch?v={query}"
+        )
+    pool.close()
+    # recycled after max_pages renders
+    assert [session.pages for session in sessions] == [["a", "b", "c"], ["d"]]
+    assert [session.form_loads for session in sessions] == [1, 1]
+    assert all(session.closed for session in sessions)
+
+
+def test_search_replaces_dead_browser(sessions):
+    pool = make_pool()
+    pool.search({"search_query": "a"})
+    sessions[0].s._browser.connected = False
+    pool.search({"search_query": "b"})
+    pool.close()
+    assert len(sessions) == 2
+    assert sessions[0].closed
+
+
+def test_search_no_results(sessions):
+    pool = make_pool()
+    assert pool.search({"search_query": "nothing"}) == (None, None)
+    assert sessions[0].pages == ["nothing", "nothing"]
+    pool.close()
+    # searches after closing fail rather than hang
+    assert pool.search({"search_query": "a"}) == (None, None)
+
+
+def test_parse_spoken_duration():
+    label = (
+        "Jolene by Dolly Parton 1,234 views 2 years ago 1 hour, 2 minutes, 3 seconds"
+    )
+    assert render.parse_spoken_duration(label) == 3723
+    assert render.parse_spoken_duration("Jolene by Dolly Parton") is None
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+import requests
+from songbirdcli import search
+from songbirdcli import throttle
+
+INITIAL_DATA = {
+    "contents": {
+        "sectionListRenderer": {
+            "contents": [
+                {
+                    "itemSectionRenderer": {
+                        "contents": [
+                            {"adSlotRenderer": {"id": "ad"}},
+                            {
+                                "videoRenderer": {
+                                    "videoId": "abc",
+                                    "title": {"runs": [{"text": "Jolene"}]},
+                                    "lengthText": {"simpleText": "2:42"},
+                                    "ownerText": {"runs": [{"text": "Dolly Parton"}]},
+                                }
+                            },
+                            {
+                                "videoRenderer": {
+                                    "videoId": "def",
+                                    "title": {"simpleText": "Jolene (Live)"},
+                                }
+                            },
+                        ]
+                    }
+                }
+            ]
+        }
+    }
+}
+RESULTS_PAGE = (
+    "<html><script>var ytInitialData = "
+    + json.dumps(INITIAL_DATA)
+    + ";</script><script>var other = {};</script></html>"
+)
+
+
+class FakeResponse:
+    def __init__(self, text: str, status_code: int = 200):
+        self.text = text
+        self.status_code = status_code
+        self.headers = {}
+
+    def raise_for_status(self):
+        if self.status_code != 200:
+            raise requests.exceptions.HTTPError(f"{self.status_code} error")
+
+
+@pytest.fixture
+def engine():
+    engine = search.HttpSearchEngine(
+        "https://www.youtube.com",
+        "https://www.youtube.com/results",
+        request_throttle=throttle.Throttle(max_retries=0),
+    )
+    yield engine
+    engine.close()
+
+
+def test_parse_initial_data():
+    assert search.parse_initial_data(RESULTS_PAGE) == [
+        search.Video(
+            href="/watch?v=abc", title="Jolene", duration=162, channel="Dolly Parton"
+        ),
+        search.Video(href="/watch?v=def", title="Jolene (Live)"),
+    ]
+    assert search.parse_initial_data("<html></html>") == []
+
+
+def test_http_search(engine, monkeypatch):
+    requested = []
+
+    def fake_get(url, params=None, timeout=None):
+        requested.append(params)
+        return FakeResponse(RESULTS_PAGE)
+
+    monkeypatch.setattr(engine.session, "get", fake_get)
+    link_list, links = engine.search({"search_query": "jolene"})
+    assert requested == [{"search_query": "jolene"}]
+    assert links == ["/watch?v=abc", "/watch?v=def"]
+    assert link_list[0] == "Jolene - https://www.youtube.com/watch?v=abc"
+
+
+def test_http_search_failed(engine, monkeypatch):
+    monkeypatch.setattr(
+        engine.session, "get", lambda *args, **kwargs: FakeResponse("", 429)
+    )
+    assert engine.search({"search_query": "jolene"}) == (None, None)
+    monkeypatch.setattr(
+        engine.session, "get", lambda *args, **kwargs: FakeResponse("<html></html>")
+    )
+    assert engine.search({"search_query": "jolene"}) == (None, None)
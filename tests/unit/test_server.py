@@ -0,0 +1,59 @@
+import os
+import threading
+
+import pytest
+import requests
+from songbirdcli import batch
+from songbirdcli import cli
+from songbirdcli import journal
+from songbirdcli import server
+from test_batch import config  # noqa: F401
+
+
+@pytest.fixture
+def url(config):
+    cli.initialize_dirs([config.get_data_path(), config.get_local_folder_path()])
+    songbird = server.SongbirdServer.from_config(config)
+    httpd = server.HTTPServer(("127.0.0.1", 0), songbird)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    host, port = httpd.server_address[:2]
+    yield f"http://{host}:{port}"
+    httpd.shutdown()
+    httpd.server_close()
+    songbird.close()
+
+
+def test_health(url, config):
+    response = requests.get(f"{url}/health")
+    assert response.json() == {"status": "ok", "version": config.version}
+
+
+def test_submit(url, config):
+    entry = batch.ManifestEntry(mode="album", itunes_id=123)
+    events = list(server.submit(url, entry))
+    assert events[-1].event == "done"
+    assert events[-1].status == "success"
+    results = [(e.song_name, e.status) for e in events if e.event == "result"]
+    assert sorted(results) == [
+        ("Early Morning Breeze", "success"),
+        ("Jolene", "success"),
+    ]
+    stages = [e.stage for e in events if e.song_name == "Jolene" and e.stage]
+    assert stages == [
+        journal.Stage.SEARCHED,
+        journal.Stage.DOWNLOADED,
+        journal.Stage.TAGGED,
+        journal.Stage.MOVED,
+        journal.Stage.DONE,
+    ]
+    assert os.path.exists(os.path.join(config.get_local_folder_path(), "Jolene.mp3"))
+
+    # the songs are saved now, so a second job skips them
+    events = list(server.submit(url, entry))
+    assert [e.status for e in events if e.event == "result"] == ["skipped"] * 2
+
+
+def test_submit_invalid(url):
+    response = requests.post(f"{url}/jobs", data='{"destination": "dropbox"}')
+    assert response.status_code == 400
@@ -0,0 +1,165 @@
+import base64
+import os
+import struct
+
+import pytest
+from mutagen import flac, oggopus
+from mutagen.easyid3 import EasyID3
+from mutagen.ogg import OggPage
+from songbirdcli import artwork
+from songbirdcli import itunes_search
+from songbirdcli import settings
+from songbirdcli import tagging
+from songbirdcli import version
+from songbirdcore.models import modes
+from test_batch import make_song
+from test_library import write_mp3
+
+PNG = b"\x89PNG cover"
+
+
+def write_flac(path: str, audio: bytes):
+    # a streaminfo block of 44.1khz 16 bit stereo, as the last metadata block
+    info = struct.pack(">HH", 4096, 4096) + b"\0" * 6
+    info += ((44100 << 44) | (1 << 41) | (15 << 36)).to_bytes(8, "big") + b"\0" * 16
+    with open(path, "wb") as f:
+        f.write(b"fLaC\x80" + len(info).to_bytes(3, "big") + info + audio)
+
+
+def write_opus(path: str, audio: bytes):
+    head = b"OpusHead\x01\x02" + struct.pack("<HIhB", 312, 48000, 0, 0)
+    comments = b"OpusTags" + struct.pack("<I", 4) + b"test" + struct.pack("<I", 0)
+    with open(path, "wb") as f:
+        for sequence, (packet, position) in enumerate(
+            [(head, 0), (comments, 0), (audio, 960)]
+        ):
+            page = OggPage()
+            page.serial = 1
+            page.sequence = sequence
+            page.packets = [packet]
+            page.position = position
+            page.first = sequence == 0
+            page.last = sequence == 2
+            f.write(page.write())
+
+
+def read_audio(path: str) -> bytes:
+    """read the audio of an mp3 or flac, skipping its tags"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:3] == b"ID3":
+        # id3v2 sizes are syncsafe, 7 bits per byte, excluding the header
+        size = 0
+        for byte in data[6:10]:
+            size = (size << 7) | (byte & 0x7F)
+        return data[10 + size :]
+    if data[:4] != b"fLaC":
+        return data
+    # flac metadata blocks, including the vorbis comments, come before the audio
+    offset = 4
+    while True:
+        block = data[offset : offset + 4]
+        offset += 4 + int.from_bytes(block[1:4], "big")
+        if block[0] & 0x80:
+            return data[offset:]
+
+
+@pytest.mark.parametrize("file_format", ["mp3", "flac"])
+def test_write_tags_in_place(tmp_path, file_format):
+    path = os.path.join(tmp_path, f"jolene.{file_format}")
+    if file_format == "mp3":
+        write_mp3(path, b"audio" * 100)
+    else:
+        write_flac(path, b"\xff\xf8audio" * 100)
+    audio = read_audio(path)
+    assert tagging.write_tags(path, file_format, make_song("Jolene"), PNG)
+    size = os.path.getsize(path)
+    tags = tagging.read_tags(path)
+    assert (tags.title, tags.artist, tags.album) == ("Jolene", "Dolly Parton", "Jolene")
+    assert (tags.track_number, tags.disc_number) == (1, 1)
+
+    # fixed metadata fits within the padding left by the first write
+    assert tagging.write_tags(path, file_format, make_song("Jolene (Remastered)"))
+    assert os.path.getsize(path) == size
+    assert tagging.read_tags(path).title == "Jolene (Remastered)"
+    assert read_audio(path) == audio
+
+
+def test_write_tags_opus(tmp_path):
+    path = os.path.join(tmp_path, "jolene.opus")
+    write_opus(path, b"\xfc" + b"\0" * 40)
+    assert tagging.write_tags(path, "opus", make_song("Jolene"), PNG)
+    audiofile = oggopus.OggOpus(path)
+    assert audiofile["title"] == ["Jolene"]
+    picture = flac.Picture(base64.b64decode(audiofile["metadata_block_picture"][0]))
+    assert (picture.type, picture.mime, picture.data) == (3, "image/png", PNG)
+
+
+def test_match_track():
+    tracks = [make_song("Jolene", 1), make_song("Early Morning Breeze", 2)]
+    tags = tagging.SongTags(title="early morning breeze!", track_number=1)
+    # the title is preferred over the track number
+    assert tagging.match_track(tags, tracks).trackNumber == 2
+    tags = tagging.SongTags(title="Jolene - 2003 Remaster", track_number=1)
+    assert tagging.match_track(tags, tracks).trackName == "Jolene"
+    assert tagging.match_track(tagging.SongTags(title="9 to 5"), tracks) is None
+
+
+class FakeItunesClient:
+    def __init__(self):
+        self.queries = []
+
+    def query_many(self, queries):
+        self.queries.extend(queries)
+        results = []
+        for query in queries:
+            if query.mode == modes.Modes.ALBUM:
+                results.append([make_song("Jolene")])
+            elif query.lookup:
+                results.append(
+                    [make_song("Jolene", 1), make_song("Early Morning Breeze", 2)]
+                )
+            else:
+                results.append([])
+        return results
+
+    def close(self):
+        pass
+
+
+def test_retag(tmp_path, monkeypatch):
+    folder = os.path.join(tmp_path, "Dolly Parton", "Jolene")
+    for idx, title in enumerate(["Jolene", "Early Morning Breeze"]):
+        path = os.path.join(folder, f"0{idx + 1} {title}.mp3")
+        write_mp3(path, title.encode(), title=title, artist="Dolly Parton")
+        tags = EasyID3(path)
+        tags.update({"album": "Jolene", "tracknumber": str(idx + 1)})
+        tags.save()
+    write_flac(os.path.join(folder, "03 Highlight of My Life.flac"), b"audio")
+    os.makedirs(os.path.join(folder, ".songbird-staging"))
+    write_mp3(os.path.join(folder, ".songbird-staging", "partial.mp3"), b"audio")
+
+    itunes_client = FakeItunesClient()
+    monkeypatch.setattr(
+        itunes_search.ItunesClient, "from_config", lambda config: itunes_client
+    )
+    monkeypatch.setattr(
+        artwork.ArtworkCache, "get_for_song", lambda self, song, size=None: PNG
+    )
+    config = settings.SongbirdCliConfig(
+        version=version.version,
+        root_path=str(tmp_path),
+        run_local=True,
+        tagging_workers=2,
+    )
+    results = tagging.retag(str(tmp_path), config=config)
+    assert [(os.path.basename(r.file_path), r.status) for r in results] == [
+        ("01 Jolene.mp3", "tagged"),
+        ("02 Early Morning Breeze.mp3", "tagged"),
+        ("03 Highlight of My Life.flac", "unmatched"),
+    ]
+    # the album was searched for once, and the song without an album by its title
+    assert [q.mode for q in itunes_client.queries].count(modes.Modes.ALBUM) == 1
+    assert itunes_client.queries[-1].search_variable == "Highlight of My Life"
+    tags = tagging.read_tags(os.path.join(folder, "02 Early Morning Breeze.mp3"))
+    assert (tags.artist, tags.track_number) == ("Dolly Parton", 2)
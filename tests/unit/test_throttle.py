@@ -0,0 +1,81 @@
+import pytest
+from songbirdcli import throttle
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, headers: dict = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """a fake clock, advanced by sleeping"""
+    now = [1000.0]
+    sleeps = []
+
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr(throttle.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(throttle.time, "sleep", fake_sleep)
+    return sleeps
+
+
+def test_limiter_paces_requests_after_a_burst(clock):
+    limiter = throttle.HostLimiter("example.com", rate=2, max_rate=2, burst=2)
+    for _ in range(4):
+        limiter.wait()
+    assert clock == [0.5, 0.5]
+    assert limiter.stats.requests == 4
+
+
+def test_throttled_requests_back_off_and_honour_retry_after(clock):
+    request_throttle = throttle.Throttle(max_retries=2)
+    responses = [
+        FakeResponse(429, {"Retry-After": "7"}),
+        FakeResponse(503),
+        FakeResponse(200),
+    ]
+    response = request_throttle.request(
+        "https://example.com/search", lambda: responses.pop(0)
+    )
+    assert response.status_code == 200
+    # the first retry waits for the Retry-After, the second backs off at random
+    assert clock[0] == pytest.approx(7, abs=0.5) and 0 <= clock[1] <= 2
+    stats = request_throttle.get_stats()[0]
+    assert (stats.host, stats.requests, stats.throttled, stats.retries) == (
+        "example.com",
+        3,
+        2,
+        2,
+    )
+    # the rate halves for each throttled response, then climbs a step
+    assert stats.rate == pytest.approx(throttle.DEFAULT_RATE[0] / 4 + 1)
+
+
+def test_call_retries_failures(clock):
+    request_throttle = throttle.Throttle()
+    results = [None, None, "song.mp3"]
+    assert (
+        request_throttle.call(
+            "https://www.youtube.com/watch?v=abc", lambda: results.pop(0)
+        )
+        == "song.mp3"
+    )
+    assert (
+        request_throttle.call(
+            "https://www.youtube.com/watch?v=abc", lambda: None, retries=0
+        )
+        is None
+    )
+    stats = request_throttle.get_stats()[0]
+    assert (stats.retries, stats.failures, stats.throttled) == (2, 1, 0)
+
+
+def test_parse_retry_after():
+    assert throttle.parse_retry_after("120") == 120
+    assert throttle.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert throttle.parse_retry_after("soon") is None
+    assert throttle.parse_retry_after(None) is None
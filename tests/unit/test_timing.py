@@ -0,0 +1,55 @@
+import json
+
+import pytest
+from songbirdcli import timing
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """a fake clock, advanced by hand"""
+    now = [0.0]
+    monkeypatch.setattr(timing.time, "perf_counter", lambda: now[0])
+    return now
+
+
+def test_prompts_are_not_counted_as_machine_time(clock):
+    recorder = timing.Recorder()
+    with recorder.song("song"):
+        with recorder.span("search"):
+            clock[0] += 1
+            with recorder.span(timing.PROMPT_STAGE, user=True):
+                clock[0] += 10
+            with recorder.span("itunes"):
+                clock[0] += 2
+    timings = recorder.songs["song"]
+    assert timings.stages == {"search": 3, "itunes": 2}
+    assert (timings.machine_time, timings.user_time) == (3, 10)
+    assert (recorder.machine_time, recorder.user_time) == (3, 10)
+
+
+def test_summary_percentiles(clock):
+    recorder = timing.Recorder()
+    for seconds in range(1, 21):
+        with recorder.span("download"):
+            clock[0] += seconds
+    summary = recorder.get_summary()[0]
+    assert (summary.stage, summary.count, summary.total) == ("download", 20, 210)
+    assert (summary.p50, summary.p95) == (10, 19)
+    assert timing.get_percentile([], 50) == 0
+
+
+def test_finished_songs_are_reported(clock, tmp_path):
+    report_path = tmp_path / "timings.jsonl"
+    recorder = timing.Recorder(str(report_path))
+    for song_name in ["first", "second"]:
+        with recorder.span("download", song_name):
+            clock[0] += 1
+        recorder.add_bytes(100, song_name)
+    recorder.finish("first")
+    assert len(report_path.read_text().splitlines()) == 1
+    # unfinished songs are reported on close
+    recorder.close()
+    lines = [json.loads(line) for line in report_path.read_text().splitlines()]
+    assert [line["song_name"] for line in lines] == ["first", "second"]
+    assert lines[1]["bytes_downloaded"] == 100 and lines[1]["stages"] == {"download": 1}
+    assert recorder.bytes_downloaded == 200
@@ -0,0 +1,87 @@
+import os
+import shutil
+
+import pytest
+from songbirdcli import cli
+from songbirdcli import pipeline
+from songbirdcli import settings
+from songbirdcli import transcode
+from songbirdcore import itunes
+from test_batch import config, make_song  # noqa: F401
+
+
+@pytest.mark.parametrize(
+    "src_path,profile,expected",
+    [
+        ("song.m4a", settings.FormatProfile(file_format="m4a"), ["-c:a", "copy"]),
+        (
+            "song.webm",
+            settings.FormatProfile(file_format="mp3", bitrate="320k"),
+            ["-c:a", "libmp3lame", "-b:a", "320k"],
+        ),
+        (
+            "song.m4a",
+            settings.FormatProfile(file_format="flac", bitrate="320k"),
+            ["-c:a", "flac"],
+        ),
+    ],
+)
+def test_get_command(src_path, profile, expected):
+    command = transcode.get_command(src_path, "out", profile)
+    assert command[command.index("-vn") + 1 : -1] == expected
+
+
+def test_process_song_several_destinations(config, monkeypatch):
+    downloads = []
+
+    def fake_download_source(url, file_path_no_format):
+        downloads.append(url)
+        file_path = f"{file_path_no_format}.webm"
+        with open(file_path, "wb") as f:
+            f.write(b"audio")
+        # a thumbnail left beside the download, as yt-dlp writes
+        with open(f"{file_path_no_format}.jpg", "wb") as f:
+            f.write(b"image")
+        return file_path
+
+    encoded = []
+
+    def fake_transcode(src_path, dest_path, profile):
+        encoded.append(profile.file_format)
+        shutil.copy(src_path, dest_path)
+        return True
+
+    monkeypatch.setattr(transcode, "download_source", fake_download_source)
+    monkeypatch.setattr(transcode, "transcode", fake_transcode)
+    monkeypatch.setattr(itunes, "m4a_tagger", lambda *args: True)
+    config.itunes_enabled = True
+    config.format_profiles = {
+        "i": settings.FormatProfile(file_format="m4a"),
+        "l": settings.FormatProfile(file_format="mp3", bitrate="320k"),
+    }
+    destination = "il"
+    job = pipeline.SongJob(
+        song_name="Jolene",
+        song_properties=make_song("Jolene"),
+        file_path_no_format=os.path.join(config.get_local_folder_path(), "Jolene"),
+        file_format=cli.get_file_format(config, destination),
+        video_url="https://www.youtube.com/watch?v=abc",
+        destination=destination,
+    )
+    transcode.set_transcoder(transcode.Transcoder(workers=2))
+    try:
+        assert cli.process_song(config, job) is True
+    finally:
+        transcode.get_transcoder().close()
+
+    # one download served both destinations
+    assert len(downloads) == 1
+    assert sorted(encoded) == ["m4a", "mp3"]
+    itunes_folder = config.get_itunes_folder_path()
+    local_folder = config.get_local_folder_path()
+    assert os.path.exists(os.path.join(itunes_folder, "Jolene.m4a"))
+    assert os.path.exists(os.path.join(local_folder, "Jolene.mp3"))
+    # itunes songs are staged beside its automatically add folder, not within it
+    assert os.listdir(itunes_folder) == ["Jolene.m4a"]
+    for folder in [os.path.dirname(itunes_folder), local_folder]:
+        assert os.listdir(os.path.join(folder, cli.STAGING_FOLDER)) == []
@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+
+import pytest
+from songbirdcli import cli
+from songbirdcli import journal
+from songbirdcli import pipeline
+from songbirdcli import settings
+from songbirdcli import uploads
+from songbirdcli import version
+from songbirdcore import youtube
+
+
+class FakeStatus:
+    def progress(self):
+        return 0.5
+
+
+class FakeRequest:
+    def __init__(self, service, body):
+        self.service = service
+        self.body = body
+        self.chunks = 0
+
+    def next_chunk(self, num_retries=0):
+        self.chunks += 1
+        if self.chunks < 2:
+            return FakeStatus(), None
+        time.sleep(0.05)
+        if self.body["name"] == "broken.mp3":
+            raise ConnectionError("connection dropped")
+        return None, {"id": "id-" + self.body["name"]}
+
+
+class FakeService:
+    def __init__(self):
+        self.thread = threading.get_ident()
+
+    def files(self):
+        return self
+
+    def create(self, body, media_body, fields):
+        assert media_body.resumable()
+        # each worker uses its own service
+        assert threading.get_ident() == self.thread
+        return FakeRequest(self, body)
+
+
+@pytest.fixture
+def uploader(tmp_path, monkeypatch):
+    uploader = uploads.DriveUploader(
+        "folder",
+        credentials_path=os.path.join(tmp_path, "credentials.json"),
+        token_path=os.path.join(tmp_path, "token.json"),
+        auth_port=8080,
+        workers=3,
+    )
+    monkeypatch.setattr(uploader, "get_credentials", lambda: None)
+    services = []
+
+    def fake_build(*args, **kwargs):
+        services.append(FakeService())
+        return services[-1]
+
+    monkeypatch.setattr(uploads.discovery, "build", fake_build)
+    uploader.services = services
+    yield uploader
+    uploader.close()
+
+
+def test_upload_concurrently(uploader, tmp_path):
+    completed = []
+    start = time.time()
+    for i in range(6):
+        song_path = os.path.join(tmp_path, f"song{i}.mp3")
+        with open(song_path, "wb") as f:
+            f.write(b"\0")
+        uploader.submit(str(i), f"song{i}.mp3", song_path, on_complete=completed.append)
+    results = uploader.wait()
+    assert time.time() - start < 6 * 0.05
+    assert results == {str(i): f"id-song{i}.mp3" for i in range(6)}
+    assert sorted(completed) == sorted(results.values())
+    assert len(uploader.services) <= 3
+
+
+def test_upload_failure(uploader, tmp_path):
+    song_path = os.path.join(tmp_path, "broken.mp3")
+    with open(song_path, "wb") as f:
+        f.write(b"\0")
+    completed = []
+    future = uploader.submit("0", "broken.mp3", song_path, completed.append)
+    assert future.result() is None
+    assert uploader.wait() == {"0": None}
+    assert completed == []
+    # waited uploads are forgotten
+    assert uploader.wait() == {}
+
+
+def test_process_song_queues_upload(uploader, tmp_path, monkeypatch):
+    config = settings.SongbirdCliConfig(
+        version=version.version,
+        root_path=str(tmp_path),
+        itunes_enabled=False,
+        run_local=True,
+    )
+    os.makedirs(config.get_gdrive_folder_path())
+    job = pipeline.SongJob(
+        song_name="jolene",
+        file_path_no_format=os.path.join(tmp_path, "jolene"),
+        file_format="mp3",
+        video_url="https://www.youtube.com/watch?v=abc",
+        destination="g",
+    )
+
+    def fake_run_download(url, file_path_no_format, file_format, **kwargs):
+        file_path = f"{file_path_no_format}.{file_format}"
+        with open(file_path, "wb") as f:
+            f.write(b"\0")
+        return file_path
+
+    monkeypatch.setattr(youtube, "run_download", fake_run_download)
+    song_journal = journal.Journal(os.path.join(tmp_path, "journal.jsonl"))
+    assert cli.process_song(config, job, song_journal, uploader) is True
+    assert uploader.wait() == {job.job_id: "id-jolene.mp3"}
+    record = song_journal.get(job.job_id)
+    assert record.stage == journal.Stage.DONE
+    assert record.path == os.path.join(config.get_gdrive_folder_path(), "jolene.mp3")
@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+
+import pytest
+from songbirdcli import library
+from songbirdcli import watcher
+from test_library import index, roots, touch  # noqa: F401
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="requires inotify")
+def test_inotify_watcher(index, roots, monkeypatch):
+    dump, itunes_lib = roots
+    library_watcher = watcher.InotifyWatcher(index)
+    library_watcher.start()
+    scanned = []
+    scan_dir = index._scan_dir
+
+    def spy(path, *args):
+        scanned.append(path)
+        return scan_dir(path, *args)
+
+    monkeypatch.setattr(index, "_scan_dir", spy)
+    try:
+        # nothing changed, so nothing is checked
+        index.refresh()
+        assert scanned == []
+
+        touch(os.path.join(dump, "piano man.mp3"))
+        album = os.path.join(itunes_lib, "Dolly Parton", "Coat of Many Colors")
+        touch(os.path.join(album, "01 Coat of Many Colors.m4a"))
+
+        def refreshed(term):
+            index.refresh()
+            return index.search(dump, term) + index.search(itunes_lib, term) != []
+
+        assert wait_for(lambda: refreshed("piano man"))
+        assert wait_for(lambda: refreshed("coat of many colors"))
+        # only the folders that changed were scanned
+        assert set(scanned) == {dump, os.path.dirname(album), album}
+
+        # folders added since the watcher started are watched too
+        os.remove(os.path.join(album, "01 Coat of Many Colors.m4a"))
+        assert wait_for(lambda: not refreshed("coat of many colors"))
+    finally:
+        library_watcher.close()
+    assert not index.live
+
+
+def test_polling_watcher(index, roots):
+    dump, _ = roots
+    library_watcher = watcher.PollingWatcher(index, interval=0.01)
+    library_watcher.start()
+    try:
+        touch(os.path.join(dump, "piano man.mp3"))
+        # found by the watcher, without a refresh
+        assert wait_for(lambda: index.search(dump, "piano man") != [])
+    finally:
+        library_watcher.close()
+
+
+def test_library_watcher_is_abstract(index):
+    with pytest.raises(TypeError):
+        watcher.LibraryWatcher(index)